@@ -1,33 +1,19 @@
-from statsmodels.tsa.holtwinters import SimpleExpSmoothing
 import pandas as pd
 from dataset import DatabaseManager
+from dataset import load_inventory as load_inventory_status
+from alerts import compute_inventory_alerts, render_inventory_alerts
+from forecast import forecast_all_items, get_forecast, get_stored_forecast_version
 import streamlit as st
 from rights import check_permission
 import plotly.express as px
 def predict_inventory(alpha=0.2):
-    """使用指数平滑法预测库存需求"""
+    """使用指数平滑法预测库存需求（结果按参数和历史数据版本缓存）"""
     try:
-        # 加载库存数据
         conn = DatabaseManager.get_connection()
-        cursor = conn.cursor()
-        # 获取历史库存数据
-        cursor.execute(
-        "SELECT date, sales FROM inventory_history ORDER BY date"
-        )
-        rows = cursor.fetchall()
-        # 转换为DataFrame
-        data = pd.DataFrame(rows, columns=["date", "sales"])
-        data["date"] = pd.to_datetime(data["date"])
-        data.set_index("date", inplace=True)
-        # 检查数据是否足够
-        if len(data) < 2:
+        df_forecast = get_forecast(conn, alpha=alpha, horizon=30)
+        if df_forecast.empty:
             return None
-        # 创建模型并拟合
-        model = SimpleExpSmoothing(data["sales"])
-        model_fit = model.fit(smoothing_level=alpha)
-        # 预测未来30天的需求
-        forecast = model_fit.forecast(steps=30)
-        return forecast.values.tolist()
+        return df_forecast["sales"].tolist()
     except Exception as e:
         st.error(f"库存预测失败：{e}")
         return None
@@ -35,19 +21,14 @@ def load_inventory():
     """加载库存数据"""
     try:
         conn = DatabaseManager.get_connection()
-        cursor = conn.cursor()
-        
-        # 获取当前库存数据
-        cursor.execute("SELECT * FROM inventory")
-        rows = cursor.fetchall()
         
-        # 获取库存历史数据
-        cursor.execute("SELECT * FROM inventory_history ORDER BY date")
-        history_rows = cursor.fetchall()
-        
-        # 转换为DataFrame
-        df = pd.DataFrame(history_rows, columns=["id", "item_id", "date", "sales", "current_stock", "safety_stock"])
-        df["date"] = pd.to_datetime(df["date"])
+        # 获取库存历史数据（按日期汇总所有物品）
+        df = pd.read_sql(
+            '''SELECT date, SUM(sales) AS sales, SUM(current_stock) AS current_stock, SUM(safety_stock) AS safety_stock
+               FROM inventory_history GROUP BY date ORDER BY date''',
+            conn
+        )
+        df["date"] = pd.to_datetime(df["date"], format="mixed")
         
         return df
     except Exception as e:
@@ -63,24 +44,22 @@ def inventory_management_page():
         st.title("库存预测设置")
         alpha = st.slider("平滑系数", 0.0, 1.0, 0.2)
         days_to_predict = st.slider("预测天数", 7, 90, 30)
-        if st.button("重新计算预测"):
-            st.rerun()
+        if st.button("保存预测结果"):
+            with st.spinner("正在批量计算所有物品的预测..."):
+                item_count = forecast_all_items(DatabaseManager.write_transaction, alpha=alpha)
+            st.success(f"已保存 {item_count} 个物品的预测")
+        stored = get_stored_forecast_version(DatabaseManager.get_connection())
+        if stored is not None:
+            st.caption(f"已保存的预测：生成于 {stored[0][:19]}，平滑系数 {stored[1]}（平滑系数相同且历史数据未更新时直接使用）")
     
     # 加载库存数据
     df_inventory = load_inventory()
     
     if df_inventory is not None and not df_inventory.empty:
-        # 预测库存需求
-        forecast = predict_inventory(alpha=alpha)
+        # 优先读取未过期的预先计算结果，否则按 (平滑系数, 历史版本) 计算并缓存；调整预测天数只截取缓存结果
+        df_forecast = get_forecast(DatabaseManager.get_connection(), alpha=alpha, horizon=days_to_predict)
         
-        if forecast is not None:
-            # 创建预测数据DataFrame
-            dates = pd.date_range(start=df_inventory["date"].max(), periods=days_to_predict+1)[1:]
-            df_forecast = pd.DataFrame({
-                "date": dates,
-                "sales": forecast[:days_to_predict]
-            })
-            
+        if not df_forecast.empty:
             # 合并历史和预测数据
             df_combined = pd.concat([df_inventory, df_forecast])
             
@@ -100,22 +79,9 @@ def inventory_management_page():
             # 显示图表
             st.plotly_chart(fig)
         
-        # 库存预警
+        # 库存预警（整表向量化计算，只显示汇总和分页明细）
         st.subheader("库存预警")
-        # 获取当前库存状态
-        conn = DatabaseManager.get_connection()
-        df_current_inventory = pd.read_sql("SELECT * FROM inventory", conn)
-        
-        if not df_current_inventory.empty and "safety_stock" in df_current_inventory.columns:
-            warning_count = 0
-            for _, row in df_current_inventory.iterrows():
-                if row["current_stock"] < row["safety_stock"]:
-                    st.warning(f"警告：{row['item_name']}库存({row['current_stock']})低于安全库存({row['safety_stock']})！")
-                    warning_count += 1
-            
-            if warning_count == 0:
-                st.success("所有商品库存均高于安全库存！")
-        else:
-            st.info("没有库存数据或未设置安全库存。")
+        summary, alert_detail = compute_inventory_alerts(load_inventory_status())
+        render_inventory_alerts(summary, alert_detail, key="forecast_alerts")
     else:
         st.info("没有库存历史数据可显示。")
\ No newline at end of file
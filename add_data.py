@@ -1,8 +1,13 @@
 import streamlit as st
-import pandas as pd
 from datetime import datetime
 from rights import check_permission
-from dataset import DatabaseManager, load_orders, load_items, add_item
+from dataset import (DatabaseManager, load_items, add_item, bump_table_versions,
+                     query_orders_page, get_order_status_counts, order_no_exists,
+                     search_orders, search_items, load_order_items_batch)
+
+# 订单列表每页行数
+ORDER_PAGE_SIZE = 50
+ORDER_PAGE_SIZES = [50, 100, 200, 500]
 
 def item_management_page():
     # 权限检查
@@ -30,11 +35,14 @@ def item_management_page():
             current_user = st.session_state.get("username", "unknown")
             add_item(item_name, description, unit, unit_price, current_user)
     
-    # 物品列表展示
-    df_items = load_items()
+    # 物品列表展示（输入关键词时使用全文搜索）
+    st.subheader("物品列表")
+    item_query = st.text_input("搜索物品名称或描述").strip()
+    df_items = search_items(item_query) if item_query else load_items()
     if not df_items.empty:
-        st.subheader("物品列表")
         st.dataframe(df_items)
+    elif item_query:
+        st.info("没有匹配的物品")
 
 def order_management_page():
     # 权限检查
@@ -81,58 +89,102 @@ def order_management_page():
         elif df_items.empty:
             st.error("请先添加物品数据")
         else:
-            # 加载订单数据检查重复
-            df_orders = load_orders()
-            if not df_orders.empty and order_no in df_orders['order_no'].tolist():
+            # 检查订单号是否重复
+            if order_no_exists(order_no):
                 st.error("订单编号已存在")
             else:
-                # 插入新订单
+                # 插入新订单（写操作在唯一写连接上排队执行，退出时自动提交或回滚）
                 try:
-                    conn = DatabaseManager.get_connection()
-                    cursor = conn.cursor()
-                    
                     # 获取选中物品的ID和单价
                     item_id = items_dict[selected_item]['item_id']
                     unit_price = items_dict[selected_item]['unit_price']
                     total_amount = quantity * unit_price
                     
-                    # 开始事务
-                    cursor.execute("BEGIN TRANSACTION")
-                    
-                    # 插入订单
-                    created_at = datetime.now().isoformat()
-                    cursor.execute(
-                        '''INSERT INTO orders (order_no, customer_name, order_date, delivery_date, 
-                        total_amount, created_by, created_at, status) 
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
-                        (order_no, customer_name, order_date.isoformat(), delivery_date.isoformat(), 
-                         total_amount, st.session_state.get("username"), created_at, 'pending')
-                    )
-                    order_id = cursor.lastrowid
-                    
-                    # 插入订单物品
-                    cursor.execute(
-                        '''INSERT INTO order_items (order_id, item_id, quantity, unit_price, subtotal) 
-                        VALUES (?, ?, ?, ?, ?)''',
-                        (order_id, item_id, quantity, unit_price, total_amount)
-                    )
-                    
-                    # 提交事务
-                    cursor.execute("COMMIT")
+                    with DatabaseManager.write_transaction() as conn:
+                        # 插入订单
+                        created_at = datetime.now().isoformat()
+                        cursor = conn.execute(
+                            '''INSERT INTO orders (order_no, customer_name, order_date, delivery_date, 
+                            total_amount, created_by, created_at, status) 
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                            (order_no, customer_name, order_date.isoformat(), delivery_date.isoformat(), 
+                             total_amount, st.session_state.get("username"), created_at, 'pending')
+                        )
+                        order_id = cursor.lastrowid
+                        
+                        # 插入订单物品
+                        conn.execute(
+                            '''INSERT INTO order_items (order_id, item_id, quantity, unit_price, subtotal) 
+                            VALUES (?, ?, ?, ?, ?)''',
+                            (order_id, item_id, quantity, unit_price, total_amount)
+                        )
+                        
+                        bump_table_versions(conn, "orders", "order_items")
                     st.success("订单添加成功")
                 except Exception as e:
-                    # 回滚事务
-                    cursor.execute("ROLLBACK")
                     st.error(f"订单添加失败：{e}")
     
-    # 订单列表展示
+    # 订单列表展示（筛选条件下推到SQL，键集分页）
     st.subheader("订单列表")
-    df_orders = load_orders()
-    if not df_orders.empty:
-        # 筛选控件
-        status_filter = st.selectbox("按状态筛选", ["全部"] + df_orders["status"].unique().tolist())
-        if status_filter != "全部":
-            df_orders = df_orders[df_orders["status"] == status_filter]
-        
+    
+    # 按客户名称全文搜索，显示相关度最高的订单
+    order_query = st.text_input("搜索客户名称（全文）").strip()
+    if order_query:
+        df_found = search_orders(order_query, limit=ORDER_PAGE_SIZE)
+        if df_found.empty:
+            st.info("没有匹配的订单")
+        else:
+            st.dataframe(df_found)
+        return
+    
+    col1, col2, col3, col4 = st.columns([3, 3, 3, 1])
+    customer_filter = col1.text_input("客户名称（前缀）").strip()
+    date_range = col2.date_input("订单日期范围", value=())
+    date_from, date_to = (date_range[0], date_range[-1]) if date_range else (None, None)
+    
+    # 状态筛选项及数量来自 GROUP BY 统计
+    status_counts = get_order_status_counts(customer_filter, date_from, date_to)
+    status_options = ["全部"] + list(status_counts.keys())
+    status_filter = col3.selectbox(
+        "按状态筛选", status_options,
+        format_func=lambda s: f"全部（{sum(status_counts.values())}）" if s == "全部" else f"{s}（{status_counts[s]}）"
+    )
+    
+    page_size = col4.selectbox("每页", ORDER_PAGE_SIZES)
+    
+    # 筛选条件变化时回到第一页；游标栈保存每一页的起始位置，用于返回上一页
+    filters = (status_filter, customer_filter, date_from, date_to, page_size)
+    if st.session_state.get("order_list_filters") != filters:
+        st.session_state.order_list_filters = filters
+        st.session_state.order_list_cursors = [None]
+    cursors = st.session_state.order_list_cursors
+    
+    df_orders, next_cursor = query_orders_page(
+        None if status_filter == "全部" else status_filter,
+        customer_filter, date_from, date_to, after=cursors[-1], limit=page_size
+    )
+    if df_orders.empty:
+        st.info("没有符合条件的订单")
+    else:
         # 显示订单数据
         st.dataframe(df_orders)
+        # 本页所有订单的明细一次查询取回
+        if st.checkbox("显示本页订单明细"):
+            df_lines = load_order_items_batch(df_orders["order_id"].tolist())
+            if df_lines.empty:
+                st.info("本页订单没有明细")
+            else:
+                df_lines = df_lines.join(df_orders.set_index("order_id")[["order_no", "customer_name"]])
+                st.dataframe(
+                    df_lines.reset_index()[["order_no", "customer_name", "item_name", "quantity", "unit", "unit_price", "subtotal"]],
+                    hide_index=True
+                )
+    
+    nav1, nav2, nav3 = st.columns([1, 1, 4])
+    if nav1.button("上一页", disabled=len(cursors) <= 1):
+        cursors.pop()
+        st.rerun()
+    if nav2.button("下一页", disabled=next_cursor is None):
+        cursors.append(next_cursor)
+        st.rerun()
+    nav3.write(f"第 {len(cursors)} 页")
@@ -0,0 +1,84 @@
+import math
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+# 库存预警分级
+ALERT_CRITICAL = "紧急补货"
+ALERT_LOW = "低库存警告"
+ALERT_OVERSTOCK = "库存积压"
+
+# 预警级别的排序（数值越小越严重）及显示图标
+ALERT_LEVELS = {
+    ALERT_CRITICAL: (0, "🔴"),
+    ALERT_LOW: (1, "🟡"),
+    ALERT_OVERSTOCK: (2, "🔵"),
+}
+
+# 库存低于 最低库存 × 该比例（或为0）时视为紧急补货
+CRITICAL_RATIO = 0.5
+
+
+def compute_inventory_alerts(df, threshold_col="min_stock", critical_ratio=CRITICAL_RATIO):
+    """
+    对整张库存表做向量化分级预警计算
+    
+    Args:
+        df: 库存数据，需包含 current_stock 和阈值列，可选 max_stock/item_name
+        threshold_col: 低库存阈值列（默认最低库存）
+        critical_ratio: 紧急补货比例
+        
+    Returns:
+        tuple: (summary, detail)。summary 为各级别数量的字典，
+            detail 为按严重程度和缺口排序的预警明细
+    """
+    summary = {level: 0 for level in ALERT_LEVELS}
+    if df is None or df.empty or "current_stock" not in df.columns or threshold_col not in df.columns:
+        return summary, pd.DataFrame(columns=["alert_type", "item_name", "current_stock", threshold_col, "max_stock", "gap"])
+
+    current = pd.to_numeric(df["current_stock"], errors="coerce").to_numpy(dtype="float64")
+    threshold = pd.to_numeric(df[threshold_col], errors="coerce").to_numpy(dtype="float64")
+    if "max_stock" in df.columns:
+        max_stock = pd.to_numeric(df["max_stock"], errors="coerce").to_numpy(dtype="float64")
+    else:
+        max_stock = np.full(len(df), np.inf)
+
+    low = current < threshold
+    critical = low & ((current <= 0) | (current <= threshold * critical_ratio))
+    overstock = ~low & (current > max_stock)
+    level = np.select([critical, low, overstock], [ALERT_CRITICAL, ALERT_LOW, ALERT_OVERSTOCK], default="")
+
+    counts = pd.Series(level).value_counts()
+    for name in ALERT_LEVELS:
+        summary[name] = int(counts.get(name, 0))
+
+    mask = level != ""
+    detail = df.loc[mask].copy()
+    detail.insert(0, "alert_type", level[mask])
+    # 缺口：低库存为距阈值差额，积压为超出最高库存的数量
+    detail["gap"] = np.where(overstock[mask], current[mask] - max_stock[mask], threshold[mask] - current[mask])
+    detail["_severity"] = detail["alert_type"].map({k: v[0] for k, v in ALERT_LEVELS.items()})
+    detail = detail.sort_values(["_severity", "gap"], ascending=[True, False]).drop(columns="_severity")
+    return summary, detail.reset_index(drop=True)
+
+
+def paginate(df, page, page_size):
+    """返回第 page 页（从1开始）的数据"""
+    start = (max(page, 1) - 1) * page_size
+    return df.iloc[start:start + page_size]
+
+
+def render_inventory_alerts(summary, detail, key="inventory_alerts", page_size=20):
+    """显示预警汇总指标和分页的预警明细表"""
+    if detail.empty:
+        st.success("✅ 所有商品库存状态正常")
+        return
+
+    cols = st.columns(len(ALERT_LEVELS))
+    for col, (name, (_, icon)) in zip(cols, ALERT_LEVELS.items()):
+        col.metric(f"{icon} {name}", summary[name])
+
+    total_pages = max(math.ceil(len(detail) / page_size), 1)
+    page = st.number_input(f"预警明细页码（共 {total_pages} 页）", min_value=1, max_value=total_pages,
+                           value=1, step=1, key=f"{key}_page")
+    st.dataframe(paginate(detail, page, page_size), use_container_width=True)
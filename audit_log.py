@@ -0,0 +1,194 @@
+import atexit
+import os
+import threading
+import time
+from datetime import datetime
+
+# 审计日志写入模式
+MODE_SYNC = "sync"      # 同步：每条日志立即写入（传入业务连接时在业务事务内写入）
+MODE_GROUP = "group"    # 组提交：业务事务内的日志随业务事务提交，独立日志等待下一批提交后返回
+MODE_ASYNC = "async"    # 异步：写入内存缓冲后立即返回，由后台线程批量写入（传入业务连接时在业务事务提交后才写入缓冲）
+AUDIT_MODES = [MODE_SYNC, MODE_GROUP, MODE_ASYNC]
+
+INSERT_LOG_SQL = '''INSERT INTO operation_logs (user_id, operation_type, table_name, record_id, details, created_at) 
+                    VALUES (?, ?, ?, ?, ?, ?)'''
+
+
+class AuditLogSink:
+    """操作日志缓冲写入器：按数量或时间阈值由后台线程批量写入 operation_logs"""
+
+    def __init__(self, transaction, mode=MODE_ASYNC, batch_size=500, flush_interval=1.0, on_commit=None):
+        """
+        Args:
+            transaction: 返回写事务上下文管理器的函数（如 DatabaseManager.write_transaction）
+            on_commit: 注册事务提交回调的函数 (conn, callback)（如 DatabaseManager.on_commit），
+                异步模式下业务事务内的日志在提交后才进入缓冲，业务回滚时日志随之丢弃
+            mode: 写入模式，见 AUDIT_MODES
+            batch_size: 缓冲达到该条数时立即触发写入
+            flush_interval: 最长写入间隔（秒）
+        """
+        if mode not in AUDIT_MODES:
+            raise ValueError(f"无效的日志模式：{mode}。有效值：{', '.join(AUDIT_MODES)}")
+        self.transaction = transaction
+        self.mode = mode
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_commit = on_commit
+        self._buffer = []
+        self._cond = threading.Condition()
+        self._flushed_seq = 0   # 已写入的最后一批序号（组提交等待用）
+        self._pending_seq = 1   # 当前缓冲所属批次序号
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="audit-log-flusher", daemon=True)
+        self._thread.start()
+
+    def set_mode(self, mode):
+        """运行时切换写入模式（切换前先写入已缓冲的日志）"""
+        if mode not in AUDIT_MODES:
+            raise ValueError(f"无效的日志模式：{mode}。有效值：{', '.join(AUDIT_MODES)}")
+        self.flush()
+        self.mode = mode
+
+    def record(self, user_id, operation_type, table_name, record_id, details, created_at=None, conn=None):
+        """记录一条操作日志"""
+        row = (user_id, operation_type, table_name, record_id, details, created_at or datetime.now().isoformat())
+        self.record_many([row], conn=conn)
+
+    def record_many(self, rows, conn=None):
+        """
+        记录多条操作日志
+        
+        Args:
+            rows: (user_id, operation_type, table_name, record_id, details, created_at) 元组列表
+            conn: 传入业务连接时，同步和组提交模式下日志与业务数据在同一事务中提交，
+                异步模式下在业务事务提交后才进入缓冲
+        """
+        rows = list(rows)
+        if not rows:
+            return
+        # 调用方持有写事务时不能等待后台线程（后台写入需要同一把写锁）
+        if self.mode == MODE_SYNC or (self.mode == MODE_GROUP and conn is not None):
+            if conn is not None:
+                conn.executemany(INSERT_LOG_SQL, rows)
+            else:
+                with self.transaction() as write_conn:
+                    write_conn.executemany(INSERT_LOG_SQL, rows)
+            return
+        if conn is not None and self.on_commit is not None:
+            # 业务事务回滚时不应留下日志：提交后再进入缓冲
+            self.on_commit(conn, lambda: self._enqueue(rows))
+            return
+        self._enqueue(rows)
+
+    def _enqueue(self, rows):
+        """日志进入缓冲，组提交模式下等待本批写入"""
+        with self._cond:
+            self._buffer.extend(rows)
+            seq = self._pending_seq
+            if self.mode == MODE_GROUP or len(self._buffer) >= self.batch_size:
+                self._cond.notify_all()
+            if self.mode == MODE_GROUP:
+                # 等待本批日志提交，超时后不再阻塞业务
+                self._cond.wait_for(lambda: self._flushed_seq >= seq or self._closed,
+                                    timeout=max(self.flush_interval * 5, 5))
+
+    def _take_batch(self):
+        """取出当前缓冲，返回 (批次序号, 日志行)"""
+        rows, self._buffer = self._buffer, []
+        seq = self._pending_seq
+        self._pending_seq += 1
+        return seq, rows
+
+    def _write(self, rows):
+        """批量写入一批日志，失败时放回缓冲等待下次重试"""
+        try:
+            with self.transaction() as conn:
+                conn.executemany(INSERT_LOG_SQL, rows)
+            return True
+        except Exception as e:
+            print(f"日志批量写入失败：{e}")  # 使用print而非st.error，避免干扰用户界面
+            with self._cond:
+                self._buffer[:0] = rows
+            return False
+
+    def _run(self):
+        """后台写入线程"""
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._closed or len(self._buffer) >= self.batch_size
+                    or (self.mode == MODE_GROUP and self._buffer),
+                    timeout=self.flush_interval
+                )
+                if self._closed and not self._buffer:
+                    return
+                if not self._buffer:
+                    continue
+                seq, rows = self._take_batch()
+            ok = self._write(rows)
+            with self._cond:
+                if ok:
+                    self._flushed_seq = max(self._flushed_seq, seq)
+                self._cond.notify_all()
+            if not ok:
+                # 写入失败时退避，避免数据库不可用时空转
+                time.sleep(self.flush_interval)
+
+    def flush(self):
+        """立即写入所有已缓冲的日志"""
+        with self._cond:
+            if not self._buffer:
+                return
+            seq, rows = self._take_batch()
+        ok = self._write(rows)
+        with self._cond:
+            if ok:
+                self._flushed_seq = max(self._flushed_seq, seq)
+            self._cond.notify_all()
+
+    def close(self):
+        """停止后台线程并写入剩余日志（进程退出时自动调用）"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout=10)
+        self.flush()
+
+
+_sink = None
+_sink_lock = threading.Lock()
+
+
+def get_audit_sink():
+    """获取进程级日志写入器（模式由环境变量 ERP_AUDIT_MODE 指定，默认异步）"""
+    global _sink
+    if _sink is None:
+        with _sink_lock:
+            if _sink is None:
+                from dataset import DatabaseManager
+                _sink = AuditLogSink(
+                    DatabaseManager.write_transaction,
+                    on_commit=DatabaseManager.on_commit,
+                    mode=os.environ.get("ERP_AUDIT_MODE", MODE_ASYNC),
+                    batch_size=int(os.environ.get("ERP_AUDIT_BATCH_SIZE", "500")),
+                    flush_interval=float(os.environ.get("ERP_AUDIT_FLUSH_INTERVAL", "1.0")),
+                )
+                atexit.register(_sink.close)
+    return _sink
+
+
+def log_operation(user_id, operation_type, table_name, record_id, details, created_at=None, conn=None):
+    """记录一条操作日志（写入方式由当前日志模式决定）"""
+    get_audit_sink().record(user_id, operation_type, table_name, record_id, details, created_at, conn=conn)
+
+
+def shutdown_audit_sink():
+    """关闭日志写入器并写入剩余日志"""
+    global _sink
+    with _sink_lock:
+        if _sink is not None:
+            atexit.unregister(_sink.close)
+            _sink.close()
+            _sink = None
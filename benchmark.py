@@ -0,0 +1,254 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime
+
+# 性能基准测试（无需启动Streamlit）
+# 用法：python benchmark.py --sizes 10000,100000,1000000 --output bench_results.json
+# 为每个规模生成一个合成数据库（相同种子生成相同数据），依次计时热点函数，结果写入JSON便于不同提交之间对比。
+
+DEFAULT_SIZES = [10000, 100000, 1000000]
+
+
+def _quiet_streamlit():
+    """无Streamlit运行时时 st.cache_data / st.error 会输出大量警告，基准测试中屏蔽"""
+    # streamlit 为每个模块单独设置日志级别，需在被测模块导入后逐个调整
+    import dataset, update, view, Inventory  # noqa: F401
+    for name in list(logging.root.manager.loggerDict):
+        if name.startswith("streamlit"):
+            logging.getLogger(name).setLevel(logging.ERROR)
+
+
+def _git_commit():
+    """当前提交号（非git目录返回None）"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _summarize(samples):
+    """把多次运行的耗时（秒）汇总为统计值"""
+    return {
+        "runs": len(samples),
+        "min_s": round(min(samples), 6),
+        "median_s": round(statistics.median(samples), 6),
+        "mean_s": round(statistics.fmean(samples), 6),
+        "max_s": round(max(samples), 6),
+    }
+
+
+def time_call(func, repeat=5, clear=None):
+    """
+    计时函数调用
+
+    Args:
+        func: 无参函数
+        repeat: 热运行次数
+        clear: 清除缓存的函数；提供时先清缓存测一次冷运行
+
+    Returns:
+        dict: 冷运行耗时（如有）和热运行统计
+    """
+    result = {}
+    if clear is not None:
+        clear()
+        started = time.perf_counter()
+        func()
+        result["cold_s"] = round(time.perf_counter() - started, 6)
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    result.update(_summarize(samples))
+    return result
+
+
+def build_database(path, num_orders, seed=42, reuse=False):
+    """
+    生成（或复用）指定订单规模的合成数据库
+
+    物品数、设备数按订单规模等比例放大，库存历史固定90天。
+
+    Returns:
+        dict: 生成统计（复用时为None）
+    """
+    from dataset import DatabaseManager, configure_database
+    from gen_data import bulk_generate
+
+    if reuse and os.path.exists(path):
+        configure_database(path)
+        DatabaseManager.init_database()
+        return None
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    configure_database(path)
+    DatabaseManager.init_database()
+    return bulk_generate(
+        num_items=max(100, num_orders // 100),
+        num_orders=num_orders,
+        num_machines=max(20, num_orders // 5000),
+        seed=seed,
+        history_days=90,
+        report=lambda message: print(f"  {message}"),
+    )
+
+
+def run_benchmarks(repeat=5):
+    """
+    在当前数据库上计时各热点函数
+
+    只读函数先测冷运行（清空缓存）再测热运行；写函数每次写入一条新数据。
+    排产会改变订单状态，放在最后执行。
+
+    Returns:
+        dict: 函数名 -> 计时结果
+    """
+    import streamlit as st
+    import dataset
+    import update
+    import view
+    import Inventory
+    from forecast import _forecast_cache
+
+    results = {}
+
+    def record(name, func, clear=None, runs=repeat):
+        print(f"  {name} ...", end="", flush=True)
+        results[name] = time_call(func, repeat=runs, clear=clear)
+        print(f" {results[name]['median_s'] * 1000:.2f} ms")
+
+    clear_cache = st.cache_data.clear
+    conn = dataset.DatabaseManager.get_connection()
+
+    record("dataset.load_items", dataset.load_items, clear=clear_cache)
+    record("dataset.load_orders", dataset.load_orders, clear=clear_cache)
+    record("dataset.load_inventory", dataset.load_inventory, clear=clear_cache)
+    first_order = conn.execute("SELECT MIN(order_id) FROM orders").fetchone()[0]
+    record("dataset.load_order_items", lambda: dataset.load_order_items(first_order), clear=clear_cache)
+    page_ids = [row[0] for row in conn.execute("SELECT order_id FROM orders ORDER BY order_date DESC LIMIT 500")]
+    record("dataset.load_order_items_batch[500]", lambda: dataset.load_order_items_batch(page_ids), clear=clear_cache)
+    record("dataset.get_low_stock_items", dataset.get_low_stock_items)
+    record("dataset.get_order_statistics", dataset.get_order_statistics)
+
+    inventory_df = update.load_inventory()
+    record("update.check_inventory_alerts", lambda: update.check_inventory_alerts(inventory_df))
+    record("Inventory.predict_inventory", lambda: Inventory.predict_inventory(0.2), clear=_forecast_cache.clear)
+
+    # 写操作：选库存最多的物品，每次下单1件，调整库存时加减交替保持库存不变
+    item_id, unit_price = conn.execute(
+        '''SELECT inv.item_id, it.unit_price FROM inventory inv JOIN items it ON inv.item_id = it.item_id
+           ORDER BY inv.current_stock DESC LIMIT 1'''
+    ).fetchone()
+    today = datetime.now().isoformat()
+
+    def create_one():
+        order_items = [{"item_id": item_id, "quantity": 1, "unit_price": unit_price}]
+        if not dataset.create_order(f"BENCH-{uuid.uuid4().hex[:12]}", "基准测试客户", today, today, order_items, "benchmark"):
+            raise RuntimeError("create_order 失败")
+
+    record("dataset.create_order", create_one, runs=repeat * 4)
+    direction = [1]
+
+    def adjust_one():
+        direction[0] = -direction[0]
+        if not dataset.adjust_inventory(item_id, direction[0], "基准测试", "benchmark"):
+            raise RuntimeError("adjust_inventory 失败")
+
+    record("dataset.adjust_inventory", adjust_one, runs=repeat * 4)
+
+    # 排产：每轮先把已排产订单恢复为待处理，保证每次调度相同数量的订单
+    pending_ids = [(row[0],) for row in conn.execute("SELECT order_id FROM orders WHERE status = 'pending'")]
+    pending = len(pending_ids)
+
+    def schedule_all():
+        stats = view.optimizeProductionPlan(None)
+        if stats is None:
+            raise RuntimeError("optimizeProductionPlan 失败")
+
+    def reset_pending():
+        with dataset.DatabaseManager.write_transaction() as write_conn:
+            write_conn.executemany("UPDATE orders SET status = 'pending' WHERE order_id = ?", pending_ids)
+            dataset.bump_table_versions(write_conn, "orders")
+
+    samples = []
+    for _ in range(max(1, repeat // 2)):
+        started = time.perf_counter()
+        schedule_all()
+        samples.append(time.perf_counter() - started)
+        reset_pending()
+    results["view.optimizeProductionPlan"] = dict(_summarize(samples), pending_orders=pending)
+    print(f"  view.optimizeProductionPlan ... {results['view.optimizeProductionPlan']['median_s'] * 1000:.2f} ms（{pending} 个待处理订单）")
+    return results
+
+
+def main(argv=None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="ERP 热点函数性能基准测试（无需启动Streamlit）")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES),
+                        help="订单规模，逗号分隔（默认 10000,100000,1000000）")
+    parser.add_argument("--workdir", default="bench_data", help="合成数据库存放目录")
+    parser.add_argument("--output", default=None, help="结果JSON文件（默认 bench_results-<提交号>.json）")
+    parser.add_argument("--repeat", type=int, default=5, help="每个函数的热运行次数")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--reuse", action="store_true", help="复用已存在的合成数据库（不重新生成）")
+    args = parser.parse_args(argv)
+
+    # 基准测试中日志同步写入，计时包含审计日志的完整开销
+    os.environ.setdefault("ERP_AUDIT_MODE", "sync")
+    _quiet_streamlit()
+    from audit_log import shutdown_audit_sink
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    os.makedirs(args.workdir, exist_ok=True)
+    commit = _git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": datetime.now().isoformat(),
+        "python": sys.version.split()[0],
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "seed": args.seed,
+        "results": [],
+    }
+    for size in sizes:
+        path = os.path.join(args.workdir, f"bench_{size}_{args.seed}.db")
+        print(f"[{size} 订单] 数据库：{path}")
+        started = time.perf_counter()
+        generation = build_database(path, size, seed=args.seed, reuse=args.reuse)
+        build_seconds = time.perf_counter() - started
+        benchmarks = run_benchmarks(repeat=args.repeat)
+        # 切换数据库前写入剩余日志
+        shutdown_audit_sink()
+        report["results"].append({
+            "orders": size,
+            "database": path,
+            "build_seconds": round(build_seconds, 3),
+            "generation": generation,
+            "benchmarks": benchmarks,
+        })
+
+    output = args.output or f"bench_results-{commit or 'local'}.json"
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
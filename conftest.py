@@ -0,0 +1,28 @@
+import pytest
+
+import dataset
+from audit_log import shutdown_audit_sink
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """在临时目录中初始化数据库（操作日志同步写入），返回读连接"""
+    monkeypatch.setenv("ERP_AUDIT_MODE", "sync")
+    db_file = dataset.DB_FILE
+    dataset.configure_database(str(tmp_path / "test.db"))
+    assert dataset.DatabaseManager.init_database()
+    yield dataset.DatabaseManager.get_connection()
+    shutdown_audit_sink()
+    dataset.configure_database(db_file)
+
+
+@pytest.fixture
+def make_item(database):
+    """添加一个物品并入库指定数量，返回物品ID"""
+    def make(name, stock=0, unit_price=1.0):
+        assert dataset.add_item(name, "", "个", unit_price, "tester")
+        item_id = database.execute("SELECT MAX(item_id) FROM items").fetchone()[0]
+        if stock:
+            assert dataset.adjust_inventory(item_id, stock, "入库", "tester")
+        return item_id
+    return make
@@ -0,0 +1,50 @@
+import plotly.express as px
+import streamlit as st
+from datetime import date
+from rights import check_permission
+from dataset import get_order_statistics, get_dashboard_summary
+
+def dashboard_page():
+    """数据看板页面（所有指标读取预汇总表）"""
+    # 权限检查
+    check_permission("数据看板")
+    
+    with st.sidebar:
+        st.title("看板设置")
+        days = st.slider("显示天数", 7, 365, 90)
+        top_n = st.slider("排行数量", 5, 50, 10)
+    
+    stats = get_order_statistics()
+    summary = get_dashboard_summary(days=days, top_n=top_n)
+    if stats is None or summary is None:
+        return
+    
+    # KPI 指标
+    daily = summary["daily"]
+    today = daily[daily["day"] == date.today().isoformat()]
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("订单总数", int(summary["status"]["order_count"].sum()))
+    col2.metric("已发货/已交付销售额", f"{stats['total_sales']:,.2f}")
+    col3.metric("待处理订单", stats["pending_count"])
+    col4.metric("今日销售额", f"{today['total_amount'].sum():,.2f}", f"{int(today['order_count'].sum())} 单")
+    
+    if daily.empty:
+        st.info("暂无订单数据")
+        return
+    
+    # 每日销售趋势
+    fig = px.line(daily, x="day", y="total_amount", title=f"近{days}天每日销售额", markers=True)
+    fig.update_layout(xaxis_title="日期", yaxis_title="销售额")
+    st.plotly_chart(fig, use_container_width=True)
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        fig = px.pie(summary["status"], values="order_count", names="status", title="订单状态分布")
+        st.plotly_chart(fig, use_container_width=True)
+    with col2:
+        fig = px.bar(summary["top_items"], x="revenue", y="item_name", orientation="h", title="物品销售额排行")
+        fig.update_yaxes(autorange="reversed")
+        st.plotly_chart(fig, use_container_width=True)
+    
+    st.subheader("客户销售额排行")
+    st.dataframe(summary["top_customers"], use_container_width=True)
@@ -1,187 +1,392 @@
+import os
+import json
+import queue
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
 import pandas as pd
 import streamlit as st
-from datetime import datetime
+from datetime import datetime, timedelta
+from migrations import run_migrations
+from audit_log import log_operation, get_audit_sink
+import sql_profiler
 
 # 数据库文件名
 DB_FILE = "factory.db"
 
+# 连接池配置（可通过环境变量覆盖）
+DB_READER_POOL_SIZE = int(os.environ.get("ERP_DB_POOL_SIZE", "8"))
+DB_BUSY_TIMEOUT_MS = int(os.environ.get("ERP_DB_BUSY_TIMEOUT_MS", "10000"))
+DB_CACHE_SIZE_KB = int(os.environ.get("ERP_DB_CACHE_SIZE_KB", "65536"))
+DB_MMAP_SIZE = int(os.environ.get("ERP_DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+
+class _ThreadLease:
+    """线程持有的连接租约，线程结束时自动把连接归还连接池"""
+
+    def __init__(self, pool, conn):
+        self.pool = pool
+        self.conn = conn
+
+    def __del__(self):
+        self.pool._release(self.conn)
+
+
+class ConnectionPool:
+    """进程级SQLite连接池：WAL模式，多个读连接 + 一个串行化的写连接"""
+
+    def __init__(self, db_file, pool_size=DB_READER_POOL_SIZE, busy_timeout=DB_BUSY_TIMEOUT_MS,
+                 cache_size=DB_CACHE_SIZE_KB, mmap_size=DB_MMAP_SIZE):
+        self.db_file = db_file
+        self.pool_size = pool_size
+        self.busy_timeout = busy_timeout
+        self.cache_size = cache_size
+        self.mmap_size = mmap_size
+        self._idle = queue.LifoQueue(maxsize=pool_size)
+        self._local = threading.local()
+        self._write_lock = threading.RLock()
+        self._writer = None
+        self._commit_callbacks = None  # 当前写事务提交后要执行的回调
+        self._closed = False
+
+        # WAL模式是数据库文件级别的持久设置，只需设置一次
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode = WAL")
+        self._release(conn)
+
+    def _connect(self):
+        """创建一个按连接池配置初始化的新连接"""
+        conn = sqlite3.connect(
+            self.db_file,
+            timeout=self.busy_timeout / 1000,
+            check_same_thread=False,
+            isolation_level="DEFERRED",
+            factory=sql_profiler.connection_factory()  # 开启SQL性能统计时使用带计时的连接
+        )
+        conn.row_factory = sqlite3.Row  # 使查询结果支持字典式访问
+        conn.execute("PRAGMA foreign_keys = ON")  # 启用外键约束
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout)}")
+        conn.execute("PRAGMA synchronous = NORMAL")  # WAL模式下NORMAL即可保证一致性
+        conn.execute(f"PRAGMA cache_size = {-int(self.cache_size)}")  # 负数表示单位为KB
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        return conn
+
+    def _acquire(self):
+        """从空闲队列取出连接，没有则新建"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def _release(self, conn):
+        """归还连接：回滚未完成的事务，队列已满或连接池已关闭则直接关闭"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            if self._closed:
+                conn.close()
+                return
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def connection(self):
+        """获取当前线程绑定的连接（线程结束时自动归还）"""
+        lease = getattr(self._local, "lease", None)
+        if lease is None:
+            lease = _ThreadLease(self, self._acquire())
+            self._local.lease = lease
+        return lease.conn
+
+    def release_thread_connection(self):
+        """主动归还当前线程绑定的连接"""
+        lease = getattr(self._local, "lease", None)
+        if lease is not None:
+            del self._local.lease
+
+    @contextmanager
+    def reader(self):
+        """借用一个读连接，用完归还"""
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    @contextmanager
+    def writer(self):
+        """获取唯一的写连接；并发写入在进程内排队，而不是因数据库锁定而失败"""
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = self._connect()
+            conn = self._writer
+            conn.execute("BEGIN IMMEDIATE")
+            self._commit_callbacks = callbacks = []
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                self._commit_callbacks = None
+            for callback in callbacks:
+                callback()
+
+    def on_commit(self, conn, callback):
+        """conn 为正在进行的写事务时，在事务提交后执行 callback（回滚则丢弃）；否则立即执行"""
+        if conn is not None and conn is self._writer and self._commit_callbacks is not None:
+            self._commit_callbacks.append(callback)
+        else:
+            callback()
+
+    def close_all(self):
+        """关闭连接池中的所有空闲连接和写连接"""
+        self._closed = True
+        self.release_thread_connection()
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# 数据库迁移是否已在本进程执行
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+
+def get_pool():
+    """获取进程级连接池（首次调用时创建）"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_FILE)
+    return _pool
+
+
+def configure_database(db_file):
+    """切换数据库文件（用于命令行工具和基准测试），关闭已创建的连接池"""
+    global DB_FILE, _pool, _schema_ready
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close_all()
+        DB_FILE = db_file
+        _pool = None
+        _schema_ready = False
+
+
+def set_sql_profiling(enabled):
+    """开启或关闭SQL性能统计：关闭当前连接池，之后创建的连接按新设置决定是否计时"""
+    global _pool
+    sql_profiler.set_enabled(enabled)
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close_all()
+        _pool = None
+
+
 class DatabaseManager:
     """数据库管理类，封装数据库操作"""
     
     @staticmethod
     def get_connection():
-        """获取数据库连接（单例模式）"""
-        if "db_conn" not in st.session_state:
-            try:
-                conn = sqlite3.connect(DB_FILE, check_same_thread=False)
-                conn.execute("PRAGMA foreign_keys = ON")  # 启用外键约束
-                conn.row_factory = sqlite3.Row  # 使查询结果支持字典式访问
-                st.session_state.db_conn = conn
-            except sqlite3.Error as e:
-                st.error(f"数据库连接失败：{e}")
-                raise
-        return st.session_state.db_conn
+        """获取当前线程的数据库连接（来自进程级连接池）"""
+        try:
+            return get_pool().connection()
+        except sqlite3.Error as e:
+            st.error(f"数据库连接失败：{e}")
+            raise
+    
+    @staticmethod
+    def write_transaction():
+        """获取写事务上下文：写操作在单一写连接上排队执行，退出时自动提交或回滚"""
+        return get_pool().writer()
+    
+    @staticmethod
+    def on_commit(conn, callback):
+        """在 conn 所在的写事务提交后执行 callback（事务回滚时不执行）"""
+        get_pool().on_commit(conn, callback)
     
     @staticmethod
     def close_connection():
-        """关闭数据库连接"""
-        if "db_conn" in st.session_state:
-            try:
-                st.session_state.db_conn.close()
-                del st.session_state.db_conn
-            except sqlite3.Error as e:
-                st.error(f"关闭数据库连接失败：{e}")
+        """归还当前线程的数据库连接"""
+        try:
+            get_pool().release_thread_connection()
+        except sqlite3.Error as e:
+            st.error(f"关闭数据库连接失败：{e}")
     
     @staticmethod
     def init_database():
-        """初始化数据库表结构"""
-        conn = DatabaseManager.get_connection()
-        cursor = conn.cursor()
-        
-        try:
-            # 创建物品表
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS items (
-                    item_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    item_name TEXT NOT NULL UNIQUE,
-                    description TEXT,
-                    unit TEXT NOT NULL,
-                    unit_price REAL NOT NULL,
-                    created_at TEXT NOT NULL
-                )
-            ''')
-            
-            # 创建库存表
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS inventory (
-                    inventory_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    item_id INTEGER NOT NULL,
-                    current_stock INTEGER NOT NULL DEFAULT 0,
-                    min_stock INTEGER NOT NULL DEFAULT 0,
-                    max_stock INTEGER NOT NULL DEFAULT 1000,
-                    last_updated TEXT NOT NULL,
-                    FOREIGN KEY (item_id) REFERENCES items(item_id) ON DELETE CASCADE
-                )
-            ''')
-            
-            # 创建订单表
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS orders (
-                    order_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    order_no TEXT NOT NULL UNIQUE,
-                    customer_name TEXT NOT NULL,
-                    order_date TEXT NOT NULL,
-                    delivery_date TEXT,
-                    due_date TEXT,
-                    processing_time INTEGER DEFAULT 0,
-                    status TEXT NOT NULL DEFAULT 'pending',
-                    total_amount REAL NOT NULL DEFAULT 0,
-                    created_by TEXT NOT NULL,
-                    created_at TEXT NOT NULL
-                )
-            ''')
-            
-            # 创建订单详情表
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS order_items (
-                    order_item_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    order_id INTEGER NOT NULL,
-                    item_id INTEGER NOT NULL,
-                    quantity INTEGER NOT NULL,
-                    unit_price REAL NOT NULL,
-                    subtotal REAL NOT NULL,
-                    FOREIGN KEY (order_id) REFERENCES orders(order_id) ON DELETE CASCADE,
-                    FOREIGN KEY (item_id) REFERENCES items(item_id) ON DELETE CASCADE
-                )
-            ''')
-            
-            # 创建用户操作日志表
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS operation_logs (
-                    log_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id TEXT NOT NULL,
-                    operation_type TEXT NOT NULL,
-                    table_name TEXT NOT NULL,
-                    record_id INTEGER,
-                    details TEXT,
-                    created_at TEXT NOT NULL
-                )
-            ''')
-            
-            # 创建设备表
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS machines (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    machine_name TEXT NOT NULL UNIQUE,
-                    status TEXT NOT NULL DEFAULT '可用',
-                    capacity REAL NOT NULL DEFAULT 0,
-                    created_at TEXT NOT NULL
-                )
-            ''')
-            
-            # 创建生产计划表
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS production_plan (
-                    order_id INTEGER NOT NULL,
-                    machine_id INTEGER NOT NULL,
-                    start_time TEXT NOT NULL,
-                    end_time TEXT NOT NULL,
-                    PRIMARY KEY (order_id, machine_id),
-                    FOREIGN KEY (order_id) REFERENCES orders(order_id) ON DELETE CASCADE,
-                    FOREIGN KEY (machine_id) REFERENCES machines(id) ON DELETE CASCADE
-                )
-            ''')
-            
-            conn.commit()
+        """初始化数据库表结构（执行未应用的迁移，每个进程只执行一次）"""
+        global _schema_ready
+        if _schema_ready:
             return True
-        except sqlite3.Error as e:
-            conn.rollback()
-            st.error(f"数据库初始化失败：{e}")
-            return False
-        finally:
-            cursor.close()
+        with _schema_lock:
+            if _schema_ready:
+                return True
+            try:
+                run_migrations(DatabaseManager.write_transaction)
+                _schema_ready = True
+                return True
+            except sqlite3.Error as e:
+                st.error(f"数据库初始化失败：{e}")
+                return False
+
+# 表版本函数
+def bump_table_versions(conn, *tables):
+    """在当前写事务中递增表的版本号，使以版本为键的数据缓存失效"""
+    conn.executemany(
+        '''INSERT INTO table_versions (table_name, version) VALUES (?, 1)
+           ON CONFLICT(table_name) DO UPDATE SET version = version + 1''',
+        [(table,) for table in tables]
+    )
+
+def get_table_versions(*tables):
+    """获取表的当前版本号（按参数顺序返回元组，无记录的表为0）"""
+    conn = DatabaseManager.get_connection()
+    rows = conn.execute(
+        "SELECT table_name, version FROM table_versions WHERE table_name IN (SELECT value FROM json_each(?))",
+        (json.dumps(tables),)
+    ).fetchall()
+    versions = {row[0]: row[1] for row in rows}
+    return tuple(versions.get(table, 0) for table in tables)
+
+def next_autoincrement_id(conn, table, column):
+    """
+    显式分配主键时的起始ID：取 AUTOINCREMENT 的 sqlite_sequence 与当前最大值中较大者，
+    已删除行的ID不会被重新使用（否则引用旧ID的日志和明细会挂到新记录上）
+    """
+    return conn.execute(
+        f'''SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = ?), 0),
+                   COALESCE((SELECT MAX({column}) FROM {table}), 0))''',
+        (table,)
+    ).fetchone()[0] + 1
+
+# 类型压缩
+# 文本列不同取值数不超过行数的该比例时转为 category
+CATEGORY_MAX_RATIO = 0.5
+# 各加载函数最近一次加载时压缩前后的内存占用
+_loader_memory = {}
+_loader_memory_lock = threading.Lock()
+
+def optimize_frame(df, datetime_cols=(), name=None):
+    """
+    压缩 DataFrame 的内存占用（原地转换列类型并返回）
+
+    低基数文本列转为 category，整数列向下转换为最小的整数类型，
+    浮点列只在转为 float32 后数值完全不变时才转换（金额等小数通常保持 float64），
+    datetime_cols 中的ISO时间字符串解析为 datetime64。
+
+    Args:
+        df: read_sql 返回的 DataFrame
+        datetime_cols: 需要解析为时间的列
+        name: 加载函数名称，提供时记录压缩前后的内存占用（见 get_loader_memory_report）
+
+    Returns:
+        DataFrame: 转换后的 df
+    """
+    if df.empty:
+        return df
+    before = int(df.memory_usage(deep=True).sum())
+    for col in df.columns:
+        series = df[col]
+        if col in datetime_cols:
+            df[col] = pd.to_datetime(series, format="ISO8601", errors="coerce")
+        elif pd.api.types.is_integer_dtype(series):
+            df[col] = pd.to_numeric(series, downcast="integer")
+        elif pd.api.types.is_float_dtype(series):
+            as_float32 = series.astype("float32")
+            if np.array_equal(as_float32.to_numpy(dtype="float64"), series.to_numpy(), equal_nan=True):
+                df[col] = as_float32
+        elif pd.api.types.is_string_dtype(series) or series.dtype == object:
+            if series.nunique(dropna=True) <= len(series) * CATEGORY_MAX_RATIO:
+                df[col] = series.astype("category")
+    if name is not None:
+        after = int(df.memory_usage(deep=True).sum())
+        with _loader_memory_lock:
+            _loader_memory[name] = {
+                "rows": len(df),
+                "before_bytes": before,
+                "after_bytes": after,
+                "saved_pct": round((1 - after / before) * 100, 1) if before else 0.0,
+                "dtypes": {col: str(dtype) for col, dtype in df.dtypes.items()},
+            }
+    return df
+
+def get_loader_memory_report():
+    """各加载函数最近一次加载的行数、压缩前后字节数、节省比例和列类型"""
+    with _loader_memory_lock:
+        return {name: dict(entry) for name, entry in _loader_memory.items()}
 
 # 数据加载函数
-@st.cache_data(ttl=300)  # 缓存5分钟
+# 缓存以相关表的版本号为键：表未变化时一直命中缓存，任何写操作递增版本后下次读取即刷新
 def load_items():
     """加载所有物品数据"""
+    return _load_items(get_table_versions("items"))
+
+@st.cache_data(max_entries=4)
+def _load_items(versions):
     conn = DatabaseManager.get_connection()
     try:
         df = pd.read_sql("SELECT * FROM items", conn)
-        return df
+        return optimize_frame(df, datetime_cols=("created_at",), name="load_items")
     except sqlite3.Error as e:
         st.error(f"加载物品数据失败：{e}")
         return pd.DataFrame()
 
-@st.cache_data(ttl=300)
 def load_orders():
     """加载所有订单数据"""
+    return _load_orders(get_table_versions("orders"))
+
+@st.cache_data(max_entries=4)
+def _load_orders(versions):
     conn = DatabaseManager.get_connection()
     try:
         df = pd.read_sql("SELECT * FROM orders", conn)
-        return df
+        return optimize_frame(
+            df, datetime_cols=("order_date", "delivery_date", "due_date", "created_at"), name="load_orders"
+        )
     except sqlite3.Error as e:
         st.error(f"加载订单数据失败：{e}")
         return pd.DataFrame()
 
-@st.cache_data(ttl=300)
 def load_inventory():
     """加载所有库存数据"""
+    return _load_inventory(get_table_versions("inventory", "items"))
+
+@st.cache_data(max_entries=4)
+def _load_inventory(versions):
     conn = DatabaseManager.get_connection()
     try:
         df = pd.read_sql('''SELECT i.inventory_id, i.item_id, it.item_name, it.description, 
                                it.unit, i.current_stock, i.min_stock, i.max_stock, i.last_updated
                         FROM inventory i
                         JOIN items it ON i.item_id = it.item_id''', conn)
-        return df
+        return optimize_frame(df, datetime_cols=("last_updated",), name="load_inventory")
     except sqlite3.Error as e:
         st.error(f"加载库存数据失败：{e}")
         return pd.DataFrame()
 
-@st.cache_data(ttl=300)
 def load_order_items(order_id):
     """加载指定订单的详细物品"""
+    return _load_order_items(order_id, get_table_versions("order_items", "items"))
+
+@st.cache_data(max_entries=1000)
+def _load_order_items(order_id, versions):
     conn = DatabaseManager.get_connection()
     try:
         df = pd.read_sql('''SELECT oi.*, it.item_name, it.unit 
@@ -193,258 +398,753 @@ def load_order_items(order_id):
         st.error(f"加载订单物品失败：{e}")
         return pd.DataFrame()
 
-# 物品管理函数
-def add_item(item_name, description, unit, unit_price, created_by):
-    """添加新物品"""
+def load_order_items_batch(order_ids):
+    """
+    一次查询加载一批订单的明细物品
+
+    Args:
+        order_ids: 订单ID列表
+
+    Returns:
+        DataFrame: 以 order_id 为索引（已排序，可用 .loc[[order_id]] 取单个订单的明细）
+    """
+    order_ids = tuple(sorted({int(order_id) for order_id in order_ids}))
+    return _load_order_items_batch(order_ids, get_table_versions("order_items", "items"))
+
+@st.cache_data(max_entries=64)
+def _load_order_items_batch(order_ids, versions):
     conn = DatabaseManager.get_connection()
-    cursor = conn.cursor()
-    
     try:
-        # 验证物品名称是否已存在
-        cursor.execute("SELECT item_id FROM items WHERE item_name = ?", (item_name,))
-        if cursor.fetchone():
-            st.error("物品名称已存在")
-            return False
-        
-        # 添加物品
-        created_at = datetime.now().isoformat()
-        cursor.execute(
-            '''INSERT INTO items (item_name, description, unit, unit_price, created_at) 
-             VALUES (?, ?, ?, ?, ?)''',
-            (item_name, description, unit, unit_price, created_at)
-        )
-        item_id = cursor.lastrowid
-        
-        # 初始化库存
-        cursor.execute(
-            '''INSERT INTO inventory (item_id, current_stock, min_stock, max_stock, last_updated) 
-             VALUES (?, ?, ?, ?, ?)''',
-            (item_id, 0, 0, 1000, created_at)
-        )
+        # 订单ID以JSON数组传入，避免拼接占位符并绕开参数个数上限
+        df = pd.read_sql('''SELECT oi.*, it.item_name, it.unit
+                        FROM order_items oi
+                        JOIN items it ON oi.item_id = it.item_id
+                        WHERE oi.order_id IN (SELECT value FROM json_each(?))
+                        ORDER BY oi.order_id, oi.order_item_id''', conn, params=(json.dumps(order_ids),))
+        return df.set_index("order_id")
+    except sqlite3.Error as e:
+        st.error(f"加载订单物品失败：{e}")
+        return pd.DataFrame()
+
+# 订单分页查询函数
+def _order_filters(status=None, customer=None, date_from=None, date_to=None):
+    """构造订单筛选条件（客户名称按前缀匹配，可使用索引）"""
+    clauses, params = [], []
+    if status:
+        clauses.append("status = ?")
+        params.append(status)
+    if customer:
+        # 前缀范围查询代替 LIKE，使 customer_name 索引生效
+        clauses.append("customer_name >= ? AND customer_name < ?")
+        params.extend([customer, customer + "\U0010ffff"])
+    if date_from:
+        clauses.append("order_date >= ?")
+        params.append(str(date_from))
+    if date_to:
+        # 结束日期包含当天：小于次日零点
+        clauses.append("order_date < ?")
+        params.append((pd.Timestamp(date_to) + pd.Timedelta(days=1)).date().isoformat())
+    return clauses, params
+
+def query_orders_page(status=None, customer=None, date_from=None, date_to=None, after=None, limit=50):
+    """
+    键集分页查询订单（按 order_date、order_id 倒序）
+    
+    Args:
+        status: 订单状态
+        customer: 客户名称前缀
+        date_from: 起始日期（含）
+        date_to: 结束日期（含）
+        after: 上一页最后一行的 (order_date, order_id)，None 表示第一页
+        limit: 每页行数
         
-        # 记录操作日志
-        cursor.execute(
-            '''INSERT INTO operation_logs (user_id, operation_type, table_name, record_id, details, created_at) 
-             VALUES (?, ?, ?, ?, ?, ?)''',
-            (created_by, "INSERT", "items", item_id, f"添加物品：{item_name}", created_at)
+    Returns:
+        tuple: (当前页订单DataFrame, 下一页游标)，没有下一页时游标为None
+    """
+    clauses, params = _order_filters(status, customer, date_from, date_to)
+    if after is not None:
+        clauses.append("(order_date, order_id) < (?, ?)")
+        params.extend(after)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    conn = DatabaseManager.get_connection()
+    try:
+        # 多取一行判断是否还有下一页
+        df = pd.read_sql(
+            f"SELECT * FROM orders {where} ORDER BY order_date DESC, order_id DESC LIMIT ?",
+            conn, params=params + [limit + 1]
         )
+    except sqlite3.Error as e:
+        st.error(f"查询订单失败：{e}")
+        return pd.DataFrame(), None
+    if len(df) > limit:
+        df = df.iloc[:limit]
+        last = df.iloc[-1]
+        return df, (last["order_date"], int(last["order_id"]))
+    return df, None
+
+def get_order_status_counts(customer=None, date_from=None, date_to=None):
+    """按状态统计订单数量（用于筛选项的数量显示）"""
+    clauses, params = _order_filters(None, customer, date_from, date_to)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    conn = DatabaseManager.get_connection()
+    try:
+        rows = conn.execute(
+            f"SELECT status, COUNT(*) FROM orders {where} GROUP BY status ORDER BY status", params
+        ).fetchall()
+        return {row[0]: row[1] for row in rows}
+    except sqlite3.Error as e:
+        st.error(f"统计订单状态失败：{e}")
+        return {}
+
+def order_no_exists(order_no):
+    """检查订单号是否已存在"""
+    conn = DatabaseManager.get_connection()
+    return conn.execute("SELECT 1 FROM orders WHERE order_no = ?", (order_no,)).fetchone() is not None
+
+# 全文搜索函数
+# trigram 分词要求查询词至少3个字符，更短的查询在单字/双字索引中按字词精确查找
+FTS_MIN_QUERY_LENGTH = 3
+SHORT_QUERY_INDEXES = {"orders_fts": "orders_grams", "items_fts": "items_grams"}
+
+def _gram_token(text):
+    """短查询对应的索引字词：ASCII 字母转小写后的 UTF-8 十六进制编码（与迁移中的 hex(lower(...)) 一致）"""
+    return "".join(c.lower() if c.isascii() else c for c in text).encode("utf-8").hex().upper()
+
+def _fts_search(fts_table, query, limit):
+    """在全文索引表中搜索，返回按相关度排序的 rowid 列表（短查询按ID顺序）"""
+    query = query.strip()
+    if not query:
+        return []
+    conn = DatabaseManager.get_connection()
+    if len(query) >= FTS_MIN_QUERY_LENGTH:
+        # 整体作为短语查询，避免用户输入中的 FTS 语法字符
+        phrase = '"' + query.replace('"', '""') + '"'
+        rows = conn.execute(
+            f"SELECT rowid FROM {fts_table} WHERE {fts_table} MATCH ? ORDER BY rank LIMIT ?",
+            (phrase, limit)
+        ).fetchall()
+    else:
+        grams_table = SHORT_QUERY_INDEXES[fts_table]
+        rows = conn.execute(
+            f"SELECT rowid FROM {grams_table} WHERE {grams_table} MATCH ? LIMIT ?",
+            ('"' + _gram_token(query) + '"', limit)
+        ).fetchall()
+    return [row[0] for row in rows]
+
+def _load_rows_in_order(table, key, ids):
+    """按给定ID顺序读取记录"""
+    if not ids:
+        return pd.DataFrame()
+    conn = DatabaseManager.get_connection()
+    df = pd.read_sql(
+        f"SELECT * FROM {table} WHERE {key} IN (SELECT value FROM json_each(?))",
+        conn, params=(json.dumps(ids),)
+    )
+    found = set(df[key])
+    return df.set_index(key).loc[[i for i in ids if i in found]].reset_index()
+
+def _customer_order_ids(customer_ids, limit):
+    """按客户顺序取出客户名称对应的订单ID（同一客户按下单日期倒序），最多 limit 个"""
+    conn = DatabaseManager.get_connection()
+    order_ids = []
+    for customer_id in customer_ids:
+        rows = conn.execute(
+            '''SELECT o.order_id FROM order_customers c JOIN orders o ON o.customer_name = c.customer_name
+               WHERE c.customer_id = ? ORDER BY o.order_date DESC LIMIT ?''',
+            (customer_id, limit - len(order_ids))
+        ).fetchall()
+        order_ids.extend(row[0] for row in rows)
+        if len(order_ids) >= limit:
+            break
+    return order_ids
+
+def search_orders(query, limit=50):
+    """按客户名称全文搜索订单，按客户名称的相关度排序"""
+    try:
+        # 订单索引建在去重后的客户名称上，先找到客户再取其订单
+        customer_ids = _fts_search("orders_fts", query, limit)
+        return _load_rows_in_order("orders", "order_id", _customer_order_ids(customer_ids, limit))
+    except sqlite3.Error as e:
+        st.error(f"搜索订单失败：{e}")
+        return pd.DataFrame()
+
+def search_items(query, limit=50):
+    """按物品名称和描述全文搜索物品，按相关度排序"""
+    try:
+        return _load_rows_in_order("items", "item_id", _fts_search("items_fts", query, limit))
+    except sqlite3.Error as e:
+        st.error(f"搜索物品失败：{e}")
+        return pd.DataFrame()
+
+# 物品管理函数
+def add_item(item_name, description, unit, unit_price, created_by):
+    """添加新物品"""
+    try:
+        # 写操作在唯一写连接上排队执行，退出时自动提交或回滚
+        with DatabaseManager.write_transaction() as conn:
+            # 验证物品名称是否已存在
+            if conn.execute("SELECT item_id FROM items WHERE item_name = ?", (item_name,)).fetchone():
+                st.error("物品名称已存在")
+                return False
+            
+            # 添加物品
+            created_at = datetime.now().isoformat()
+            cursor = conn.execute(
+                '''INSERT INTO items (item_name, description, unit, unit_price, created_at) 
+                 VALUES (?, ?, ?, ?, ?)''',
+                (item_name, description, unit, unit_price, created_at)
+            )
+            item_id = cursor.lastrowid
+            
+            # 初始化库存
+            conn.execute(
+                '''INSERT INTO inventory (item_id, current_stock, min_stock, max_stock, last_updated) 
+                 VALUES (?, ?, ?, ?, ?)''',
+                (item_id, 0, 0, 1000, created_at)
+            )
+            
+            bump_table_versions(conn, "items", "inventory")
+            
+            # 记录操作日志
+            log_operation(created_by, "INSERT", "items", item_id, f"添加物品：{item_name}", created_at, conn=conn)
         
-        conn.commit()
         st.success("物品添加成功")
         return True
     except sqlite3.Error as e:
-        conn.rollback()
         st.error(f"添加物品失败：{e}")
         return False
-    finally:
-        cursor.close()
+
+# 库存变动函数
+class StockMovementError(sqlite3.Error):
+    """库存变动无法执行（物品不存在或库存不足）；继承 sqlite3.Error，抛出时所在写事务整体回滚"""
+
+    def __init__(self, item_id, delta, current_stock=None):
+        self.item_id = item_id
+        self.delta = delta
+        self.current_stock = current_stock
+        self.missing = current_stock is None
+        if self.missing:
+            message = f"物品ID {item_id} 不存在或未初始化库存"
+        else:
+            message = f"物品ID {item_id} 库存不足：当前 {current_stock}，变动 {delta}"
+        super().__init__(message)
+
+def apply_stock_movements(conn, movements, reason, created_by, ref_type=None, ref_id=None, created_at=None):
+    """
+    在调用方的写事务中应用一批库存变动，并写入 inventory_movements 流水
+
+    每条变动是一条带条件的 UPDATE（current_stock + delta >= 0），在数据库内完成加减，
+    不在 Python 中读取-计算-回写，因此并发会话不会互相覆盖；库存不足时该语句不修改任何行。
+
+    Args:
+        conn: 写事务连接（DatabaseManager.write_transaction）
+        movements: [(item_id, delta), ...]，delta 为正入库、为负出库
+        reason: 变动原因
+        created_by: 操作人
+        ref_type: 关联单据类型（如 order、adjust、count）
+        ref_id: 关联单据ID
+        created_at: 变动时间，默认当前时间；须在写事务内取得，保证晚于之前的库存快照
+
+    Returns:
+        list: 每条变动后的库存
+
+    Raises:
+        StockMovementError: 任一物品不存在或库存不足（调用方的事务应随之回滚）
+    """
+    created_at = created_at or datetime.now().isoformat()
+    balances, ledger_rows = [], []
+    for item_id, delta in movements:
+        item_id, delta = int(item_id), int(delta)
+        rows = conn.execute(
+            '''UPDATE inventory SET current_stock = current_stock + ?, last_updated = ?
+               WHERE item_id = ? AND current_stock + ? >= 0
+               RETURNING current_stock''',
+            (delta, created_at, item_id, delta)
+        ).fetchall()
+        if not rows:
+            current = conn.execute("SELECT current_stock FROM inventory WHERE item_id = ?", (item_id,)).fetchone()
+            raise StockMovementError(item_id, delta, current[0] if current else None)
+        balances.append(rows[0][0])
+        if delta != 0:
+            ledger_rows.append((item_id, delta, rows[0][0], reason, ref_type, ref_id, created_by, created_at))
+    if ledger_rows:
+        conn.executemany(
+            '''INSERT INTO inventory_movements (item_id, delta, balance_after, reason, ref_type, ref_id, created_by, created_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+            ledger_rows
+        )
+    bump_table_versions(conn, "inventory", "inventory_movements")
+    return balances
+
+def move_stock(movements, reason, created_by, ref_type=None, ref_id=None, atomic=True):
+    """
+    在一个写事务中批量应用库存变动（如扫码出入库）
+
+    Args:
+        movements: [(item_id, delta), ...]
+        reason: 变动原因
+        created_by: 操作人
+        ref_type: 关联单据类型
+        ref_id: 关联单据ID
+        atomic: True 时任一变动失败则整批回滚；False 时跳过失败的变动，其余照常提交
+
+    Returns:
+        dict: applied 为成功的变动数，balances 为成功变动后的库存，
+            rejected 为失败变动的列表（item_id、delta、reason）
+    """
+    movements = [(int(item_id), int(delta)) for item_id, delta in movements]
+    rejected, balances = [], []
+    try:
+        with DatabaseManager.write_transaction() as conn:
+            if atomic:
+                balances = apply_stock_movements(conn, movements, reason, created_by, ref_type, ref_id)
+            else:
+                # 条件 UPDATE 失败时不修改任何行，逐条应用即可跳过失败的变动
+                for movement in movements:
+                    try:
+                        balances.extend(apply_stock_movements(conn, [movement], reason, created_by, ref_type, ref_id))
+                    except StockMovementError as e:
+                        rejected.append({"item_id": e.item_id, "delta": e.delta, "reason": str(e)})
+    except StockMovementError as e:
+        return {"applied": 0, "balances": [], "rejected": [{"item_id": e.item_id, "delta": e.delta, "reason": str(e)}]}
+    except sqlite3.Error as e:
+        st.error(f"库存变动失败：{e}")
+        return {"applied": 0, "balances": [], "rejected": [
+            {"item_id": item_id, "delta": delta, "reason": f"数据库错误：{e}"} for item_id, delta in movements
+        ]}
+    return {"applied": len(balances), "balances": balances, "rejected": rejected}
 
 # 库存管理函数
 def update_inventory(item_id, new_stock, updated_by):
-    """更新库存数量"""
-    conn = DatabaseManager.get_connection()
-    cursor = conn.cursor()
+    """更新库存数量（按与当前库存的差额记一笔库存变动）"""
+    # 验证库存数量有效性
+    if new_stock < 0:
+        st.error("库存数量不能为负数")
+        return False
     
     try:
-        # 验证库存数量有效性
-        if new_stock < 0:
-            st.error("库存数量不能为负数")
-            return False
-        
-        last_updated = datetime.now().isoformat()
-        
-        # 获取当前库存信息
-        cursor.execute("SELECT current_stock FROM inventory WHERE item_id = ?", (item_id,))
-        current = cursor.fetchone()
-        if not current:
-            st.error("物品不存在或未初始化库存")
-            return False
-        
-        old_stock = current["current_stock"]
-        
-        # 更新库存
-        cursor.execute(
-            "UPDATE inventory SET current_stock = ?, last_updated = ? WHERE item_id = ?",
-            (new_stock, last_updated, item_id)
-        )
-        
-        # 记录操作日志
-        cursor.execute(
-            '''INSERT INTO operation_logs (user_id, operation_type, table_name, record_id, details, created_at) 
-             VALUES (?, ?, ?, ?, ?, ?)''',
-            (updated_by, "UPDATE", "inventory", item_id, 
-             f"库存更新：物品ID {item_id}，从 {old_stock} 到 {new_stock}", last_updated)
-        )
-        
-        conn.commit()
+        # 读取当前库存和写入变动在同一个写事务中，期间其他写操作排队，不会丢失并发更新
+        with DatabaseManager.write_transaction() as conn:
+            current = conn.execute(
+                "SELECT current_stock, min_stock FROM inventory WHERE item_id = ?", (item_id,)
+            ).fetchone()
+            if not current:
+                st.error("物品不存在或未初始化库存")
+                return False
+            
+            old_stock = current["current_stock"]
+            last_updated = datetime.now().isoformat()
+            apply_stock_movements(conn, [(item_id, new_stock - old_stock)], "库存更新", updated_by,
+                                  ref_type="update", created_at=last_updated)
+            
+            # 记录操作日志
+            log_operation(updated_by, "UPDATE", "inventory", item_id, f"库存更新：物品ID {item_id}，从 {old_stock} 到 {new_stock}", last_updated, conn=conn)
         
         # 检查是否低于最低库存
-        cursor.execute("SELECT min_stock FROM inventory WHERE item_id = ?", (item_id,))
-        min_stock = cursor.fetchone()["min_stock"]
+        min_stock = current["min_stock"]
         if new_stock < min_stock:
             st.warning(f"警告：物品ID {item_id} 的库存已低于最低库存水平 {min_stock}")
         
         st.success("库存更新成功")
         return True
     except sqlite3.Error as e:
-        conn.rollback()
         st.error(f"库存更新失败：{e}")
         return False
-    finally:
-        cursor.close()
 
 def adjust_inventory(item_id, quantity_change, reason, adjusted_by):
     """调整库存数量（增加或减少）"""
-    conn = DatabaseManager.get_connection()
-    cursor = conn.cursor()
-    
     try:
-        # 获取当前库存
-        cursor.execute("SELECT current_stock FROM inventory WHERE item_id = ?", (item_id,))
-        result = cursor.fetchone()
-        if not result:
-            st.error("物品不存在或未初始化库存")
-            return False
-        
-        current_stock = result["current_stock"]
-        new_stock = current_stock + quantity_change
-        
-        # 验证新库存有效性
-        if new_stock < 0:
-            st.error("调整后库存数量不能为负数")
-            return False
-        
-        last_updated = datetime.now().isoformat()
-        
-        # 更新库存
-        cursor.execute(
-            "UPDATE inventory SET current_stock = ?, last_updated = ? WHERE item_id = ?",
-            (new_stock, last_updated, item_id)
-        )
-        
-        # 记录操作日志
-        cursor.execute(
-            '''INSERT INTO operation_logs (user_id, operation_type, table_name, record_id, details, created_at) 
-             VALUES (?, ?, ?, ?, ?, ?)''',
-            (adjusted_by, "ADJUST", "inventory", item_id, 
-             f"库存调整：物品ID {item_id}，数量变化 {quantity_change}，原因：{reason}", last_updated)
-        )
+        # 写操作在唯一写连接上排队执行，库存增减由条件 UPDATE 在数据库内完成
+        with DatabaseManager.write_transaction() as conn:
+            last_updated = datetime.now().isoformat()
+            new_stock = apply_stock_movements(conn, [(item_id, quantity_change)], reason, adjusted_by,
+                                              ref_type="adjust", created_at=last_updated)[0]
+            
+            # 记录操作日志
+            log_operation(adjusted_by, "ADJUST", "inventory", item_id, f"库存调整：物品ID {item_id}，数量变化 {quantity_change}，原因：{reason}", last_updated, conn=conn)
         
-        conn.commit()
         st.success(f"库存调整成功：当前库存 {new_stock}")
         return True
+    except StockMovementError as e:
+        st.error("物品不存在或未初始化库存" if e.missing else "调整后库存数量不能为负数")
+        return False
     except sqlite3.Error as e:
-        conn.rollback()
         st.error(f"库存调整失败：{e}")
         return False
-    finally:
-        cursor.close()
 
-# 订单管理函数
-def create_order(order_no, customer_name, order_date, delivery_date, items, created_by):
-    """创建新订单"""
+# 库存快照与历史库存查询
+# 定期为每个物品保存一份库存快照；查询某一时刻的库存时从最近的快照出发，只需累加之后的少量流水
+SNAPSHOT_INTERVAL_HOURS = float(os.environ.get("ERP_SNAPSHOT_INTERVAL_HOURS", "24"))
+_snapshot_thread = None
+_snapshot_thread_lock = threading.Lock()
+
+def take_stock_snapshot(snapshot_at=None, interval_hours=None):
+    """
+    为所有物品保存一份当前库存快照
+
+    Args:
+        snapshot_at: 快照时间，默认当前时间
+        interval_hours: 提供时只在最近一份快照早于该间隔时才保存（在写事务内判断，多进程不会重复保存）
+
+    Returns:
+        int: 保存的快照行数（未到期为0）
+    """
+    with DatabaseManager.write_transaction() as conn:
+        # 快照时间在写事务内取得，之后提交的流水时间都不早于该快照
+        snapshot_at = snapshot_at or datetime.now()
+        if interval_hours is not None:
+            last = conn.execute("SELECT MAX(snapshot_at) FROM inventory_snapshots").fetchone()[0]
+            if last and datetime.fromisoformat(last) > snapshot_at - timedelta(hours=interval_hours):
+                return 0
+        # 记录快照时流水表的最大ID，历史查询按流水ID而不是时间衔接，避免同一时刻的流水被重复或遗漏
+        cursor = conn.execute(
+            '''INSERT OR IGNORE INTO inventory_snapshots (item_id, snapshot_at, stock, last_movement_id)
+               SELECT item_id, ?, current_stock, (SELECT COALESCE(MAX(movement_id), 0) FROM inventory_movements)
+               FROM inventory''',
+            (snapshot_at.isoformat(),)
+        )
+        bump_table_versions(conn, "inventory_snapshots")
+        return cursor.rowcount
+
+def _snapshot_loop():
+    """后台线程：按间隔检查并保存库存快照"""
+    while True:
+        try:
+            take_stock_snapshot(interval_hours=SNAPSHOT_INTERVAL_HOURS)
+        except sqlite3.Error:
+            # 数据库暂时不可用时等待下一轮
+            pass
+        time.sleep(max(60.0, min(SNAPSHOT_INTERVAL_HOURS * 3600, 3600.0)))
+
+def start_snapshot_scheduler():
+    """启动进程级库存快照线程（重复调用只启动一次）"""
+    global _snapshot_thread
+    with _snapshot_thread_lock:
+        if _snapshot_thread is None:
+            _snapshot_thread = threading.Thread(target=_snapshot_loop, name="stock-snapshot", daemon=True)
+            _snapshot_thread.start()
+
+def _as_timestamp(ts, end_of_day=True):
+    """把日期或时间转换为ISO字符串；只给日期时取当天结束（或开始）时刻"""
+    if isinstance(ts, str):
+        ts = datetime.fromisoformat(ts)
+    if not isinstance(ts, datetime):
+        ts = datetime.combine(ts, datetime.max.time() if end_of_day else datetime.min.time())
+    return ts.isoformat()
+
+def get_stock_as_of(item_id, ts):
+    """
+    查询物品在某一时刻的库存
+
+    从该时刻之前最近的快照出发，加上快照之后、该时刻之前的流水变动；
+    该时刻早于所有快照时，从之后最近的快照（没有则为当前库存）倒推。
+    快照和流水都按 (item_id, 时间) 索引定位，只读取快照与查询时刻之间的流水，耗时与历史长度无关。
+
+    Args:
+        item_id: 物品ID
+        ts: 查询时刻（datetime、date 或 ISO 字符串；date 表示当天结束时的库存）
+
+    Returns:
+        int: 库存数量，物品不存在返回 None
+    """
+    ts = _as_timestamp(ts)
     conn = DatabaseManager.get_connection()
-    cursor = conn.cursor()
+    snapshot = conn.execute(
+        '''SELECT stock, snapshot_at, last_movement_id FROM inventory_snapshots
+           WHERE item_id = ? AND snapshot_at <= ?
+           ORDER BY snapshot_at DESC LIMIT 1''',
+        (item_id, ts)
+    ).fetchone()
+    if snapshot is not None:
+        # 时间下界让索引从快照处开始扫描；同一时刻的流水按流水ID区分是否已计入快照
+        delta = conn.execute(
+            '''SELECT COALESCE(SUM(delta), 0) FROM inventory_movements
+               WHERE item_id = ? AND created_at >= ? AND created_at <= ? AND movement_id > ?''',
+            (item_id, snapshot["snapshot_at"], ts, snapshot["last_movement_id"])
+        ).fetchone()[0]
+        return snapshot["stock"] + delta
     
+    # 早于所有快照：从之后最近的快照倒推
+    snapshot = conn.execute(
+        '''SELECT stock, snapshot_at, last_movement_id FROM inventory_snapshots
+           WHERE item_id = ? AND snapshot_at > ?
+           ORDER BY snapshot_at LIMIT 1''',
+        (item_id, ts)
+    ).fetchone()
+    if snapshot is None:
+        current = conn.execute("SELECT current_stock FROM inventory WHERE item_id = ?", (item_id,)).fetchone()
+        if current is None:
+            return None
+        base, snapshot_at, last_movement_id = current[0], None, None
+    else:
+        base, snapshot_at, last_movement_id = snapshot["stock"], snapshot["snapshot_at"], snapshot["last_movement_id"]
+    delta = conn.execute(
+        '''SELECT COALESCE(SUM(delta), 0) FROM inventory_movements
+           WHERE item_id = ? AND created_at > ?
+             AND (? IS NULL OR (created_at <= ? AND movement_id <= ?))''',
+        (item_id, ts, last_movement_id, snapshot_at, last_movement_id)
+    ).fetchone()[0]
+    return base - delta
+
+def get_stock_movements(item_id, start=None, end=None, limit=500):
+    """
+    查询物品的库存变动流水（按时间倒序）
+
+    Returns:
+        DataFrame: created_at, delta, balance_after, reason, ref_type, ref_id, created_by
+    """
+    clauses, params = ["item_id = ?"], [item_id]
+    if start is not None:
+        clauses.append("created_at >= ?")
+        params.append(_as_timestamp(start, end_of_day=False))
+    if end is not None:
+        clauses.append("created_at <= ?")
+        params.append(_as_timestamp(end))
+    params.append(limit)
     try:
-        # 验证订单号是否已存在
-        cursor.execute("SELECT order_id FROM orders WHERE order_no = ?", (order_no,))
-        if cursor.fetchone():
-            st.error("订单号已存在")
-            return False
-        
-        # 计算订单总金额
-        total_amount = sum(item["quantity"] * item["unit_price"] for item in items)
-        created_at = datetime.now().isoformat()
-        
-        # 创建订单
-        cursor.execute(
-            '''INSERT INTO orders (order_no, customer_name, order_date, delivery_date, status, total_amount, created_by, created_at) 
-             VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
-            (order_no, customer_name, order_date, delivery_date, "pending", total_amount, created_by, created_at)
+        return pd.read_sql(
+            f'''SELECT created_at, delta, balance_after, reason, ref_type, ref_id, created_by
+                FROM inventory_movements WHERE {" AND ".join(clauses)}
+                ORDER BY created_at DESC, movement_id DESC LIMIT ?''',
+            DatabaseManager.get_connection(), params=params
         )
-        order_id = cursor.lastrowid
-        
-        # 添加订单物品
-        for item in items:
-            # 更新库存
-            cursor.execute(
-                "UPDATE inventory SET current_stock = current_stock - ?, last_updated = ? WHERE item_id = ?",
-                (item["quantity"], created_at, item["item_id"])
-            )
+    except sqlite3.Error as e:
+        st.error(f"加载库存流水失败：{e}")
+        return pd.DataFrame()
+
+# 订单管理函数
+def create_order(order_no, customer_name, order_date, delivery_date, items, created_by):
+    """创建新订单"""
+    try:
+        # 写操作在唯一写连接上排队执行，库存不足时整个订单回滚
+        with DatabaseManager.write_transaction() as conn:
+            cursor = conn.cursor()
             
-            # 检查库存是否足够
+            # 验证订单号是否已存在
+            cursor.execute("SELECT order_id FROM orders WHERE order_no = ?", (order_no,))
+            if cursor.fetchone():
+                st.error("订单号已存在")
+                return False
+            
+            # 计算订单总金额
+            total_amount = sum(item["quantity"] * item["unit_price"] for item in items)
+            created_at = datetime.now().isoformat()
+            
+            # 创建订单
             cursor.execute(
-                "SELECT current_stock FROM inventory WHERE item_id = ? AND current_stock < 0",
-                (item["item_id"],)
+                '''INSERT INTO orders (order_no, customer_name, order_date, delivery_date, status, total_amount, created_by, created_at) 
+                 VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                (order_no, customer_name, order_date, delivery_date, "pending", total_amount, created_by, created_at)
             )
-            if cursor.fetchone():
-                raise sqlite3.Error(f"物品 {item['item_name']} 库存不足")
+            order_id = cursor.lastrowid
+            
+            # 扣减库存（任一物品库存不足时抛出异常，整个订单回滚）
+            try:
+                apply_stock_movements(conn, [(item["item_id"], -item["quantity"]) for item in items],
+                                      "订单出库", created_by, ref_type="order", ref_id=order_id, created_at=created_at)
+            except StockMovementError as e:
+                if e.missing:
+                    raise
+                item_name = next((item.get("item_name") for item in items if int(item["item_id"]) == e.item_id), e.item_id)
+                raise sqlite3.Error(f"物品 {item_name} 库存不足") from e
             
             # 添加订单物品
-            cursor.execute(
-            '''INSERT INTO order_items (order_id, item_id, quantity, unit_price, subtotal) 
-             VALUES (?, ?, ?, ?, ?)''',
-            (order_id, item["item_id"], item["quantity"], item["unit_price"], 
-             item["quantity"] * item["unit_price"])
-        )
-        
-        # 记录操作日志
-        cursor.execute(
-            '''INSERT INTO operation_logs (user_id, operation_type, table_name, record_id, details, created_at) 
-             VALUES (?, ?, ?, ?, ?, ?)''',
-            (created_by, "INSERT", "orders", order_id, f"创建订单：{order_no}", created_at)
-        )
+            cursor.executemany(
+                '''INSERT INTO order_items (order_id, item_id, quantity, unit_price, subtotal) 
+                 VALUES (?, ?, ?, ?, ?)''',
+                [(order_id, item["item_id"], item["quantity"], item["unit_price"], item["quantity"] * item["unit_price"])
+                 for item in items]
+            )
+            
+            bump_table_versions(conn, "orders", "order_items", "inventory")
+            
+            # 记录操作日志
+            log_operation(created_by, "INSERT", "orders", order_id, f"创建订单：{order_no}", created_at, conn=conn)
         
-        conn.commit()
         st.success("订单创建成功")
         return True
     except sqlite3.Error as e:
-        conn.rollback()
         st.error(f"创建订单失败：{e}")
         return False
-    finally:
-        cursor.close()
+
+def create_orders_bulk(orders, created_by):
+    """
+    批量创建订单：按物品汇总需求、一次查询校验库存、一条语句集合式扣减库存
+    
+    Args:
+        orders: 订单列表，每个订单为字典，包含 order_no、customer_name、order_date、
+            delivery_date 和 items（每项包含 item_id、quantity、unit_price）
+        created_by: 创建人
+        
+    Returns:
+        dict: {"created": [成功的订单号], "rejected": [{"order_no": 订单号, "reason": 原因}]}
+    """
+    created, rejected = [], []
+    if not orders:
+        return {"created": created, "rejected": rejected}
+    
+    # 批次内重复、空明细、数量非法的订单直接拒绝
+    seen = set()
+    candidates = []
+    for order in orders:
+        order_no = order["order_no"]
+        if order_no in seen:
+            rejected.append({"order_no": order_no, "reason": "批次内订单号重复"})
+        elif not order.get("items"):
+            rejected.append({"order_no": order_no, "reason": "订单没有物品"})
+        elif any(item["quantity"] <= 0 for item in order["items"]):
+            rejected.append({"order_no": order_no, "reason": "物品数量必须大于0"})
+        else:
+            seen.add(order_no)
+            # 统一为Python类型（调用方可能传入DataFrame中的numpy数值，json.dumps无法序列化）
+            candidates.append(dict(order, order_no=str(order_no), items=[
+                dict(item, item_id=int(item["item_id"]), quantity=int(item["quantity"]), unit_price=float(item["unit_price"]))
+                for item in order["items"]
+            ]))
+    
+    try:
+        with DatabaseManager.write_transaction() as conn:
+            cursor = conn.cursor()
+            # 创建时间在写事务内取得，库存流水时间不早于之前的库存快照
+            created_at = datetime.now().isoformat()
+            
+            # 一次查询找出数据库中已存在的订单号
+            cursor.execute(
+                "SELECT order_no FROM orders WHERE order_no IN (SELECT value FROM json_each(?))",
+                (json.dumps([order["order_no"] for order in candidates]),)
+            )
+            existing = {row["order_no"] for row in cursor.fetchall()}
+            
+            # 一次查询获取所有涉及物品的当前库存
+            item_ids = sorted({item["item_id"] for order in candidates for item in order["items"]})
+            cursor.execute(
+                "SELECT item_id, current_stock FROM inventory WHERE item_id IN (SELECT value FROM json_each(?))",
+                (json.dumps(item_ids),)
+            )
+            available = {row["item_id"]: row["current_stock"] for row in cursor.fetchall()}
+            
+            # 按提交顺序逐单分配库存，库存不足的订单被拒绝而不影响其他订单
+            accepted = []
+            demand = {}
+            for order in candidates:
+                if order["order_no"] in existing:
+                    rejected.append({"order_no": order["order_no"], "reason": "订单号已存在"})
+                    continue
+                needed = {}
+                for item in order["items"]:
+                    needed[item["item_id"]] = needed.get(item["item_id"], 0) + item["quantity"]
+                missing = [item_id for item_id in needed if item_id not in available]
+                if missing:
+                    rejected.append({"order_no": order["order_no"], "reason": f"物品不存在或未初始化库存：{missing}"})
+                    continue
+                short = [item_id for item_id, qty in needed.items() if available[item_id] < qty]
+                if short:
+                    rejected.append({"order_no": order["order_no"], "reason": f"物品库存不足：{short}"})
+                    continue
+                movements = []
+                for item_id, qty in needed.items():
+                    available[item_id] -= qty
+                    demand[item_id] = demand.get(item_id, 0) + qty
+                    movements.append((item_id, -qty, available[item_id]))
+                accepted.append((order, movements))
+            
+            if not accepted:
+                return {"created": created, "rejected": rejected}
+            
+            # 一条语句集合式扣减所有物品的库存
+            cursor.execute(
+                '''WITH demand(item_id, quantity) AS (
+                       SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]') FROM json_each(?)
+                   )
+                   UPDATE inventory
+                   SET current_stock = current_stock - (SELECT quantity FROM demand WHERE demand.item_id = inventory.item_id),
+                       last_updated = ?
+                   WHERE item_id IN (SELECT item_id FROM demand)''',
+                (json.dumps(list(demand.items())), created_at)
+            )
+            
+            # 显式分配订单ID，订单和明细都用 executemany 写入（已删除订单的ID不会被重新使用）
+            next_id = next_autoincrement_id(conn, "orders", "order_id")
+            order_rows, line_rows, log_rows, movement_rows = [], [], [], []
+            for order_id, (order, movements) in enumerate(accepted, start=next_id):
+                total_amount = sum(item["quantity"] * item["unit_price"] for item in order["items"])
+                order_rows.append((
+                    order_id, order["order_no"], order["customer_name"], order["order_date"],
+                    order.get("delivery_date"), "pending", total_amount, created_by, created_at
+                ))
+                line_rows.extend(
+                    (order_id, item["item_id"], item["quantity"], item["unit_price"], item["quantity"] * item["unit_price"])
+                    for item in order["items"]
+                )
+                # 库存流水：按订单顺序分配时已算出每笔扣减后的库存
+                movement_rows.extend(
+                    (item_id, delta, balance, "订单出库", "order", order_id, created_by, created_at)
+                    for item_id, delta, balance in movements
+                )
+                log_rows.append((created_by, "INSERT", "orders", order_id, f"创建订单：{order['order_no']}", created_at))
+                created.append(order["order_no"])
+            
+            cursor.executemany(
+                '''INSERT INTO orders (order_id, order_no, customer_name, order_date, delivery_date, status, total_amount, created_by, created_at) 
+                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                order_rows
+            )
+            cursor.executemany(
+                '''INSERT INTO order_items (order_id, item_id, quantity, unit_price, subtotal) 
+                 VALUES (?, ?, ?, ?, ?)''',
+                line_rows
+            )
+            cursor.executemany(
+                '''INSERT INTO inventory_movements (item_id, delta, balance_after, reason, ref_type, ref_id, created_by, created_at)
+                 VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                movement_rows
+            )
+            bump_table_versions(conn, "orders", "order_items", "inventory", "inventory_movements")
+            get_audit_sink().record_many(log_rows, conn=conn)
+            cursor.close()
+        
+        return {"created": created, "rejected": rejected}
+    except sqlite3.Error as e:
+        st.error(f"批量创建订单失败：{e}")
+        # 事务已回滚，尚未被拒绝的订单全部视为失败
+        rejected_nos = {r["order_no"] for r in rejected}
+        return {"created": [], "rejected": rejected + [
+            {"order_no": order["order_no"], "reason": f"数据库错误：{e}"}
+            for order in candidates if order["order_no"] not in rejected_nos
+        ]}
 
 def update_order_status(order_id, new_status, updated_by):
     """更新订单状态"""
-    conn = DatabaseManager.get_connection()
-    cursor = conn.cursor()
+    # 验证状态值
+    valid_statuses = ['pending', 'processing', 'shipped', 'delivered', 'cancelled']
+    if new_status not in valid_statuses:
+        st.error(f"无效的订单状态：{new_status}。有效值：{', '.join(valid_statuses)}")
+        return False
     
     try:
-        # 验证状态值
-        valid_statuses = ['pending', 'processing', 'shipped', 'delivered', 'cancelled']
-        if new_status not in valid_statuses:
-            st.error(f"无效的订单状态：{new_status}。有效值：{', '.join(valid_statuses)}")
-            return False
-        
-        # 更新订单状态
-        updated_at = datetime.now().isoformat()
-        cursor.execute(
-            "UPDATE orders SET status = ? WHERE order_id = ?",
-            (new_status, order_id)
-        )
-        
-        if cursor.rowcount == 0:
-            st.error("订单不存在")
-            return False
-        
-        # 记录操作日志
-        cursor.execute(
-            '''INSERT INTO operation_logs (user_id, operation_type, table_name, record_id, details, created_at) 
-             VALUES (?, ?, ?, ?, ?, ?)''',
-            (updated_by, "UPDATE", "orders", order_id, f"更新订单状态为：{new_status}", updated_at)
-        )
+        # 写操作在唯一写连接上排队执行，退出时自动提交或回滚
+        with DatabaseManager.write_transaction() as conn:
+            # 更新订单状态
+            updated_at = datetime.now().isoformat()
+            cursor = conn.execute(
+                "UPDATE orders SET status = ? WHERE order_id = ?",
+                (new_status, order_id)
+            )
+            
+            if cursor.rowcount == 0:
+                st.error("订单不存在")
+                return False
+            
+            bump_table_versions(conn, "orders")
+            
+            # 记录操作日志
+            log_operation(updated_by, "UPDATE", "orders", order_id, f"更新订单状态为：{new_status}", updated_at, conn=conn)
         
-        conn.commit()
         st.success("订单状态更新成功")
         return True
     except sqlite3.Error as e:
-        conn.rollback()
         st.error(f"更新订单状态失败：{e}")
         return False
-    finally:
-        cursor.close()
 
 # 数据查询函数
 def get_low_stock_items():
@@ -463,35 +1163,29 @@ def get_low_stock_items():
         return pd.DataFrame()
 
 def get_order_statistics():
-    """获取订单统计信息"""
+    """获取订单统计信息（读取触发器维护的状态汇总表，不扫描订单表）"""
     conn = DatabaseManager.get_connection()
     cursor = conn.cursor()
     
     try:
         # 按状态统计订单数量
         cursor.execute('''
-            SELECT status, COUNT(*) as count 
-             FROM orders 
-             GROUP BY status
+            SELECT status, order_count as count 
+             FROM order_status_summary 
+             WHERE order_count > 0
              ORDER BY status
         ''')
         status_stats = cursor.fetchall()
         
-        # 统计总销售额
+        # 统计总销售额和待处理订单数量
+        totals = {row["status"]: row for row in status_stats}
         cursor.execute('''
             SELECT SUM(total_amount) as total_sales 
-             FROM orders 
+             FROM order_status_summary 
              WHERE status IN ('shipped', 'delivered')
         ''')
         total_sales = cursor.fetchone()[0] or 0
-        
-        # 统计待处理订单数量
-        cursor.execute('''
-            SELECT COUNT(*) as pending_count 
-             FROM orders 
-             WHERE status = 'pending'
-        ''')
-        pending_count = cursor.fetchone()[0]
+        pending_count = totals["pending"]["count"] if "pending" in totals else 0
         
         return {
             "status_stats": status_stats,
@@ -502,4 +1196,38 @@ def get_order_statistics():
         st.error(f"获取订单统计失败：{e}")
         return None
     finally:
-        cursor.close()
\ No newline at end of file
+        cursor.close()
+
+def get_dashboard_summary(days=90, top_n=10):
+    """
+    读取数据看板的预汇总数据
+    
+    Returns:
+        dict: daily（近 days 天每日销售）、status（各状态订单数和金额）、
+            top_items（销售额最高的物品）、top_customers（销售额最高的客户）
+    """
+    conn = DatabaseManager.get_connection()
+    try:
+        return {
+            "daily": pd.read_sql(
+                "SELECT day, order_count, total_amount FROM sales_daily ORDER BY day DESC LIMIT ?",
+                conn, params=(days,)
+            ).sort_values("day"),
+            "status": pd.read_sql(
+                "SELECT status, order_count, total_amount FROM order_status_summary WHERE order_count > 0 ORDER BY status",
+                conn
+            ),
+            "top_items": pd.read_sql(
+                '''SELECT s.item_id, it.item_name, s.quantity, s.revenue
+                   FROM item_sales_summary s JOIN items it ON it.item_id = s.item_id
+                   ORDER BY s.revenue DESC LIMIT ?''',
+                conn, params=(top_n,)
+            ),
+            "top_customers": pd.read_sql(
+                "SELECT customer_name, order_count, total_amount FROM customer_sales_summary ORDER BY total_amount DESC LIMIT ?",
+                conn, params=(top_n,)
+            ),
+        }
+    except sqlite3.Error as e:
+        st.error(f"加载看板数据失败：{e}")
+        return None
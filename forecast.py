@@ -0,0 +1,231 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+# 批量需求预测：所有物品的销售序列组成矩阵，一次向量化完成指数平滑
+DEFAULT_ALPHA = 0.2
+MAX_HORIZON = 90  # 与页面“预测天数”滑块的最大值一致
+CACHE_MAX_ENTRIES = 128
+
+
+def load_sales_matrix(conn):
+    """
+    读取库存历史并按 物品 × 日期 组成销售矩阵
+    
+    Returns:
+        tuple: (item_ids, dates, matrix)。matrix 形状为 (物品数, 天数)，
+            物品首次出现之前为 NaN，之后缺失的日期按销量0处理
+    """
+    history = pd.read_sql("SELECT item_id, date, sales FROM inventory_history", conn)
+    if history.empty:
+        return np.array([], dtype="int64"), pd.DatetimeIndex([]), np.empty((0, 0))
+    history["date"] = pd.to_datetime(history["date"], format="mixed").dt.normalize()
+    pivot = history.pivot_table(index="item_id", columns="date", values="sales", aggfunc="sum")
+    # 补齐中间缺失的日期
+    dates = pd.date_range(pivot.columns.min(), pivot.columns.max(), freq="D")
+    pivot = pivot.reindex(columns=dates)
+    matrix = pivot.to_numpy(dtype="float64")
+    started = np.maximum.accumulate(~np.isnan(matrix), axis=1)
+    matrix = np.where(started & np.isnan(matrix), 0.0, matrix)
+    return pivot.index.to_numpy(), dates, matrix
+
+
+def ses_levels(matrix, alpha=DEFAULT_ALPHA):
+    """
+    对矩阵的每一行做简单指数平滑，返回最终平滑水平（即各物品的预测值）
+    
+    按时间逐列递推，每步对所有物品同时计算；物品序列从第一个非 NaN 值开始。
+    """
+    if matrix.size == 0:
+        return np.empty(matrix.shape[0])
+    level = np.full(matrix.shape[0], np.nan)
+    for y in matrix.T:
+        observed = ~np.isnan(y)
+        level = np.where(
+            observed,
+            np.where(np.isnan(level), y, alpha * y + (1 - alpha) * level),
+            level
+        )
+    return level
+
+
+def forecast_all_items(transaction, alpha=DEFAULT_ALPHA, horizon=MAX_HORIZON, batch_size=50000):
+    """
+    为所有物品批量计算需求预测并写入 forecasts 表
+    
+    Args:
+        transaction: 返回写事务上下文管理器的函数（如 DatabaseManager.write_transaction）
+        alpha: 平滑系数
+        horizon: 预测天数
+        
+    Returns:
+        int: 完成预测的物品数
+    """
+    generated_at = datetime.now().isoformat()
+    alpha = round(float(alpha), 6)
+    with transaction() as conn:
+        item_ids, dates, matrix = load_sales_matrix(conn)
+        version = get_history_version(conn)
+        conn.execute("DELETE FROM forecasts")
+        if len(item_ids) == 0:
+            return 0
+        levels = ses_levels(matrix, alpha)
+        forecast_dates = [d.date().isoformat() for d in pd.date_range(dates[-1], periods=horizon + 1)[1:]]
+        # 简单指数平滑的预测值在整个预测期内为常数
+        rows = (
+            (int(item_id), forecast_date, float(level), alpha, generated_at, version)
+            for item_id, level in zip(item_ids, levels)
+            for forecast_date in forecast_dates
+        )
+        sql = '''INSERT INTO forecasts (item_id, forecast_date, forecast, alpha, generated_at, history_version)
+                 VALUES (?, ?, ?, ?, ?, ?)'''
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                conn.executemany(sql, batch)
+                batch = []
+        conn.executemany(sql, batch)
+    return len(item_ids)
+
+
+def get_stored_forecast_version(conn):
+    """
+    预先计算的预测结果的版本
+
+    Returns:
+        tuple: (生成时间, 平滑系数, 历史版本)，没有预测结果时返回 None
+    """
+    row = conn.execute("SELECT generated_at, alpha, history_version FROM forecasts LIMIT 1").fetchone()
+    return None if row is None else tuple(row)
+
+
+def load_forecast_totals(conn, days=MAX_HORIZON):
+    """读取预先计算的预测结果，按日期汇总所有物品的预测需求"""
+    return pd.read_sql(
+        '''SELECT forecast_date AS date, SUM(forecast) AS sales
+           FROM forecasts
+           GROUP BY forecast_date
+           ORDER BY forecast_date
+           LIMIT ?''',
+        conn, params=(days,), parse_dates=["date"]
+    )
+
+
+def load_item_forecast(conn, item_id, days=MAX_HORIZON):
+    """读取单个物品的预测结果"""
+    return pd.read_sql(
+        '''SELECT forecast_date AS date, forecast AS sales
+           FROM forecasts WHERE item_id = ?
+           ORDER BY forecast_date LIMIT ?''',
+        conn, params=(item_id, days), parse_dates=["date"]
+    )
+
+
+class ForecastCache:
+    """预测结果（读取的预先计算结果或进程内计算结果）的LRU缓存，键中包含历史数据版本，新历史数据写入后旧版本条目被清除"""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(self, key, compute):
+        """命中时返回缓存值并标记为最近使用，否则计算后写入缓存"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+        value = compute()
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def set_version(self, version):
+        """历史数据版本变化时清除旧版本的所有条目"""
+        with self._lock:
+            if version != self._version:
+                self._entries = OrderedDict(
+                    (key, value) for key, value in self._entries.items() if key[-1] == version
+                )
+                self._version = version
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._version = None
+
+
+_forecast_cache = ForecastCache()
+
+
+def get_history_version(conn):
+    """库存历史的数据版本：最新一条历史记录的ID（只在新记录写入时变化）"""
+    return conn.execute("SELECT COALESCE(MAX(id), 0) FROM inventory_history").fetchone()[0]
+
+
+def get_forecast(conn, alpha=DEFAULT_ALPHA, horizon=MAX_HORIZON, item_id=None):
+    """
+    获取需求预测（带缓存）
+
+    优先读取 forecast_all_items 预先计算的 forecasts 表：平滑系数相同且生成时的历史版本
+    与当前一致时直接使用，缓存键为 (物品, 生成时间, 历史版本)。
+    没有预先计算的结果、结果已过期或平滑系数不同时才在进程内计算，缓存键为
+    (物品, 平滑系数, 预测天数, 历史版本)。预测天数统一按最大值缓存，不同天数只截取缓存结果；
+    销售矩阵和各物品平滑水平也分别缓存，调整平滑系数时无需重新读取历史数据。
+    
+    Args:
+        conn: 数据库连接
+        alpha: 平滑系数
+        horizon: 预测天数
+        item_id: 物品ID，None 表示所有物品的汇总预测
+        
+    Returns:
+        DataFrame: date、sales 两列的预测结果
+    """
+    version = get_history_version(conn)
+    _forecast_cache.set_version(version)
+    alpha = round(float(alpha), 6)
+
+    # 预先计算的结果未过期时直接读取
+    stored = get_stored_forecast_version(conn)
+    if stored is not None:
+        generated_at, stored_alpha, stored_version = stored
+        if stored_version == version and round(stored_alpha, 6) == alpha:
+            result = _forecast_cache.get_or_compute(
+                ("forecasts", item_id, generated_at, version),
+                lambda: load_forecast_totals(conn) if item_id is None else load_item_forecast(conn, item_id)
+            )
+            if len(result) >= horizon:
+                return result.head(horizon).copy()
+
+    sales = _forecast_cache.get_or_compute(("matrix", version), lambda: load_sales_matrix(conn))
+    item_ids, dates, matrix = sales
+    if len(item_ids) == 0:
+        return pd.DataFrame({"date": pd.DatetimeIndex([]), "sales": []})
+
+    levels = _forecast_cache.get_or_compute(("levels", alpha, version), lambda: ses_levels(matrix, alpha))
+
+    def compute():
+        if item_id is None:
+            level = float(np.nansum(levels))
+        else:
+            position = np.flatnonzero(item_ids == item_id)
+            if len(position) == 0:
+                return pd.DataFrame({"date": pd.DatetimeIndex([]), "sales": []})
+            level = float(levels[position[0]])
+        forecast_dates = pd.date_range(dates[-1], periods=MAX_HORIZON + 1)[1:]
+        return pd.DataFrame({"date": forecast_dates, "sales": np.full(MAX_HORIZON, level)})
+
+    result = _forecast_cache.get_or_compute((item_id, alpha, MAX_HORIZON, version), compute)
+    return result.head(horizon).copy()
@@ -2,12 +2,12 @@ import streamlit as st
 import random
 import sqlite3
 from datetime import datetime, timedelta
-from dataset import DatabaseManager, add_item, create_order
+from dataset import (DatabaseManager, add_item, create_order, configure_database, bump_table_versions, apply_stock_movements,
+                     next_autoincrement_id)
 import string
-
-# 连接到数据库
-conn = DatabaseManager.get_connection()
-cursor = conn.cursor()
+import sys
+import time
+import argparse
 
 # 生成随机字符串的函数
 def random_string(length=10):
@@ -32,6 +32,7 @@ def generate_items(num_items=20):
     while len(item_names) < num_items:
         item_names.append(f"物品{random_string(5)}")
     
+    conn = DatabaseManager.get_connection()
     count = 0
     for i in range(num_items):
         item_name = item_names[i]
@@ -40,8 +41,7 @@ def generate_items(num_items=20):
         unit_price = round(random.uniform(1.0, 1000.0), 2)
         
         # 检查物品是否已存在
-        cursor.execute("SELECT item_id FROM items WHERE item_name = ?", (item_name,))
-        if not cursor.fetchone():
+        if not conn.execute("SELECT item_id FROM items WHERE item_name = ?", (item_name,)).fetchone():
             try:
                 # 使用现有的add_item函数添加物品
                 if add_item(item_name, description, unit, unit_price, created_by):
@@ -53,31 +53,30 @@ def generate_items(num_items=20):
 
 # 生成随机库存数据
 def generate_inventory(min_stock=10, max_stock=1000):
-    """为所有物品生成随机库存数据"""
+    """为所有物品生成随机库存数据（库存数量的变化记入库存流水）"""
     try:
-        # 获取所有物品ID
-        cursor.execute("SELECT item_id FROM items")
-        items = cursor.fetchall()
-        
-        count = 0
-        for item in items:
-            item_id = item[0]
-            current_stock = random.randint(0, max_stock)
-            min_stock = random.randint(0, 50)
-            max_stock = random.randint(100, 1000)
-            last_updated = datetime.now().isoformat()
+        with DatabaseManager.write_transaction() as conn:
+            # 获取所有已初始化库存的物品
+            items = conn.execute("SELECT item_id, current_stock FROM inventory").fetchall()
             
-            # 更新库存
-            cursor.execute(
-                "UPDATE inventory SET current_stock = ?, min_stock = ?, max_stock = ?, last_updated = ? WHERE item_id = ?",
-                (current_stock, min_stock, max_stock, last_updated, item_id)
-            )
-            count += 1
-        
-        conn.commit()
-        return count
+            movements = []
+            for item_id, old_stock in items:
+                current_stock = random.randint(0, max_stock)
+                min_stock = random.randint(0, 50)
+                max_stock = random.randint(100, 1000)
+                last_updated = datetime.now().isoformat()
+                
+                # 更新库存上下限，库存数量按差额记为库存变动
+                conn.execute(
+                    "UPDATE inventory SET min_stock = ?, max_stock = ?, last_updated = ? WHERE item_id = ?",
+                    (min_stock, max_stock, last_updated, item_id)
+                )
+                movements.append((item_id, current_stock - old_stock))
+            
+            apply_stock_movements(conn, movements, "生成库存数据", "admin", ref_type="init")
+            bump_table_versions(conn, "inventory")
+        return len(items)
     except sqlite3.Error as e:
-        conn.rollback()
         st.error(f"生成库存数据失败: {e}")
         return 0
 
@@ -103,8 +102,8 @@ def generate_orders(num_orders=30):
     """生成随机订单数据"""
     try:
         # 获取所有物品
-        cursor.execute("SELECT item_id, item_name, unit_price FROM items")
-        items = cursor.fetchall()
+        conn = DatabaseManager.get_connection()
+        items = conn.execute("SELECT item_id, item_name, unit_price FROM items").fetchall()
         
         if not items:
             st.error("请先生成物品数据")
@@ -118,8 +117,7 @@ def generate_orders(num_orders=30):
             # 生成唯一的订单号
             while True:
                 order_no = f"ORD-{random_string(8)}"
-                cursor.execute("SELECT order_id FROM orders WHERE order_no = ?", (order_no,))
-                if not cursor.fetchone():
+                if not conn.execute("SELECT order_id FROM orders WHERE order_no = ?", (order_no,)).fetchone():
                     break
             
             customer_name = random.choice(customer_names)
@@ -154,7 +152,6 @@ def generate_orders(num_orders=30):
         
         return count
     except Exception as e:
-        conn.rollback()
         st.error(f"生成订单数据失败: {e}")
         return 0
 
@@ -164,22 +161,21 @@ def update_order_statuses():
     try:
         statuses = ['pending', 'processing', 'shipped', 'delivered', 'cancelled']
         
-        # 获取所有订单ID
-        cursor.execute("SELECT order_id FROM orders")
-        orders = cursor.fetchall()
-        
-        count = 0
-        for order in orders:
-            order_id = order[0]
-            status = random.choice(statuses)
+        with DatabaseManager.write_transaction() as conn:
+            # 获取所有订单ID
+            orders = conn.execute("SELECT order_id FROM orders").fetchall()
             
-            cursor.execute("UPDATE orders SET status = ? WHERE order_id = ?", (status, order_id))
-            count += 1
-        
-        conn.commit()
+            count = 0
+            for order in orders:
+                order_id = order[0]
+                status = random.choice(statuses)
+                
+                conn.execute("UPDATE orders SET status = ? WHERE order_id = ?", (status, order_id))
+                count += 1
+            
+            bump_table_versions(conn, "orders")
         return count
     except sqlite3.Error as e:
-        conn.rollback()
         st.error(f"更新订单状态失败: {e}")
         return 0
 
@@ -192,25 +188,24 @@ def generate_machines(num_machines=15):
     created_at = datetime.now().isoformat()
     
     try:
-        count = 0
-        for i in range(num_machines):
-            machine_name = f"{random.choice(machine_types)}-{random_string(4)}"
-            status = random.choice(statuses)
-            capacity = round(random.uniform(100.0, 1000.0), 2)
+        with DatabaseManager.write_transaction() as conn:
+            count = 0
+            for i in range(num_machines):
+                machine_name = f"{random.choice(machine_types)}-{random_string(4)}"
+                status = random.choice(statuses)
+                capacity = round(random.uniform(100.0, 1000.0), 2)
+                
+                # 检查设备是否已存在
+                if not conn.execute("SELECT id FROM machines WHERE machine_name = ?", (machine_name,)).fetchone():
+                    conn.execute(
+                        "INSERT INTO machines (machine_name, status, capacity, created_at) VALUES (?, ?, ?, ?)",
+                        (machine_name, status, capacity, created_at)
+                    )
+                    count += 1
             
-            # 检查设备是否已存在
-            cursor.execute("SELECT id FROM machines WHERE machine_name = ?", (machine_name,))
-            if not cursor.fetchone():
-                cursor.execute(
-                    "INSERT INTO machines (machine_name, status, capacity, created_at) VALUES (?, ?, ?, ?)",
-                    (machine_name, status, capacity, created_at)
-                )
-                count += 1
-        
-        conn.commit()
+            bump_table_versions(conn, "machines")
         return count
     except sqlite3.Error as e:
-        conn.rollback()
         st.error(f"生成设备数据失败: {e}")
         return 0
 
@@ -218,41 +213,38 @@ def generate_machines(num_machines=15):
 def generate_production_plans():
     """生成生产计划数据"""
     try:
-        # 获取所有订单ID和设备ID
-        cursor.execute("SELECT order_id FROM orders WHERE status IN ('pending', 'processing')")
-        orders = cursor.fetchall()
-        
-        cursor.execute("SELECT id FROM machines WHERE status = '可用'")
-        machines = cursor.fetchall()
-        
-        if not orders or not machines:
-            st.error("没有待处理订单或可用设备")
-            return 0
-        
-        count = 0
-        for order in orders:
-            order_id = order[0]
-            machine = random.choice(machines)
-            machine_id = machine[0]
+        with DatabaseManager.write_transaction() as conn:
+            # 获取所有订单ID和设备ID
+            orders = conn.execute("SELECT order_id FROM orders WHERE status IN ('pending', 'processing')").fetchall()
+            machines = conn.execute("SELECT id FROM machines WHERE status = '可用'").fetchall()
             
-            # 生成随机时间
-            start_time = datetime.now() + timedelta(hours=random.randint(0, 48))
-            end_time = start_time + timedelta(hours=random.randint(1, 24))
+            if not orders or not machines:
+                st.error("没有待处理订单或可用设备")
+                return 0
             
-            try:
-                cursor.execute(
-                    "INSERT INTO production_plan (order_id, machine_id, start_time, end_time) VALUES (?, ?, ?, ?)",
-                    (order_id, machine_id, start_time.isoformat(), end_time.isoformat())
-                )
-                count += 1
-            except sqlite3.IntegrityError:
-                # 如果已存在，则跳过
-                continue
-        
-        conn.commit()
+            count = 0
+            for order in orders:
+                order_id = order[0]
+                machine = random.choice(machines)
+                machine_id = machine[0]
+                
+                # 生成随机时间
+                start_time = datetime.now() + timedelta(hours=random.randint(0, 48))
+                end_time = start_time + timedelta(hours=random.randint(1, 24))
+                
+                try:
+                    conn.execute(
+                        "INSERT INTO production_plan (order_id, machine_id, start_time, end_time) VALUES (?, ?, ?, ?)",
+                        (order_id, machine_id, start_time.isoformat(), end_time.isoformat())
+                    )
+                    count += 1
+                except sqlite3.IntegrityError:
+                    # 如果已存在，则跳过
+                    continue
+            
+            bump_table_versions(conn, "production_plan")
         return count
     except sqlite3.Error as e:
-        conn.rollback()
         st.error(f"生成生产计划失败: {e}")
         return 0
 
@@ -319,5 +311,277 @@ def gen_data_page():
             production_plans=include_production_plans
         )
 
+# ---------------------------------------------------------------------------
+# 批量数据生成（压测用）：executemany 分批写入，每张表一个事务，可在命令行运行
+# ---------------------------------------------------------------------------
+
+BULK_STATUSES = ['pending', 'processing', 'shipped', 'delivered', 'cancelled']
+BULK_UNITS = ["个", "件", "箱", "千克", "米", "升", "套", "组"]
+BULK_MACHINE_TYPES = ["车床", "铣床", "磨床", "钻床", "镗床", "冲床", "剪板机", "折弯机"]
+
+
+def _batched(rows, batch_size):
+    """把行生成器切分成固定大小的批次"""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _bulk_insert(conn, sql, rows, batch_size):
+    """在当前事务中分批 executemany 插入，返回插入行数"""
+    cursor = conn.cursor()
+    count = 0
+    try:
+        for batch in _batched(rows, batch_size):
+            cursor.executemany(sql, batch)
+            count += len(batch)
+    finally:
+        cursor.close()
+    return count
+
+
+def bulk_generate(num_items=1000, num_orders=100000, num_machines=50, max_lines_per_order=5,
+                  seed=42, batch_size=50000, days=365, history_days=0, report=print):
+    """
+    批量生成物品、库存、订单、订单明细、设备、生产计划和库存历史
+    
+    Args:
+        num_items: 物品数量
+        num_orders: 订单数量
+        num_machines: 设备数量
+        max_lines_per_order: 每个订单的最大明细行数
+        seed: 随机种子，相同种子生成相同数据
+        batch_size: 每次 executemany 的行数
+        days: 订单日期分布的天数范围
+        history_days: 每个物品生成的每日库存历史天数（0 表示不生成）
+        report: 进度输出函数（命令行为print，页面可传入st.write）
+        
+    Returns:
+        dict: 各表生成的行数、耗时和每秒行数
+    """
+    rng = random.Random(seed)
+    now = datetime.now()
+    created_at = now.isoformat()
+    stats = {}
+
+    def timed(table, func):
+        started = time.perf_counter()
+        with DatabaseManager.write_transaction() as conn:
+            rows = func(conn)
+            bump_table_versions(conn, *table.split("+"))
+        elapsed = time.perf_counter() - started
+        stats[table] = {
+            "rows": rows,
+            "seconds": round(elapsed, 3),
+            "rows_per_sec": round(rows / elapsed) if elapsed > 0 else rows,
+        }
+        report(f"{table}: {rows} 行，耗时 {elapsed:.2f}s，{stats[table]['rows_per_sec']} 行/秒")
+
+    # 物品与库存（名称带起始ID前缀，保证与已有数据不冲突）
+    item_state = {}
+
+    def gen_items(conn):
+        start = next_autoincrement_id(conn, "items", "item_id")
+        item_state["ids"] = list(range(start, start + num_items))
+        item_state["prices"] = [round(rng.uniform(1.0, 1000.0), 2) for _ in range(num_items)]
+        rows = (
+            (item_id, f"物品-{item_id:07d}", f"物品-{item_id:07d} - 批量生成", rng.choice(BULK_UNITS),
+             item_state["prices"][i], created_at)
+            for i, item_id in enumerate(item_state["ids"])
+        )
+        return _bulk_insert(
+            conn,
+            "INSERT INTO items (item_id, item_name, description, unit, unit_price, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            rows, batch_size
+        )
+
+    def gen_inventory(conn):
+        rows = (
+            (item_id, rng.randint(0, 1000), rng.randint(0, 50), rng.randint(100, 1000), created_at)
+            for item_id in item_state["ids"]
+        )
+        return _bulk_insert(
+            conn,
+            "INSERT INTO inventory (item_id, current_stock, min_stock, max_stock, last_updated) VALUES (?, ?, ?, ?, ?)",
+            rows, batch_size
+        )
+
+    # 期初库存流水：快照加流水才能还原生成数据的历史库存
+    def gen_opening_movements(conn):
+        return conn.execute(
+            '''INSERT INTO inventory_movements (item_id, delta, balance_after, reason, ref_type, ref_id, created_by, created_at)
+               SELECT item_id, current_stock, current_stock, '期初库存', 'init', NULL, 'admin', ?
+               FROM inventory WHERE item_id BETWEEN ? AND ? AND current_stock != 0''',
+            (datetime.now().isoformat(), item_state["ids"][0], item_state["ids"][-1])
+        ).rowcount
+
+    timed("items", gen_items)
+    timed("inventory", gen_inventory)
+    if num_items > 0:
+        timed("inventory_movements", gen_opening_movements)
+
+    # 订单与订单明细：按批生成，先算出每批明细再汇总订单金额；订单ID显式分配，避免逐行取 lastrowid
+    # 客户名称不使用全局随机数，保证相同种子生成相同数据
+    customer_names = generate_customer_names(0) + [f"客户-{i:05d}" for i in range(1000)]
+    order_state = {}
+
+    def gen_orders(conn):
+        start = next_autoincrement_id(conn, "orders", "order_id")
+        order_state["start"] = start
+        item_ids = item_state["ids"]
+        prices = item_state["prices"]
+        cursor = conn.cursor()
+        line_count = 0
+        try:
+            for batch_start in range(0, num_orders, batch_size):
+                orders, lines = [], []
+                for order_id in range(start + batch_start, start + min(batch_start + batch_size, num_orders)):
+                    total = 0.0
+                    for _ in range(rng.randint(1, max_lines_per_order)):
+                        idx = rng.randrange(num_items)
+                        quantity = rng.randint(1, 100)
+                        subtotal = round(quantity * prices[idx], 2)
+                        total += subtotal
+                        lines.append((order_id, item_ids[idx], quantity, prices[idx], subtotal))
+                    order_date = now - timedelta(days=rng.randint(0, days), minutes=rng.randint(0, 1439))
+                    delivery_date = order_date + timedelta(days=rng.randint(1, 15))
+                    due_date = delivery_date + timedelta(days=rng.randint(0, 5))
+                    orders.append((
+                        order_id, f"BULK-{seed}-{order_id:09d}", rng.choice(customer_names),
+                        order_date.isoformat(), delivery_date.isoformat(), due_date.isoformat(),
+                        rng.randint(1, 5), rng.choice(BULK_STATUSES), round(total, 2), "admin", created_at
+                    ))
+                cursor.executemany(
+                    '''INSERT INTO orders (order_id, order_no, customer_name, order_date, delivery_date, due_date,
+                     processing_time, status, total_amount, created_by, created_at)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                    orders
+                )
+                cursor.executemany(
+                    "INSERT INTO order_items (order_id, item_id, quantity, unit_price, subtotal) VALUES (?, ?, ?, ?, ?)",
+                    lines
+                )
+                line_count += len(lines)
+        finally:
+            cursor.close()
+        order_state["lines"] = line_count
+        return num_orders + line_count
+
+    if num_orders > 0 and num_items > 0:
+        timed("orders+order_items", gen_orders)
+
+    # 设备
+    machine_state = {}
+
+    def gen_machines(conn):
+        start = next_autoincrement_id(conn, "machines", "id")
+        machine_state["ids"] = list(range(start, start + num_machines))
+        machine_state["status"] = [rng.choices(["可用", "维修中", "停用"], weights=[8, 1, 1])[0]
+                                   for _ in range(num_machines)]
+        rows = (
+            (machine_id, f"{rng.choice(BULK_MACHINE_TYPES)}-{machine_id:05d}", machine_state["status"][i],
+             round(rng.uniform(100.0, 1000.0), 2), created_at)
+            for i, machine_id in enumerate(machine_state["ids"])
+        )
+        return _bulk_insert(
+            conn,
+            "INSERT INTO machines (id, machine_name, status, capacity, created_at) VALUES (?, ?, ?, ?, ?)",
+            rows, batch_size
+        )
+
+    if num_machines > 0:
+        timed("machines", gen_machines)
+
+    # 生产计划：待处理/处理中的订单随机分配到可用设备
+    def gen_plans(conn):
+        available = [m for m, status in zip(machine_state["ids"], machine_state["status"]) if status == "可用"]
+        if not available:
+            return 0
+        cursor = conn.execute(
+            "SELECT order_id FROM orders WHERE order_id >= ? AND status IN ('pending', 'processing')",
+            (order_state["start"],)
+        )
+
+        def rows():
+            for (order_id,) in cursor:
+                start_time = now + timedelta(hours=rng.randint(0, 48))
+                end_time = start_time + timedelta(hours=rng.randint(1, 24))
+                yield (order_id, rng.choice(available), start_time.isoformat(), end_time.isoformat())
+
+        # 先物化查询结果，避免在同一连接上边读边写
+        plan_rows = list(rows())
+        return _bulk_insert(
+            conn,
+            "INSERT OR IGNORE INTO production_plan (order_id, machine_id, start_time, end_time) VALUES (?, ?, ?, ?)",
+            plan_rows, batch_size
+        )
+
+    if num_machines > 0 and "start" in order_state:
+        timed("production_plan", gen_plans)
+
+    # 库存历史：每个物品最近 history_days 天的每日销量与库存
+    def gen_history(conn):
+        today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        rows = (
+            (item_id, (today - timedelta(days=day)).isoformat(), rng.randint(0, 50),
+             rng.randint(0, 1000), rng.randint(0, 50))
+            for item_id in item_state["ids"]
+            for day in range(history_days, 0, -1)
+        )
+        return _bulk_insert(
+            conn,
+            "INSERT INTO inventory_history (item_id, date, sales, current_stock, safety_stock) VALUES (?, ?, ?, ?, ?)",
+            rows, batch_size
+        )
+
+    if history_days > 0 and num_items > 0:
+        timed("inventory_history", gen_history)
+
+    total_rows = sum(s["rows"] for s in stats.values())
+    total_seconds = sum(s["seconds"] for s in stats.values())
+    stats["total"] = {
+        "rows": total_rows,
+        "seconds": round(total_seconds, 3),
+        "rows_per_sec": round(total_rows / total_seconds) if total_seconds > 0 else total_rows,
+    }
+    report(f"合计：{total_rows} 行，耗时 {total_seconds:.2f}s，{stats['total']['rows_per_sec']} 行/秒")
+    return stats
+
+
+def main(argv=None):
+    """命令行入口：python gen_data.py --orders 1000000 --seed 42"""
+    parser = argparse.ArgumentParser(description="批量生成模拟数据（无需启动Streamlit）")
+    parser.add_argument("--db", default=None, help="数据库文件路径（默认 factory.db）")
+    parser.add_argument("--items", type=int, default=1000, help="物品数量")
+    parser.add_argument("--orders", type=int, default=100000, help="订单数量")
+    parser.add_argument("--machines", type=int, default=50, help="设备数量")
+    parser.add_argument("--max-lines", type=int, default=5, help="每个订单的最大明细行数")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--batch-size", type=int, default=50000, help="每批写入行数")
+    parser.add_argument("--history-days", type=int, default=0, help="每个物品生成的库存历史天数")
+    args = parser.parse_args(argv)
+
+    if args.db:
+        configure_database(args.db)
+    DatabaseManager.init_database()
+    return bulk_generate(
+        num_items=args.items,
+        num_orders=args.orders,
+        num_machines=args.machines,
+        max_lines_per_order=args.max_lines,
+        seed=args.seed,
+        batch_size=args.batch_size,
+        history_days=args.history_days,
+    )
+
 if __name__ == "__main__":
-    gen_data_page()
\ No newline at end of file
+    # 带参数时按命令行批量生成，否则作为Streamlit页面运行
+    if len(sys.argv) > 1:
+        main()
+    else:
+        gen_data_page()
@@ -1,13 +1,41 @@
+import importlib
 import streamlit as st
 from rights import hide_unauthorized_pages, display_user_info, login_page
-import view
-import update
-import add_data
-import sec
-import gen_data
+from dataset import DatabaseManager, start_snapshot_scheduler
+from sql_profiler import set_current_page
+from page_profiler import run_page
+
+# 页面 -> (模块, 页面函数)
+# 页面模块在首次选中时才导入（之后由 sys.modules 缓存），冷启动和登录页不加载 plotly、AgGrid 等依赖
+PAGE_HANDLERS = {
+    "生产计划": ("view", "production_plan_page"),
+    "库存管理": ("update", "inventory_management_page"),
+    "员工管理": ("rights", "user_management"),
+    "数据看板": ("dashboard", "dashboard_page"),
+    "物品管理": ("add_data", "item_management_page"),
+    "订单管理": ("add_data", "order_management_page"),
+    "修改密码": ("sec", "change_password_page"),
+    "生成模拟数据": ("gen_data", "gen_data_page"),
+    "SQL性能": ("sql_profiler", "sql_profile_page"),
+    "性能分析": ("page_profiler", "page_profile_page"),
+}
+
+def render_page(page):
+    """导入页面所在模块并渲染页面"""
+    module_name, func_name = PAGE_HANDLERS[page]
+    # 本次渲染执行的SQL归入该页面统计
+    set_current_page(page)
+    module = importlib.import_module(module_name)
+    # 开启页面性能分析时记录渲染耗时和函数调用情况
+    run_page(page, st.session_state.get("user"), getattr(module, func_name))
 
 st.set_page_config(page_title="SmartFactory ERP", layout="wide")
 
+# 执行数据库迁移（每个进程只执行一次）
+DatabaseManager.init_database()
+# 后台定期保存库存快照，供历史库存查询使用
+start_snapshot_scheduler()
+
 # 检查登录状态
 if "logged_in" not in st.session_state or not st.session_state.logged_in:
     login_page()
@@ -30,27 +58,10 @@ else:
     elif user_role == "inventory":
         pages = ["库存管理", "物品管理", "修改密码"]
     elif user_role == "admin":
-        pages = ["生产计划", "员工管理", "库存管理", "物品管理", "订单管理", "数据看板", "生成模拟数据", "修改密码"]
+        pages = ["生产计划", "员工管理", "库存管理", "物品管理", "订单管理", "数据看板", "生成模拟数据", "SQL性能", "性能分析", "修改密码"]
     
     selected_page = st.sidebar.radio("选择页面", pages)
     
     # 显示当前页面内容
     st.title(selected_page)
-    if selected_page == "生产计划":
-        # 调用view.py中的生产计划控制面板
-        view.production_plan_page()
-    elif selected_page == "库存管理":
-        update.inventory_management_page()
-    elif selected_page == "员工管理":
-        from rights import user_management
-        user_management()
-    elif selected_page == "数据看板":
-        st.write("数据看板页面内容...")
-    elif selected_page == "物品管理":
-        add_data.item_management_page()
-    elif selected_page == "订单管理":
-        add_data.order_management_page()
-    elif selected_page == "修改密码":
-        sec.change_password_page()
-    elif selected_page == "生成模拟数据":
-        gen_data.gen_data_page()
\ No newline at end of file
+    render_page(selected_page)
\ No newline at end of file
@@ -0,0 +1,574 @@
+import sqlite3
+from datetime import datetime
+
+# 版本化数据库迁移
+# 每个迁移步骤为 (版本号, 说明, 执行函数)，按版本号顺序执行且只执行一次。
+# 新增表结构或索引时，在 MIGRATIONS 末尾追加新步骤，不要修改已发布的步骤。
+
+
+def _column_exists(cursor, table, column):
+    """检查表中是否存在指定列"""
+    cursor.execute(f"PRAGMA table_info({table})")
+    return any(row[1] == column for row in cursor.fetchall())
+
+
+def _add_column_if_missing(cursor, table, column, definition):
+    """表中不存在该列时添加（兼容旧版本创建的数据库）"""
+    if not _column_exists(cursor, table, column):
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def _create_base_tables(cursor):
+    """创建基础业务表"""
+    # 创建物品表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS items (
+            item_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            item_name TEXT NOT NULL UNIQUE,
+            description TEXT,
+            unit TEXT NOT NULL,
+            unit_price REAL NOT NULL,
+            created_at TEXT NOT NULL
+        )
+    ''')
+    
+    # 创建库存表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS inventory (
+            inventory_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            item_id INTEGER NOT NULL,
+            current_stock INTEGER NOT NULL DEFAULT 0,
+            min_stock INTEGER NOT NULL DEFAULT 0,
+            max_stock INTEGER NOT NULL DEFAULT 1000,
+            last_updated TEXT NOT NULL,
+            FOREIGN KEY (item_id) REFERENCES items(item_id) ON DELETE CASCADE
+        )
+    ''')
+    
+    # 创建订单表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS orders (
+            order_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            order_no TEXT NOT NULL UNIQUE,
+            customer_name TEXT NOT NULL,
+            order_date TEXT NOT NULL,
+            delivery_date TEXT,
+            due_date TEXT,
+            processing_time INTEGER DEFAULT 0,
+            status TEXT NOT NULL DEFAULT 'pending',
+            total_amount REAL NOT NULL DEFAULT 0,
+            created_by TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        )
+    ''')
+    
+    # 创建订单详情表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS order_items (
+            order_item_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            order_id INTEGER NOT NULL,
+            item_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            unit_price REAL NOT NULL,
+            subtotal REAL NOT NULL,
+            FOREIGN KEY (order_id) REFERENCES orders(order_id) ON DELETE CASCADE,
+            FOREIGN KEY (item_id) REFERENCES items(item_id) ON DELETE CASCADE
+        )
+    ''')
+    
+    # 创建用户操作日志表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS operation_logs (
+            log_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            operation_type TEXT NOT NULL,
+            table_name TEXT NOT NULL,
+            record_id INTEGER,
+            details TEXT,
+            created_at TEXT NOT NULL
+        )
+    ''')
+    
+    # 创建设备表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS machines (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            machine_name TEXT NOT NULL UNIQUE,
+            status TEXT NOT NULL DEFAULT '可用',
+            capacity REAL NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL
+        )
+    ''')
+    
+    # 创建生产计划表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS production_plan (
+            order_id INTEGER NOT NULL,
+            machine_id INTEGER NOT NULL,
+            start_time TEXT NOT NULL,
+            end_time TEXT NOT NULL,
+            PRIMARY KEY (order_id, machine_id),
+            FOREIGN KEY (order_id) REFERENCES orders(order_id) ON DELETE CASCADE,
+            FOREIGN KEY (machine_id) REFERENCES machines(id) ON DELETE CASCADE
+        )
+    ''')
+
+
+def _add_order_scheduling_columns(cursor):
+    """补齐订单排产相关列（旧数据库缺少 due_date/processing_time，优先级列此前不存在）"""
+    _add_column_if_missing(cursor, "orders", "due_date", "TEXT")
+    _add_column_if_missing(cursor, "orders", "processing_time", "INTEGER DEFAULT 0")
+    _add_column_if_missing(cursor, "orders", "priority", "REAL")
+
+
+def _create_performance_indexes(cursor):
+    """为 WHERE/JOIN 中频繁使用的列创建索引"""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_inventory_item_id ON inventory(item_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_order_items_order_id ON order_items(order_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_order_items_item_id ON order_items(item_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(status)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_order_date ON orders(order_date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_operation_logs_created_at ON operation_logs(created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_production_plan_machine_id ON production_plan(machine_id)")
+
+
+def _create_inventory_history(cursor):
+    """创建库存历史表（库存预测页面读取的销售与库存记录）"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS inventory_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            item_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            sales INTEGER NOT NULL DEFAULT 0,
+            current_stock INTEGER NOT NULL DEFAULT 0,
+            safety_stock INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (item_id) REFERENCES items(item_id) ON DELETE CASCADE
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_inventory_history_date ON inventory_history(date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_inventory_history_item_date ON inventory_history(item_id, date)")
+
+
+def _create_plan_time_indexes(cursor):
+    """生产计划按设备+时间的索引，增量重排只需按设备定位相邻计划和设备最晚完工时间"""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_production_plan_machine_start ON production_plan(machine_id, start_time)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_production_plan_machine_end ON production_plan(machine_id, end_time)")
+
+
+def _create_forecasts(cursor):
+    """创建需求预测结果表（批量预测写入，页面直接读取；记录所依据的库存历史版本，据此判断是否过期）"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS forecasts (
+            item_id INTEGER NOT NULL,
+            forecast_date TEXT NOT NULL,
+            forecast REAL NOT NULL,
+            alpha REAL NOT NULL,
+            generated_at TEXT NOT NULL,
+            history_version INTEGER,
+            PRIMARY KEY (item_id, forecast_date),
+            FOREIGN KEY (item_id) REFERENCES items(item_id) ON DELETE CASCADE
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_forecasts_date ON forecasts(forecast_date)")
+
+
+def _create_table_versions(cursor):
+    """创建表版本计数表，写操作递增对应表的版本，数据加载缓存以版本为键"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS table_versions (
+            table_name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.executemany(
+        "INSERT OR IGNORE INTO table_versions (table_name, version) VALUES (?, 0)",
+        [(table,) for table in ("items", "inventory", "orders", "order_items", "machines", "production_plan")]
+    )
+
+
+def _create_order_listing_indexes(cursor):
+    """订单列表按 状态/客户 + 日期 分页查询的复合索引（rowid 即 order_id，已隐含在索引中）"""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_status_date ON orders(status, order_date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_customer_date ON orders(customer_name, order_date)")
+
+
+def _fts_tokenizer(cursor):
+    """选择全文索引分词器：trigram 支持中文任意子串匹配（SQLite 3.34+），否则退回 unicode61"""
+    try:
+        cursor.execute("CREATE VIRTUAL TABLE temp._fts_probe USING fts5(x, tokenize='trigram')")
+        cursor.execute("DROP TABLE temp._fts_probe")
+        return "trigram"
+    except sqlite3.OperationalError:
+        return "unicode61"
+
+
+# 短查询字词索引只索引文本的前 SEARCH_GRAM_MAX_POSITION 个字符
+SEARCH_GRAM_MAX_POSITION = 512
+
+
+def _grams_sql(*columns):
+    """
+    生成把文本列拆成所有单字和双字的 SQL 表达式（用于触发器）
+
+    每个字词编码为十六进制，分词器不会再拆开标点和空格；ASCII 字母先转小写，与 LIKE 一致。
+    """
+    parts = []
+    for column in columns:
+        text = f"lower(COALESCE({column}, ''))"
+        parts.append(
+            f"(SELECT COALESCE(group_concat(hex(substr({text}, n, 1)) || ' ' || hex(substr({text}, n, 2)), ' '), '') "
+            f"FROM search_positions WHERE n <= length({text}))"
+        )
+    return " || ' ' || ".join(parts)
+
+
+def _create_search_indexes(cursor):
+    """
+    创建订单客户名称和物品名称/描述的搜索索引，并用触发器保持同步
+
+    trigram 全文索引支持3个字符以上的子串查询；1~2个字符的查询（如“张三”）在单字和双字的无内容FTS5索引中精确查找。
+    客户名称在订单中大量重复，订单的索引建在去重后的客户名称表上，新增订单只在出现新客户名称时才写入索引。
+    """
+    tokenizer = _fts_tokenizer(cursor)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS order_customers (
+            customer_id INTEGER PRIMARY KEY,
+            customer_name TEXT NOT NULL UNIQUE
+        )
+    ''')
+    cursor.execute(f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS orders_fts USING fts5(
+            customer_name, content='order_customers', content_rowid='customer_id', tokenize='{tokenizer}'
+        )
+    ''')
+    cursor.execute(f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5(
+            item_name, description, content='items', content_rowid='item_id', tokenize='{tokenizer}'
+        )
+    ''')
+    cursor.execute("CREATE TABLE IF NOT EXISTS search_positions (n INTEGER PRIMARY KEY)")
+    cursor.executemany("INSERT OR IGNORE INTO search_positions (n) VALUES (?)",
+                       [(n,) for n in range(1, SEARCH_GRAM_MAX_POSITION + 1)])
+    cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS orders_grams USING fts5(grams, content='', detail='none', columnsize=0)")
+    cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS items_grams USING fts5(grams, content='', detail='none', columnsize=0)")
+
+    # 客户名称只增不删：不再被订单使用的名称在搜索时找不到订单，不影响结果
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS orders_customer_insert AFTER INSERT ON orders BEGIN
+            INSERT OR IGNORE INTO order_customers(customer_name) VALUES (new.customer_name);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS orders_customer_update AFTER UPDATE OF customer_name ON orders
+        WHEN old.customer_name IS NOT new.customer_name BEGIN
+            INSERT OR IGNORE INTO order_customers(customer_name) VALUES (new.customer_name);
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS order_customers_search_insert AFTER INSERT ON order_customers BEGIN
+            INSERT INTO orders_fts(rowid, customer_name) VALUES (new.customer_id, new.customer_name);
+            INSERT INTO orders_grams(rowid, grams) VALUES (new.customer_id, {_grams_sql("new.customer_name")});
+        END
+    ''')
+
+    # 物品索引的同步触发器（无内容表删除时需提供原来的字词），名称和描述未变化时不重建
+    new_item, old_item = _grams_sql("new.item_name", "new.description"), _grams_sql("old.item_name", "old.description")
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS items_search_insert AFTER INSERT ON items BEGIN
+            INSERT INTO items_fts(rowid, item_name, description) VALUES (new.item_id, new.item_name, new.description);
+            INSERT INTO items_grams(rowid, grams) VALUES (new.item_id, {new_item});
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS items_search_delete AFTER DELETE ON items BEGIN
+            INSERT INTO items_fts(items_fts, rowid, item_name, description) VALUES ('delete', old.item_id, old.item_name, old.description);
+            INSERT INTO items_grams(items_grams, rowid, grams) VALUES ('delete', old.item_id, {old_item});
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS items_search_update AFTER UPDATE OF item_name, description ON items
+        WHEN old.item_name IS NOT new.item_name OR old.description IS NOT new.description BEGIN
+            INSERT INTO items_fts(items_fts, rowid, item_name, description) VALUES ('delete', old.item_id, old.item_name, old.description);
+            INSERT INTO items_fts(rowid, item_name, description) VALUES (new.item_id, new.item_name, new.description);
+            INSERT INTO items_grams(items_grams, rowid, grams) VALUES ('delete', old.item_id, {old_item});
+            INSERT INTO items_grams(rowid, grams) VALUES (new.item_id, {new_item});
+        END
+    ''')
+
+    # 为已有数据建立索引
+    cursor.execute("INSERT OR IGNORE INTO order_customers(customer_name) SELECT DISTINCT customer_name FROM orders")
+    cursor.execute("INSERT INTO items_fts(items_fts) VALUES ('rebuild')")
+    cursor.execute(f"INSERT INTO items_grams(rowid, grams) SELECT item_id, {_grams_sql('item_name', 'description')} FROM items")
+
+
+def _summary_upsert(table, key_col, key_expr, count_expr, amount_expr, count_col="order_count", amount_col="total_amount"):
+    """生成累加汇总行的 UPSERT 语句（用于触发器）"""
+    return f'''INSERT INTO {table} ({key_col}, {count_col}, {amount_col}) VALUES ({key_expr}, {count_expr}, {amount_expr})
+               ON CONFLICT({key_col}) DO UPDATE SET {count_col} = {count_col} + excluded.{count_col},
+                                                  {amount_col} = {amount_col} + excluded.{amount_col};'''
+
+
+def _order_summary_statements(row, sign, tables=("sales_daily", "order_status_summary", "customer_sales_summary")):
+    """订单行（new/old）对各汇总表的增量语句，sign 为 1（加入）或 -1（移除）"""
+    # 已取消的订单不计入每日销售和客户销售额
+    valid = f"({row}.status != 'cancelled')"
+    statements = {
+        "sales_daily": _summary_upsert("sales_daily", "day", f"substr({row}.order_date, 1, 10)",
+                                       f"{sign} * {valid}", f"{sign} * {valid} * {row}.total_amount"),
+        "order_status_summary": _summary_upsert("order_status_summary", "status", f"{row}.status",
+                                                f"{sign}", f"{sign} * {row}.total_amount"),
+        "customer_sales_summary": _summary_upsert("customer_sales_summary", "customer_name", f"{row}.customer_name",
+                                                  f"{sign} * {valid}", f"{sign} * {valid} * {row}.total_amount"),
+    }
+    return "\n".join(statements[table] for table in tables)
+
+
+def _item_summary_statement(row, sign):
+    """订单明细行对物品销售汇总的增量语句，只计入未取消的订单（订单已删除时不计入）"""
+    active = f"COALESCE((SELECT status != 'cancelled' FROM orders WHERE order_id = {row}.order_id), 0)"
+    return _summary_upsert("item_sales_summary", "item_id", f"{row}.item_id", f"{sign} * {active} * {row}.quantity",
+                           f"{sign} * {active} * {row}.subtotal", count_col="quantity", amount_col="revenue")
+
+
+def _order_items_summary_statement(order_id, sign):
+    """订单的全部明细对物品销售汇总的增量语句（订单取消/恢复/删除时使用）"""
+    return f'''INSERT INTO item_sales_summary (item_id, quantity, revenue)
+               SELECT item_id, {sign} * SUM(quantity), {sign} * SUM(subtotal)
+               FROM order_items WHERE order_id = {order_id} GROUP BY item_id
+               ON CONFLICT(item_id) DO UPDATE SET quantity = quantity + excluded.quantity,
+                                                  revenue = revenue + excluded.revenue;'''
+
+
+def _create_dashboard_summaries(cursor):
+    """创建数据看板汇总表，由触发器在订单和订单明细变化时增量维护"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sales_daily (
+            day TEXT PRIMARY KEY,
+            order_count INTEGER NOT NULL DEFAULT 0,
+            total_amount REAL NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS order_status_summary (
+            status TEXT PRIMARY KEY,
+            order_count INTEGER NOT NULL DEFAULT 0,
+            total_amount REAL NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS customer_sales_summary (
+            customer_name TEXT PRIMARY KEY,
+            order_count INTEGER NOT NULL DEFAULT 0,
+            total_amount REAL NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS item_sales_summary (
+            item_id INTEGER PRIMARY KEY,
+            quantity INTEGER NOT NULL DEFAULT 0,
+            revenue REAL NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_customer_sales_amount ON customer_sales_summary(total_amount)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_item_sales_revenue ON item_sales_summary(revenue)")
+    
+    # 增量维护触发器：更新视为移除旧行再加入新行，只在影响汇总的值变化时执行
+    # （排产等批量更新把 pending 改为 processing 时不改变每日销售和客户销售额）
+    status_tables = ("order_status_summary",)
+    sales_tables = ("sales_daily", "customer_sales_summary")
+    cursor.execute(f"CREATE TRIGGER IF NOT EXISTS orders_summary_insert AFTER INSERT ON orders BEGIN {_order_summary_statements('new', 1)} END")
+    cursor.execute(f"CREATE TRIGGER IF NOT EXISTS orders_summary_delete AFTER DELETE ON orders BEGIN {_order_summary_statements('old', -1)} END")
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS orders_status_summary_update
+                       AFTER UPDATE OF status, total_amount ON orders
+                       WHEN old.status IS NOT new.status OR old.total_amount IS NOT new.total_amount BEGIN
+                       {_order_summary_statements('old', -1, status_tables)}
+                       {_order_summary_statements('new', 1, status_tables)}
+                       END''')
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS orders_sales_summary_update
+                       AFTER UPDATE OF status, total_amount, order_date, customer_name ON orders
+                       WHEN (old.status = 'cancelled') IS NOT (new.status = 'cancelled')
+                         OR old.total_amount IS NOT new.total_amount
+                         OR old.order_date IS NOT new.order_date
+                         OR old.customer_name IS NOT new.customer_name BEGIN
+                       {_order_summary_statements('old', -1, sales_tables)}
+                       {_order_summary_statements('new', 1, sales_tables)}
+                       END''')
+    
+    # 物品销售汇总不计入已取消的订单：明细变化时按所属订单的状态计入，订单取消或恢复时整单加减；
+    # 删除未取消的订单时先减去其明细（级联删除明细时订单已不存在，不再重复减去）
+    cursor.execute(f"CREATE TRIGGER IF NOT EXISTS order_items_summary_insert AFTER INSERT ON order_items BEGIN {_item_summary_statement('new', 1)} END")
+    cursor.execute(f"CREATE TRIGGER IF NOT EXISTS order_items_summary_delete AFTER DELETE ON order_items BEGIN {_item_summary_statement('old', -1)} END")
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS order_items_summary_update
+                       AFTER UPDATE OF order_id, item_id, quantity, subtotal ON order_items BEGIN
+                       {_item_summary_statement('old', -1)}
+                       {_item_summary_statement('new', 1)}
+                       END''')
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS orders_item_summary_status
+                       AFTER UPDATE OF status ON orders
+                       WHEN (old.status = 'cancelled') IS NOT (new.status = 'cancelled') BEGIN
+                       {_order_items_summary_statement('new.order_id', "(CASE WHEN new.status = 'cancelled' THEN -1 ELSE 1 END)")}
+                       END''')
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS orders_item_summary_delete
+                       BEFORE DELETE ON orders WHEN old.status != 'cancelled' BEGIN
+                       {_order_items_summary_statement('old.order_id', -1)}
+                       END''')
+    
+    # 用已有数据初始化汇总表
+    cursor.execute('''
+        INSERT OR REPLACE INTO sales_daily (day, order_count, total_amount)
+        SELECT substr(order_date, 1, 10), SUM(status != 'cancelled'), SUM((status != 'cancelled') * total_amount)
+        FROM orders GROUP BY substr(order_date, 1, 10)
+    ''')
+    cursor.execute('''
+        INSERT OR REPLACE INTO order_status_summary (status, order_count, total_amount)
+        SELECT status, COUNT(*), SUM(total_amount) FROM orders GROUP BY status
+    ''')
+    cursor.execute('''
+        INSERT OR REPLACE INTO customer_sales_summary (customer_name, order_count, total_amount)
+        SELECT customer_name, SUM(status != 'cancelled'), SUM((status != 'cancelled') * total_amount)
+        FROM orders GROUP BY customer_name
+    ''')
+    cursor.execute('''
+        INSERT OR REPLACE INTO item_sales_summary (item_id, quantity, revenue)
+        SELECT oi.item_id, SUM(oi.quantity), SUM(oi.subtotal)
+        FROM order_items oi JOIN orders o ON o.order_id = oi.order_id
+        WHERE o.status != 'cancelled'
+        GROUP BY oi.item_id
+    ''')
+
+
+def _create_users(cursor):
+    """创建员工账号表（员工较多时替代 users.json 存储账号）"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY,
+            password TEXT NOT NULL,
+            role TEXT NOT NULL,
+            name TEXT,
+            department TEXT,
+            created_at TEXT NOT NULL
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_role ON users(role)")
+
+
+def _create_inventory_movements(cursor):
+    """创建库存变动流水表：每次库存增减记录变动量和变动后的库存"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS inventory_movements (
+            movement_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            item_id INTEGER NOT NULL,
+            delta INTEGER NOT NULL,
+            balance_after INTEGER NOT NULL,
+            reason TEXT,
+            ref_type TEXT,
+            ref_id INTEGER,
+            created_by TEXT,
+            created_at TEXT NOT NULL,
+            FOREIGN KEY (item_id) REFERENCES items(item_id) ON DELETE CASCADE
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_inventory_movements_item_created ON inventory_movements(item_id, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_inventory_movements_ref ON inventory_movements(ref_type, ref_id)")
+
+
+def _create_inventory_snapshots(cursor):
+    """创建库存快照表，并以当前库存作为第一份快照（历史库存查询的起点）"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS inventory_snapshots (
+            snapshot_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            item_id INTEGER NOT NULL,
+            snapshot_at TEXT NOT NULL,
+            stock INTEGER NOT NULL,
+            last_movement_id INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (item_id) REFERENCES items(item_id) ON DELETE CASCADE
+        )
+    ''')
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_inventory_snapshots_item_at ON inventory_snapshots(item_id, snapshot_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_inventory_snapshots_at ON inventory_snapshots(snapshot_at)")
+    cursor.execute(
+        '''INSERT OR IGNORE INTO inventory_snapshots (item_id, snapshot_at, stock, last_movement_id)
+           SELECT item_id, ?, current_stock, (SELECT COALESCE(MAX(movement_id), 0) FROM inventory_movements)
+           FROM inventory''',
+        (datetime.now().isoformat(),)
+    )
+
+
+# 迁移步骤列表（按版本号递增）
+MIGRATIONS = [
+    (1, "创建基础业务表", _create_base_tables),
+    (2, "补齐订单排产相关列", _add_order_scheduling_columns),
+    (3, "创建性能索引", _create_performance_indexes),
+    (4, "创建库存历史表", _create_inventory_history),
+    (5, "创建生产计划设备时间索引", _create_plan_time_indexes),
+    (6, "创建需求预测结果表", _create_forecasts),
+    (7, "创建表版本计数表", _create_table_versions),
+    (8, "创建订单列表分页索引", _create_order_listing_indexes),
+    (9, "创建订单和物品全文索引", _create_search_indexes),
+    (10, "创建数据看板汇总表", _create_dashboard_summaries),
+    (11, "创建员工账号表", _create_users),
+    (12, "创建库存变动流水表", _create_inventory_movements),
+    (13, "创建库存快照表", _create_inventory_snapshots),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def _ensure_version_table(cursor):
+    """创建迁移版本记录表"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )
+    ''')
+
+
+def get_schema_version(conn):
+    """获取数据库当前的迁移版本号，未迁移过返回0"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'"
+        )
+        if not cursor.fetchone():
+            return 0
+        cursor.execute("SELECT MAX(version) FROM schema_version")
+        return cursor.fetchone()[0] or 0
+    finally:
+        cursor.close()
+
+
+def run_migrations(transaction):
+    """
+    执行所有尚未应用的迁移步骤
+    
+    Args:
+        transaction: 返回写事务上下文管理器的函数（如 DatabaseManager.write_transaction），
+            每个迁移步骤在独立的事务中执行
+        
+    Returns:
+        list: 本次应用的迁移版本号
+    """
+    applied = []
+    for version, description, step in MIGRATIONS:
+        with transaction() as conn:
+            cursor = conn.cursor()
+            try:
+                _ensure_version_table(cursor)
+                # 在写事务内重新检查版本，避免多个进程重复执行同一步骤
+                cursor.execute("SELECT 1 FROM schema_version WHERE version = ?", (version,))
+                if cursor.fetchone():
+                    continue
+                step(cursor)
+                cursor.execute(
+                    "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                    (version, description, datetime.now().isoformat())
+                )
+                applied.append(version)
+            except sqlite3.Error as e:
+                raise sqlite3.Error(f"迁移 {version}（{description}）失败：{e}") from e
+            finally:
+                cursor.close()
+    return applied
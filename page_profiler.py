@@ -0,0 +1,203 @@
+import cProfile
+import json
+import os
+import pstats
+import re
+import threading
+import time
+from datetime import datetime
+import pandas as pd
+import streamlit as st
+from rights import check_permission
+
+# 页面渲染性能分析
+# 开启后 main.py 分发的每个页面函数都在 cProfile 下运行，记录渲染耗时、页面和用户，
+# 性能数据保存到 PROFILE_DIR，只保留最近 MAX_PROFILES 份（超出时删除最早的）。
+# 可由环境变量 ERP_PAGE_PROFILE=1 默认开启，也可在管理员页面运行时开关，无需重启。
+
+PROFILE_DIR = os.environ.get("ERP_PROFILE_DIR", "profiles")
+MAX_PROFILES = int(os.environ.get("ERP_PROFILE_MAX_FILES", "200"))
+INDEX_FILE = "index.jsonl"
+
+_enabled = os.environ.get("ERP_PAGE_PROFILE", "0") == "1"
+_lock = threading.Lock()
+_UNSAFE_CHARS = re.compile(r"[^\w\-]+")
+
+
+def is_enabled():
+    """是否开启页面性能分析"""
+    return _enabled
+
+
+def set_enabled(enabled):
+    """运行时开启或关闭页面性能分析（下一次页面渲染生效）"""
+    global _enabled
+    _enabled = bool(enabled)
+
+
+def _index_path():
+    return os.path.join(PROFILE_DIR, INDEX_FILE)
+
+
+def _save_profile(profiler, page, user, elapsed):
+    """保存性能数据并追加索引记录，超出保留数量时删除最早的性能文件"""
+    started_at = datetime.now()
+    filename = f"{started_at:%Y%m%d-%H%M%S-%f}_{_UNSAFE_CHARS.sub('_', page)}_{_UNSAFE_CHARS.sub('_', user)}.prof"
+    entry = {
+        "timestamp": started_at.isoformat(),
+        "page": page,
+        "user": user,
+        "elapsed_ms": round(elapsed * 1000, 3),
+        "file": filename,
+    }
+    with _lock:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profiler.dump_stats(os.path.join(PROFILE_DIR, filename))
+        entries = load_index() + [entry]
+        if len(entries) > MAX_PROFILES:
+            expired, entries = entries[:-MAX_PROFILES], entries[-MAX_PROFILES:]
+            for old in expired:
+                path = os.path.join(PROFILE_DIR, old["file"])
+                if os.path.exists(path):
+                    os.remove(path)
+            # 重写索引，只保留仍存在的性能文件
+            tmp_path = _index_path() + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(e, ensure_ascii=False) + "\n" for e in entries)
+            os.replace(tmp_path, _index_path())
+        else:
+            with open(_index_path(), "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def run_page(page, user, func):
+    """
+    渲染页面；开启性能分析时在 cProfile 下运行并保存结果
+
+    页面内调用 st.rerun() 等会以异常结束渲染，这种情况同样记录。
+
+    Args:
+        page: 页面名称
+        user: 当前用户名
+        func: 页面函数
+    """
+    if not _enabled:
+        return func()
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Python 3.12+ 的 cProfile 全局只能有一个在运行，其他会话正在被分析时本次不分析
+        return func()
+    started = time.perf_counter()
+    try:
+        return func()
+    finally:
+        profiler.disable()
+        elapsed = time.perf_counter() - started
+        try:
+            _save_profile(profiler, page, user or "（未登录）", elapsed)
+        except OSError as e:
+            st.warning(f"保存性能数据失败：{e}")
+
+
+def load_index():
+    """读取渲染记录索引（按时间顺序）"""
+    if not os.path.exists(_index_path()):
+        return []
+    with open(_index_path(), "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def top_functions(filename, limit=30, sort="cumulative"):
+    """
+    读取一次渲染的性能数据，返回累计耗时最多的函数
+
+    Returns:
+        DataFrame: function, ncalls, tottime_ms, cumtime_ms
+    """
+    stats = pstats.Stats(os.path.join(PROFILE_DIR, filename))
+    rows = [
+        {
+            "function": f"{os.path.basename(file)}:{line} {name}" if line else name,
+            "ncalls": calls,
+            "tottime_ms": tottime * 1000,
+            "cumtime_ms": cumtime * 1000,
+        }
+        for (file, line, name), (_, calls, tottime, cumtime, _) in stats.stats.items()
+    ]
+    column = "cumtime_ms" if sort == "cumulative" else "tottime_ms"
+    return pd.DataFrame(rows).sort_values(column, ascending=False).head(limit).reset_index(drop=True)
+
+
+def show_loader_memory():
+    """显示各数据加载函数缓存的DataFrame压缩前后的内存占用"""
+    from dataset import get_loader_memory_report
+
+    report = get_loader_memory_report()
+    if not report:
+        return
+    st.subheader("数据缓存内存占用")
+    frame = pd.DataFrame([
+        {
+            "loader": name,
+            "rows": entry["rows"],
+            "before_mb": entry["before_bytes"] / 1024 / 1024,
+            "after_mb": entry["after_bytes"] / 1024 / 1024,
+            "saved_pct": entry["saved_pct"],
+        }
+        for name, entry in report.items()
+    ])
+    st.dataframe(frame, column_config={
+        "before_mb": st.column_config.NumberColumn(format="%.2f"),
+        "after_mb": st.column_config.NumberColumn(format="%.2f"),
+    }, hide_index=True)
+
+
+def page_profile_page():
+    """页面性能分析（仅管理员）"""
+    check_permission("性能分析")
+
+    enabled = st.toggle("开启页面性能分析", value=is_enabled())
+    if enabled != is_enabled():
+        set_enabled(enabled)
+        st.rerun()
+    st.caption(f"性能数据目录：{os.path.abspath(PROFILE_DIR)}（保留最近 {MAX_PROFILES} 次渲染）")
+
+    show_loader_memory()
+
+    renders = pd.DataFrame(load_index())
+    if renders.empty:
+        st.info("暂无渲染记录" if is_enabled() else "页面性能分析未开启")
+        return
+
+    # 各页面、用户的渲染耗时汇总
+    st.subheader("各页面渲染耗时")
+    summary = renders.groupby(["page", "user"]).agg(
+        renders=("elapsed_ms", "size"), avg_ms=("elapsed_ms", "mean"),
+        p95_ms=("elapsed_ms", lambda s: s.quantile(0.95)), max_ms=("elapsed_ms", "max")
+    ).sort_values("avg_ms", ascending=False)
+    st.dataframe(summary, column_config={
+        "avg_ms": st.column_config.NumberColumn(format="%.1f"),
+        "p95_ms": st.column_config.NumberColumn(format="%.1f"),
+        "max_ms": st.column_config.NumberColumn(format="%.1f"),
+    })
+
+    # 最慢的渲染及其耗时最多的函数
+    st.subheader("最慢的渲染")
+    page = st.selectbox("页面", ["全部页面"] + sorted(renders["page"].unique().tolist()))
+    view = renders if page == "全部页面" else renders[renders["page"] == page]
+    slowest = view.sort_values("elapsed_ms", ascending=False).head(20).reset_index(drop=True)
+    st.dataframe(slowest[["timestamp", "page", "user", "elapsed_ms"]], use_container_width=True)
+
+    labels = {f"{row.timestamp}  {row.page}  {row.user}  {row.elapsed_ms:.1f}ms": row.file for row in slowest.itertuples()}
+    selected = st.selectbox("查看函数耗时", list(labels.keys()))
+    sort = st.radio("排序", ["cumulative", "tottime"], horizontal=True,
+                    format_func=lambda s: "累计耗时" if s == "cumulative" else "自身耗时")
+    try:
+        st.dataframe(top_functions(labels[selected], sort=sort), column_config={
+            "tottime_ms": st.column_config.NumberColumn(format="%.2f"),
+            "cumtime_ms": st.column_config.NumberColumn(format="%.2f"),
+        }, use_container_width=True)
+    except (OSError, EOFError) as e:
+        st.error(f"读取性能数据失败：{e}")
@@ -2,9 +2,19 @@ import streamlit as st
 import hashlib
 import json
 import os
+import stat
+import tempfile
+import threading
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from streamlit.runtime.scriptrunner import RerunData, RerunException
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
 # 用户数据存储文件
 USERS_FILE = "users.json"
 
@@ -16,10 +26,9 @@ def hash_password(password):
     """使用SHA-256哈希密码"""
     return hashlib.sha256(password.encode()).hexdigest()
 
-# 初始化用户数据
-def init_users():
-    """初始化用户数据文件"""
-    default_users = {
+def _default_users():
+    """默认账号"""
+    return {
         "admin": {
             "password": hash_password("admin123"),
             "role": "admin",
@@ -42,23 +51,275 @@ def init_users():
             "created_at": datetime.now().isoformat()
         }
     }
-    
-    if not os.path.exists(USERS_FILE):
-        with open(USERS_FILE, "w", encoding="utf-8") as f:
-            json.dump(default_users, f, ensure_ascii=False, indent=4)
+
+def _copy_users(users):
+    """复制用户字典，调用方修改返回值不会污染缓存"""
+    return {username: dict(info) for username, info in users.items()}
+
+
+class UserStore:
+    """
+    基于 users.json 的用户存储
+
+    进程内缓存解析后的用户数据，只有文件的修改时间或大小变化时才重新读取；
+    写入先写临时文件再 os.replace 原子替换（保留原文件权限），读-改-写在线程锁和
+    文件锁（users.json.lock）内完成，多个 Streamlit 进程同时修改也不会丢失对方的更新。
+    """
+
+    def __init__(self, path=USERS_FILE):
+        self.path = path
+        self._lock = threading.RLock()
+        self._users = None
+        self._stat = None
+
+    @contextmanager
+    def _modify_lock(self):
+        """读-改-写用的锁：进程内线程锁 + 跨进程文件锁"""
+        with self._lock:
+            fd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o666)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                else:
+                    msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(fd, fcntl.LOCK_UN)
+                    else:
+                        os.lseek(fd, 0, os.SEEK_SET)
+                        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+            finally:
+                os.close(fd)
+
+    def _file_stat(self):
+        try:
+            st_result = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st_result.st_mtime_ns, st_result.st_size)
+
+    def _load_locked(self):
+        """返回缓存的用户数据（需持有锁），文件变化时重新解析"""
+        stat = self._file_stat()
+        if stat is None:
+            self._write_locked(_default_users())
+        elif self._users is None or stat != self._stat:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._users = json.load(f)
+            self._stat = stat
+        return self._users
+
+    def _write_locked(self, users):
+        """原子写入用户文件（需持有锁）"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".users-", suffix=".json", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(users, f, ensure_ascii=False, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            # mkstemp 创建的文件权限为 0600，替换前沿用原文件的权限（新建时按 umask）
+            try:
+                mode = stat.S_IMODE(os.stat(self.path).st_mode)
+            except FileNotFoundError:
+                umask = os.umask(0)
+                os.umask(umask)
+                mode = 0o666 & ~umask
+            os.chmod(tmp_path, mode)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._users = _copy_users(users)
+        self._stat = self._file_stat()
+
+    def load(self):
+        """获取全部用户（返回副本）"""
+        with self._lock:
+            return _copy_users(self._load_locked())
+
+    def get(self, username):
+        """获取单个用户信息，不存在返回 None"""
+        with self._lock:
+            info = self._load_locked().get(username)
+            return dict(info) if info is not None else None
+
+    def save(self, users):
+        """整体保存用户数据"""
+        with self._modify_lock():
+            self._write_locked(users)
+
+    def add_user(self, username, info):
+        """添加用户，用户名已存在返回 False"""
+        with self._modify_lock():
+            users = _copy_users(self._load_locked())
+            if username in users:
+                return False
+            users[username] = dict(info)
+            self._write_locked(users)
+            return True
+
+    def update_user(self, username, **fields):
+        """更新用户字段，用户不存在返回 False"""
+        with self._modify_lock():
+            users = _copy_users(self._load_locked())
+            if username not in users:
+                return False
+            users[username].update(fields)
+            self._write_locked(users)
+            return True
+
+    def delete_user(self, username):
+        """删除用户，用户不存在返回 False"""
+        with self._modify_lock():
+            users = _copy_users(self._load_locked())
+            if users.pop(username, None) is None:
+                return False
+            self._write_locked(users)
+            return True
+
+
+class SqliteUserStore:
+    """
+    基于数据库 users 表的用户存储（员工较多时使用）
+
+    单个用户的查询和修改只访问一行；首次使用时若表为空，从 users.json 导入现有账号。
+    """
+
+    COLUMNS = ["password", "role", "name", "department", "created_at"]
+
+    def __init__(self, path=USERS_FILE):
+        self.path = path
+        self._seeded = False
+        self._lock = threading.Lock()
+
+    def _ensure_seeded(self):
+        if self._seeded:
+            return
+        from dataset import DatabaseManager
+        with self._lock:
+            if self._seeded:
+                return
+            DatabaseManager.init_database()
+            with DatabaseManager.write_transaction() as conn:
+                if conn.execute("SELECT 1 FROM users LIMIT 1").fetchone() is None:
+                    if os.path.exists(self.path):
+                        with open(self.path, "r", encoding="utf-8") as f:
+                            users = json.load(f)
+                    else:
+                        users = _default_users()
+                    self._upsert(conn, users)
+            self._seeded = True
+
+    def _upsert(self, conn, users):
+        conn.executemany(
+            '''INSERT INTO users (username, password, role, name, department, created_at)
+               VALUES (?, ?, ?, ?, ?, ?)
+               ON CONFLICT(username) DO UPDATE SET password = excluded.password, role = excluded.role,
+                   name = excluded.name, department = excluded.department''',
+            [(username,) + tuple(info.get(col) for col in self.COLUMNS[:-1])
+             + (info.get("created_at") or datetime.now().isoformat(),)
+             for username, info in users.items()]
+        )
+
+    def _row_to_info(self, row):
+        return dict(zip(self.COLUMNS, row))
+
+    def load(self):
+        """获取全部用户"""
+        from dataset import DatabaseManager
+        self._ensure_seeded()
+        rows = DatabaseManager.get_connection().execute(
+            f"SELECT username, {', '.join(self.COLUMNS)} FROM users ORDER BY username"
+        ).fetchall()
+        return {row[0]: self._row_to_info(row[1:]) for row in rows}
+
+    def get(self, username):
+        """获取单个用户信息，不存在返回 None"""
+        from dataset import DatabaseManager
+        self._ensure_seeded()
+        row = DatabaseManager.get_connection().execute(
+            f"SELECT {', '.join(self.COLUMNS)} FROM users WHERE username = ?", (username,)
+        ).fetchone()
+        return self._row_to_info(row) if row is not None else None
+
+    def save(self, users):
+        """整体保存用户数据（删除不在 users 中的账号）"""
+        from dataset import DatabaseManager
+        self._ensure_seeded()
+        with DatabaseManager.write_transaction() as conn:
+            conn.execute(
+                "DELETE FROM users WHERE username NOT IN (SELECT value FROM json_each(?))",
+                (json.dumps(list(users.keys()), ensure_ascii=False),)
+            )
+            self._upsert(conn, users)
+
+    def add_user(self, username, info):
+        """添加用户，用户名已存在返回 False"""
+        from dataset import DatabaseManager
+        self._ensure_seeded()
+        with DatabaseManager.write_transaction() as conn:
+            cursor = conn.execute(
+                f'''INSERT OR IGNORE INTO users (username, {', '.join(self.COLUMNS)})
+                    VALUES (?, ?, ?, ?, ?, ?)''',
+                (username,) + tuple(info.get(col) for col in self.COLUMNS)
+            )
+            return cursor.rowcount == 1
+
+    def update_user(self, username, **fields):
+        """更新用户字段，用户不存在返回 False"""
+        from dataset import DatabaseManager
+        fields = {col: value for col, value in fields.items() if col in self.COLUMNS}
+        if not fields:
+            return self.get(username) is not None
+        self._ensure_seeded()
+        with DatabaseManager.write_transaction() as conn:
+            cursor = conn.execute(
+                f"UPDATE users SET {', '.join(f'{col} = ?' for col in fields)} WHERE username = ?",
+                tuple(fields.values()) + (username,)
+            )
+            return cursor.rowcount == 1
+
+    def delete_user(self, username):
+        """删除用户，用户不存在返回 False"""
+        from dataset import DatabaseManager
+        self._ensure_seeded()
+        with DatabaseManager.write_transaction() as conn:
+            return conn.execute("DELETE FROM users WHERE username = ?", (username,)).rowcount == 1
+
+
+_user_store = None
+_user_store_lock = threading.Lock()
+
+def get_user_store():
+    """获取进程级用户存储（环境变量 ERP_USER_STORE=sqlite 时使用数据库 users 表，默认 users.json）"""
+    global _user_store
+    if _user_store is None:
+        with _user_store_lock:
+            if _user_store is None:
+                if os.environ.get("ERP_USER_STORE", "json") == "sqlite":
+                    _user_store = SqliteUserStore()
+                else:
+                    _user_store = UserStore()
+    return _user_store
+
+# 初始化用户数据
+def init_users():
+    """初始化用户数据（文件不存在时写入默认账号）"""
+    get_user_store().load()
 
 # 加载用户数据
 def load_users():
-    """从文件加载用户数据"""
-    init_users()
-    with open(USERS_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
+    """加载用户数据（进程内缓存，文件未变化时不重新解析）"""
+    return get_user_store().load()
 
 # 保存用户数据
 def save_users(users):
-    """保存用户数据到文件"""
-    with open(USERS_FILE, "w", encoding="utf-8") as f:
-        json.dump(users, f, ensure_ascii=False, indent=4)
+    """保存用户数据"""
+    get_user_store().save(users)
 
 # 登录页面
 def login_page():
@@ -70,18 +331,18 @@ def login_page():
     
     # 提交按钮
     if st.button("登录"):
-        users = load_users()
+        user = get_user_store().get(username)
         
-        if username in users:
-            hashed_pwd = users[username]["password"]
+        if user is not None:
+            hashed_pwd = user["password"]
             if hashed_pwd == hash_password(password):
                 # 登录成功，保存用户信息到会话状态
                 st.session_state.user = username
-                st.session_state.role = users[username]["role"]
+                st.session_state.role = user["role"]
                 st.session_state.logged_in = True
                 st.session_state.user_info = {
-                    "name": users[username]["name"],
-                    "department": users[username]["department"]
+                    "name": user["name"],
+                    "department": user["department"]
                 }
                 st.session_state.login_time = datetime.now()
                 st.success("登录成功！")
@@ -92,7 +353,7 @@ def login_page():
             st.error("用户名不存在")
 # 定义角色权限
 ROLE_PERMISSIONS = {
-    "admin": ["生产计划", "员工管理", "库存管理", "数据看板", "系统设置", "订单管理", "物品管理"],
+    "admin": ["生产计划", "员工管理", "库存管理", "数据看板", "系统设置", "订单管理", "物品管理", "SQL性能", "性能分析"],
     "production": ["生产计划", "库存管理", "订单管理"],
     "inventory": ["库存管理", "物品管理"]
 }
@@ -154,8 +415,7 @@ def user_management():
         # 删除用户按钮（不能删除管理员自己）
         if username != "admin" and st.session_state.user != username:
             if col5.button("删除", key=f"delete_{username}"):
-                del users[username]
-                save_users(users)
+                get_user_store().delete_user(username)
                 st.success(f"用户 {username} 已删除")
                 rerun()
     
@@ -169,17 +429,16 @@ def user_management():
         new_department = st.text_input("部门")
         
         if st.form_submit_button("添加用户"):
-            if new_username in users:
+            new_user = {
+                "password": hash_password(new_password),
+                "role": new_role,
+                "name": new_name,
+                "department": new_department,
+                "created_at": datetime.now().isoformat()
+            }
+            if not get_user_store().add_user(new_username, new_user):
                 st.error("用户名已存在")
             else:
-                users[new_username] = {
-                    "password": hash_password(new_password),
-                    "role": new_role,
-                    "name": new_name,
-                    "department": new_department,
-                    "created_at": datetime.now().isoformat()
-                }
-                save_users(users)
                 st.success(f"用户 {new_username} 已添加")
                 rerun()
 
@@ -0,0 +1,341 @@
+import heapq
+import json
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from dataset import bump_table_versions
+
+# 排产参数
+DEFAULT_DUE_DAYS = 7          # 订单没有交期时默认的剩余天数
+MIN_PROCESSING_HOURS = 1      # 加工时长缺失或为0时按1小时计
+
+
+def processing_hours(processing_time):
+    """把 orders.processing_time（单位：天）换算为排产使用的小时数，缺失或为0时按 MIN_PROCESSING_HOURS 计"""
+    days = pd.to_numeric(pd.Series(processing_time, dtype="object"), errors="coerce").fillna(0)
+    return np.maximum(days.to_numpy(dtype="float64") * 24, MIN_PROCESSING_HOURS)
+
+
+def score_orders(orders, now=None):
+    """
+    向量化计算所有待排产订单的优先级（数值越大越紧急）
+    
+    Args:
+        orders: 包含 order_id、due_date、delivery_date、processing_time（加工天数）的DataFrame
+        now: 计算剩余天数的基准时间
+        
+    Returns:
+        DataFrame: 增加 due、hours、priority 列，并按优先级降序排列
+    """
+    now = pd.Timestamp(now or datetime.now())
+    df = orders.copy()
+
+    # 交期优先取 due_date，缺失时取 delivery_date，都没有则默认7天后
+    due = pd.to_datetime(df["due_date"], errors="coerce", format="mixed")
+    if "delivery_date" in df.columns:
+        due = due.fillna(pd.to_datetime(df["delivery_date"], errors="coerce", format="mixed"))
+    df["due"] = due.fillna(now + pd.Timedelta(days=DEFAULT_DUE_DAYS))
+
+    hours = processing_hours(df["processing_time"])
+    df["hours"] = hours
+
+    # 临界比 = 剩余天数 / 加工天数，已逾期的订单剩余天数按0计
+    days_remaining = np.maximum((df["due"] - now).dt.total_seconds().to_numpy() / 86400, 0)
+    processing_days = hours / 24
+    critical_ratio = days_remaining / processing_days
+    df["priority"] = 0.4 * (1 / (critical_ratio + 1)) + \
+                     0.3 * (1 / (processing_days + 1)) + \
+                     0.3 * (1 / (days_remaining + 1))
+
+    return df.sort_values(["priority", "due"], ascending=[False, True], kind="stable")
+
+
+def list_schedule(scored, machine_free):
+    """
+    优先队列列表调度：按优先级依次把订单分配给最早空闲的设备
+    
+    Args:
+        scored: score_orders 返回的DataFrame（已按优先级排序）
+        machine_free: {设备ID: 最早可开工时间距基准时间的小时数}
+        
+    Returns:
+        tuple: (machine_ids, start_hours, end_hours) 三个与 scored 行顺序对应的数组
+    """
+    heap = [(free, machine_id) for machine_id, free in machine_free.items()]
+    heapq.heapify(heap)
+    n = len(scored)
+    machine_ids = np.empty(n, dtype="int64")
+    starts = np.empty(n, dtype="float64")
+    ends = np.empty(n, dtype="float64")
+    for i, hours in enumerate(scored["hours"].to_numpy()):
+        free, machine_id = heap[0]
+        end = free + hours
+        heapq.heapreplace(heap, (end, machine_id))
+        machine_ids[i] = machine_id
+        starts[i] = free
+        ends[i] = end
+    return machine_ids, starts, ends
+
+
+def load_machine_free_hours(conn, machine_ids, now):
+    """获取各设备在现有生产计划之后的最早空闲时间（距基准时间的小时数，不早于0）"""
+    free = {}
+    for machine_id in machine_ids:
+        # 借助 (machine_id, end_time) 索引，每台设备只需一次索引查找
+        end_time = conn.execute(
+            "SELECT MAX(end_time) FROM production_plan WHERE machine_id = ?", (machine_id,)
+        ).fetchone()[0]
+        offset = (pd.Timestamp(end_time) - now).total_seconds() / 3600 if end_time else 0.0
+        free[machine_id] = max(offset, 0.0)
+    return free
+
+
+def build_plan(scored, machine_ids, starts, ends, now):
+    """把调度结果转换为生产计划表并计算完工时间和拖期指标"""
+    base = np.datetime64(pd.Timestamp(now).to_datetime64(), "s")
+    start_ts = base + (starts * 3600).astype("timedelta64[s]")
+    end_ts = base + (ends * 3600).astype("timedelta64[s]")
+    plan = pd.DataFrame({
+        "order_id": scored["order_id"].to_numpy(),
+        "machine_id": machine_ids,
+        # numpy 按 ISO 格式批量转换字符串，比逐个 strftime 快一个数量级
+        "start_time": np.datetime_as_string(start_ts, unit="s"),
+        "end_time": np.datetime_as_string(end_ts, unit="s"),
+        "priority": scored["priority"].to_numpy(),
+    })
+    due = scored["due"].to_numpy(dtype="datetime64[s]")
+    tardiness = np.maximum((end_ts - due).astype("float64") / 3600, 0)
+    stats = {
+        "orders": len(plan),
+        "machines": int(len(np.unique(machine_ids))) if len(plan) else 0,
+        "makespan_hours": float(ends.max()) if len(plan) else 0.0,
+        "total_tardiness_hours": float(tardiness.sum()),
+        "late_orders": int((tardiness > 0).sum()),
+    }
+    return plan, stats
+
+
+def schedule_pending_orders(transaction, limit=None, now=None, start_status="processing"):
+    """
+    为待处理订单生成生产计划并写入 production_plan
+    
+    Args:
+        transaction: 返回写事务上下文管理器的函数（如 DatabaseManager.write_transaction）
+        limit: 只排产优先级最高的前 limit 个订单，None 表示全部
+        now: 排产基准时间
+        start_status: 已排产订单更新为的状态，None 表示不修改订单状态
+        
+    Returns:
+        dict: 排产订单数、使用设备数、完工时间跨度(makespan)和总拖期（小时）
+    """
+    now = pd.Timestamp(now or datetime.now()).floor("s")
+    with transaction() as conn:
+        orders = pd.read_sql(
+            "SELECT order_id, due_date, delivery_date, processing_time FROM orders WHERE status = 'pending'",
+            conn
+        )
+        machine_ids = [row[0] for row in conn.execute("SELECT id FROM machines WHERE status = '可用'")]
+        if orders.empty or not machine_ids:
+            return {"orders": 0, "machines": 0, "makespan_hours": 0.0,
+                    "total_tardiness_hours": 0.0, "late_orders": 0}
+
+        all_scored = score_orders(orders, now)
+        scored = all_scored.head(limit) if limit is not None else all_scored
+        order_ids = [int(order_id) for order_id in scored["order_id"]]
+
+        # 先用一条语句移除这些订单的旧计划，再根据其余计划计算设备空闲时间
+        conn.execute("DELETE FROM production_plan WHERE order_id IN (SELECT value FROM json_each(?))", (json.dumps(order_ids),))
+        machine_free = load_machine_free_hours(conn, machine_ids, now)
+        machines, starts, ends = list_schedule(scored, machine_free)
+        plan, stats = build_plan(scored, machines, starts, ends, now)
+
+        conn.executemany(
+            "INSERT INTO production_plan (order_id, machine_id, start_time, end_time) VALUES (?, ?, ?, ?)",
+            plan[["order_id", "machine_id", "start_time", "end_time"]].itertuples(index=False, name=None)
+        )
+        # 已排产订单同时写回优先级和状态，未排产的待处理订单只写回优先级
+        statuses = [start_status] * len(scored) + [None] * (len(all_scored) - len(scored))
+        write_back_priorities(conn, all_scored["order_id"].tolist(), all_scored["priority"].tolist(), statuses)
+        bump_table_versions(conn, "orders", "production_plan")
+    return stats
+
+
+def write_back_priorities(conn, order_ids, priorities, statuses):
+    """
+    把订单优先级和新状态暂存到临时表，再用两条集合式 UPDATE ... FROM 写回
+
+    orders 上的汇总触发器在 status 出现在 SET 中时逐行触发，
+    因此只有状态确实变化的订单才写 status，其余订单只写优先级。
+
+    Args:
+        conn: 写事务连接
+        order_ids: 订单ID列表
+        priorities: 对应的优先级
+        statuses: 对应的新状态，None 表示不修改状态
+    """
+    conn.execute(
+        "CREATE TEMP TABLE IF NOT EXISTS schedule_updates (order_id INTEGER PRIMARY KEY, priority REAL, status TEXT)"
+    )
+    conn.execute("DELETE FROM temp.schedule_updates")
+    conn.executemany(
+        "INSERT INTO temp.schedule_updates (order_id, priority, status) VALUES (?, ?, ?)",
+        zip(order_ids, priorities, statuses)
+    )
+    conn.execute(
+        '''UPDATE orders SET priority = s.priority
+           FROM temp.schedule_updates s
+           WHERE orders.order_id = s.order_id AND (s.status IS NULL OR orders.status IS s.status)'''
+    )
+    conn.execute(
+        '''UPDATE orders SET priority = s.priority, status = s.status
+           FROM temp.schedule_updates s
+           WHERE orders.order_id = s.order_id AND s.status IS NOT NULL AND orders.status IS NOT s.status'''
+    )
+    conn.execute("DELETE FROM temp.schedule_updates")
+
+
+def _empty_reschedule_stats():
+    return {"moved": 0, "shifted": 0, "makespan_hours": 0.0, "total_tardiness_hours": 0.0, "late_orders": 0}
+
+
+def reschedule_machine_down(transaction, machine_id, new_status="维修中", now=None):
+    """
+    设备停机时的增量重排：只把该设备上未完工的计划迁移到其他可用设备的队尾，其余计划不变
+    
+    Args:
+        transaction: 返回写事务上下文管理器的函数（如 DatabaseManager.write_transaction）
+        machine_id: 停机的设备ID
+        new_status: 设备的新状态
+        now: 重排基准时间，已在进行中的订单从该时间起在新设备上重新开工
+        
+    Returns:
+        dict: 迁移的计划数(moved)及迁移订单的完工时间跨度和拖期指标
+    """
+    now = pd.Timestamp(now or datetime.now()).floor("s")
+    stats = _empty_reschedule_stats()
+    with transaction() as conn:
+        conn.execute("UPDATE machines SET status = ? WHERE id = ?", (new_status, machine_id))
+        bump_table_versions(conn, "machines", "production_plan")
+        affected = pd.read_sql(
+            '''SELECT p.order_id, o.due_date, o.delivery_date, o.processing_time
+               FROM production_plan p
+               JOIN orders o ON o.order_id = p.order_id
+               WHERE p.machine_id = ? AND p.end_time > ?''',
+            conn, params=(machine_id, now.isoformat())
+        )
+        if affected.empty:
+            return stats
+        machine_ids = [row[0] for row in conn.execute(
+            "SELECT id FROM machines WHERE status = '可用' AND id != ?", (machine_id,)
+        )]
+        if not machine_ids:
+            raise ValueError("没有其他可用设备，无法重排")
+
+        scored = score_orders(affected, now)
+        conn.executemany(
+            "DELETE FROM production_plan WHERE order_id = ? AND machine_id = ?",
+            ((order_id, machine_id) for order_id in scored["order_id"].tolist())
+        )
+        machine_free = load_machine_free_hours(conn, machine_ids, now)
+        machines, starts, ends = list_schedule(scored, machine_free)
+        plan, plan_stats = build_plan(scored, machines, starts, ends, now)
+        conn.executemany(
+            "INSERT OR REPLACE INTO production_plan (order_id, machine_id, start_time, end_time) VALUES (?, ?, ?, ?)",
+            plan[["order_id", "machine_id", "start_time", "end_time"]].itertuples(index=False, name=None)
+        )
+    stats.update({k: plan_stats[k] for k in ("makespan_hours", "total_tardiness_hours", "late_orders")})
+    stats["moved"] = plan_stats["orders"]
+    return stats
+
+
+def _shift_conflicts(conn, machine_id, after_start, prev_end, exclude_order_id, chunk_size=200):
+    """
+    顺延同一设备上与前一计划时间重叠的后续计划，遇到第一个不冲突的计划即停止
+    
+    按原起始时间分批读取（键集分页），全部计算完后一次写回，读取过程不受写回影响。
+    
+    Returns:
+        int: 被顺延的计划数
+    """
+    updates = []
+    last_start, last_order_id = after_start, -1
+    done = False
+    while not done:
+        rows = conn.execute(
+            '''SELECT order_id, start_time, end_time FROM production_plan
+               WHERE machine_id = ? AND (start_time > ? OR (start_time = ? AND order_id > ?))
+               ORDER BY start_time, order_id LIMIT ?''',
+            (machine_id, last_start, last_start, last_order_id, chunk_size)
+        ).fetchall()
+        done = len(rows) < chunk_size
+        for order_id, start_time, end_time in rows:
+            if order_id == exclude_order_id:
+                continue
+            start = pd.Timestamp(start_time)
+            if start >= prev_end:
+                done = True
+                break
+            new_start = prev_end
+            prev_end = new_start + (pd.Timestamp(end_time) - start)
+            updates.append((new_start.isoformat(), prev_end.isoformat(), order_id, machine_id))
+        if rows:
+            last_start, last_order_id = rows[-1][1], rows[-1][0]
+    conn.executemany(
+        "UPDATE production_plan SET start_time = ?, end_time = ? WHERE order_id = ? AND machine_id = ?",
+        updates
+    )
+    return len(updates)
+
+
+def reschedule_order(transaction, order_id, now=None):
+    """
+    订单变更后的增量重排：按新的加工时长更新该订单的计划，并只顺延同一设备上因此冲突的后续计划
+    
+    订单已取消或完成时删除其计划；订单尚未排产时追加到最早空闲的可用设备。
+    
+    Returns:
+        dict: 迁移(moved)和顺延(shifted)的计划数
+    """
+    now = pd.Timestamp(now or datetime.now()).floor("s")
+    stats = _empty_reschedule_stats()
+    with transaction() as conn:
+        order = conn.execute(
+            "SELECT order_id, status, due_date, delivery_date, processing_time FROM orders WHERE order_id = ?",
+            (order_id,)
+        ).fetchone()
+        if order is None:
+            raise ValueError(f"订单 {order_id} 不存在")
+        entry = conn.execute(
+            "SELECT machine_id, start_time, end_time FROM production_plan WHERE order_id = ?", (order_id,)
+        ).fetchone()
+
+        bump_table_versions(conn, "production_plan")
+        if order["status"] not in ("pending", "processing"):
+            if entry is not None:
+                conn.execute("DELETE FROM production_plan WHERE order_id = ?", (order_id,))
+            return stats
+
+        hours = float(processing_hours([order["processing_time"]])[0])
+        if entry is None:
+            # 尚未排产：追加到最早空闲的设备
+            machine_ids = [row[0] for row in conn.execute("SELECT id FROM machines WHERE status = '可用'")]
+            if not machine_ids:
+                raise ValueError("没有可用设备，无法排产")
+            scored = score_orders(pd.DataFrame([dict(order)]), now)
+            machines, starts, ends = list_schedule(scored, load_machine_free_hours(conn, machine_ids, now))
+            plan, plan_stats = build_plan(scored, machines, starts, ends, now)
+            conn.executemany(
+                "INSERT INTO production_plan (order_id, machine_id, start_time, end_time) VALUES (?, ?, ?, ?)",
+                plan[["order_id", "machine_id", "start_time", "end_time"]].itertuples(index=False, name=None)
+            )
+            stats["moved"] = 1
+            return stats
+
+        machine_id, start_time = entry["machine_id"], entry["start_time"]
+        new_end = pd.Timestamp(start_time) + pd.Timedelta(hours=hours)
+        conn.execute(
+            "UPDATE production_plan SET end_time = ? WHERE order_id = ? AND machine_id = ?",
+            (new_end.isoformat(), order_id, machine_id)
+        )
+        stats["shifted"] = _shift_conflicts(conn, machine_id, start_time, new_end, order_id)
+    return stats
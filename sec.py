@@ -2,7 +2,7 @@ import streamlit as st
 import hashlib
 import json
 import os
-from rights import load_users, save_users, hash_password, check_permission, get_current_user, rerun
+from rights import get_user_store, hash_password, check_permission, get_current_user, rerun
 
 def verify_old_password(username, old_password):
     """
@@ -15,9 +15,9 @@ def verify_old_password(username, old_password):
     Returns:
         bool: 原密码是否正确
     """
-    users = load_users()
-    if username in users:
-        hashed_pwd = users[username]["password"]
+    user = get_user_store().get(username)
+    if user is not None:
+        hashed_pwd = user["password"]
         return hashed_pwd == hash_password(old_password)
     return False
 
@@ -32,12 +32,7 @@ def update_password(username, new_password):
     Returns:
         bool: 更新是否成功
     """
-    users = load_users()
-    if username in users:
-        users[username]["password"] = hash_password(new_password)
-        save_users(users)
-        return True
-    return False
+    return get_user_store().update_user(username, password=hash_password(new_password))
 
 def change_password_page():
     """
@@ -0,0 +1,313 @@
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+import pandas as pd
+import streamlit as st
+from rights import check_permission
+
+# SQL 语句级性能统计
+# 开启后连接池用 ProfilingConnection 创建连接，每条语句记录执行+取数耗时、返回行数、调用位置和所在页面；
+# 关闭时连接池使用原生 sqlite3.Connection，没有任何额外开销。
+# 开关和慢查询阈值可在管理员页面运行时修改，开关切换后连接池会重建连接。
+
+SLOW_QUERY_LOG = os.environ.get("ERP_SQL_SLOW_LOG", "slow_queries.log")
+
+_enabled = os.environ.get("ERP_SQL_PROFILE", "0") == "1"
+_slow_threshold_ms = float(os.environ.get("ERP_SQL_SLOW_MS", "200"))
+_stats = {}
+_stats_lock = threading.Lock()
+_context = threading.local()
+_slow_logger = None
+_slow_logger_lock = threading.Lock()
+
+# 调用位置只记录本项目的源文件，跳过本模块和连接池内部
+_PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+_SKIP_FILES = {os.path.abspath(__file__)}
+_WHITESPACE = re.compile(r"\s+")
+_project_files = {}  # 源文件路径 -> 项目内文件名（非项目文件为空串）
+
+
+def is_enabled():
+    """是否开启SQL性能统计"""
+    return _enabled
+
+
+def set_enabled(enabled):
+    """开启或关闭SQL性能统计（需重建连接池后对新连接生效，见 dataset.set_sql_profiling）"""
+    global _enabled
+    _enabled = bool(enabled)
+
+
+def get_slow_threshold_ms():
+    """慢查询阈值（毫秒）"""
+    return _slow_threshold_ms
+
+
+def set_slow_threshold_ms(threshold_ms):
+    """设置慢查询阈值（毫秒）"""
+    global _slow_threshold_ms
+    _slow_threshold_ms = float(threshold_ms)
+
+
+def set_current_page(page):
+    """记录当前线程正在渲染的页面，之后的语句统计归入该页面"""
+    _context.page = page
+
+
+def get_current_page():
+    return getattr(_context, "page", None) or "（后台）"
+
+
+def _get_slow_logger():
+    """慢查询日志（按大小轮转）"""
+    global _slow_logger
+    if _slow_logger is None:
+        with _slow_logger_lock:
+            if _slow_logger is None:
+                logger = logging.getLogger("erp.slow_sql")
+                logger.setLevel(logging.WARNING)
+                logger.propagate = False
+                handler = RotatingFileHandler(SLOW_QUERY_LOG, maxBytes=5 * 1024 * 1024, backupCount=3, encoding="utf-8")
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                logger.addHandler(handler)
+                _slow_logger = logger
+    return _slow_logger
+
+
+def _call_site():
+    """调用栈中第一个属于本项目（且不是本模块）的位置"""
+    frame = sys._getframe(1)
+    while frame is not None:
+        code = frame.f_code
+        name = _project_files.get(code.co_filename)
+        if name is None:
+            filename = os.path.abspath(code.co_filename)
+            in_project = filename.startswith(_PROJECT_DIR) and filename not in _SKIP_FILES
+            name = _project_files[code.co_filename] = os.path.basename(filename) if in_project else ""
+        if name:
+            return f"{name}:{frame.f_lineno} {code.co_name}"
+        frame = frame.f_back
+    return "（未知）"
+
+
+def normalize_sql(sql):
+    """合并空白字符，使同一语句的不同排版归为一类"""
+    return _WHITESPACE.sub(" ", sql).strip()
+
+
+def _record(sql, page, call_site, elapsed, rows):
+    """汇总一条语句的执行结果，超过阈值时写入慢查询日志"""
+    key = (page, sql)
+    with _stats_lock:
+        entry = _stats.get(key)
+        if entry is None:
+            _stats[key] = entry = {"calls": 0, "total_s": 0.0, "max_s": 0.0, "rows": 0, "call_site": call_site}
+        entry["calls"] += 1
+        entry["total_s"] += elapsed
+        entry["rows"] += rows
+        if elapsed > entry["max_s"]:
+            entry["max_s"] = elapsed
+            entry["call_site"] = call_site
+    elapsed_ms = elapsed * 1000
+    if elapsed_ms >= _slow_threshold_ms:
+        _get_slow_logger().warning(
+            f"{datetime.now().isoformat()} | {elapsed_ms:.1f}ms | {rows} 行 | {page} | {call_site} | {sql}"
+        )
+
+
+class ProfilingCursor(sqlite3.Cursor):
+    """记录语句耗时和返回行数的游标：执行耗时加上后续取数耗时，结果取完或游标复用时汇总"""
+
+    _pending = None
+
+    def _begin(self, sql, elapsed):
+        rows = 0 if self.description is not None else max(self.rowcount, 0)
+        self._pending = [normalize_sql(sql), get_current_page(), _call_site(), elapsed, rows]
+        # 非查询语句没有后续取数，立即汇总
+        if self.description is None:
+            self._finish()
+
+    def _finish(self):
+        pending = self._pending
+        if pending is not None:
+            self._pending = None
+            _record(*pending)
+
+    def _add(self, started, rows):
+        pending = self._pending
+        if pending is not None:
+            pending[3] += time.perf_counter() - started
+            pending[4] += rows
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._begin(sql, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._begin(sql, time.perf_counter() - started)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._add(started, 0 if row is None else 1)
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        started = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._add(started, len(rows))
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._add(started, len(rows))
+        self._finish()
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._finish()
+            raise
+        self._add(started, 1)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        self._finish()
+
+
+class ProfilingConnection(sqlite3.Connection):
+    """游标默认使用 ProfilingCursor 的连接（Connection.execute 不经过 cursor()，需单独覆盖）"""
+
+    def cursor(self, factory=ProfilingCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def connection_factory():
+    """连接池创建连接时使用的连接类"""
+    return ProfilingConnection if _enabled else sqlite3.Connection
+
+
+def get_stats():
+    """
+    获取语句统计
+
+    Returns:
+        list[dict]: 每个 (页面, 语句) 一项，包含调用次数、总耗时、最大耗时、返回行数和最慢一次的调用位置
+    """
+    with _stats_lock:
+        return [
+            {"page": page, "sql": sql, **entry}
+            for (page, sql), entry in _stats.items()
+        ]
+
+
+def reset_stats():
+    """清空语句统计"""
+    with _stats_lock:
+        _stats.clear()
+
+
+def read_slow_log(limit=100):
+    """读取慢查询日志最近的若干行"""
+    if not os.path.exists(SLOW_QUERY_LOG):
+        return []
+    with open(SLOW_QUERY_LOG, "r", encoding="utf-8") as f:
+        return f.readlines()[-limit:]
+
+
+def sql_profile_page():
+    """SQL性能统计页面（仅管理员）"""
+    from dataset import set_sql_profiling
+
+    check_permission("SQL性能")
+
+    col1, col2, col3 = st.columns([1, 1, 1])
+    enabled = col1.toggle("开启SQL性能统计", value=is_enabled())
+    if enabled != is_enabled():
+        set_sql_profiling(enabled)
+        st.rerun()
+    threshold = col2.number_input("慢查询阈值(毫秒)", min_value=0.0, value=get_slow_threshold_ms(), step=50.0)
+    if threshold != get_slow_threshold_ms():
+        set_slow_threshold_ms(threshold)
+    if col3.button("清空统计"):
+        reset_stats()
+        st.rerun()
+
+    stats = pd.DataFrame(get_stats())
+    if stats.empty:
+        st.info("暂无统计数据" if is_enabled() else "SQL性能统计未开启")
+    else:
+        stats["total_ms"] = stats["total_s"] * 1000
+        stats["avg_ms"] = stats["total_ms"] / stats["calls"]
+        stats["max_ms"] = stats["max_s"] * 1000
+
+        # 各页面的语句数和耗时
+        st.subheader("各页面SQL耗时")
+        by_page = stats.groupby("page").agg(
+            statements=("sql", "nunique"), calls=("calls", "sum"), total_ms=("total_ms", "sum"), rows=("rows", "sum")
+        ).sort_values("total_ms", ascending=False)
+        st.dataframe(by_page, column_config={"total_ms": st.column_config.NumberColumn(format="%.1f")})
+
+        # 按总耗时排序的语句
+        st.subheader("耗时最多的语句")
+        pages = ["全部页面"] + by_page.index.tolist()
+        page = st.selectbox("页面", pages)
+        view = stats if page == "全部页面" else stats[stats["page"] == page]
+        top = view.groupby("sql").agg(
+            calls=("calls", "sum"), total_ms=("total_ms", "sum"), max_ms=("max_ms", "max"),
+            rows=("rows", "sum"), call_site=("call_site", "first")
+        )
+        top["avg_ms"] = top["total_ms"] / top["calls"]
+        top_n = st.slider("显示条数", 5, 100, 20)
+        st.dataframe(
+            top.sort_values("total_ms", ascending=False).head(top_n).reset_index()[
+                ["sql", "calls", "total_ms", "avg_ms", "max_ms", "rows", "call_site"]
+            ],
+            column_config={
+                "total_ms": st.column_config.NumberColumn(format="%.2f"),
+                "avg_ms": st.column_config.NumberColumn(format="%.3f"),
+                "max_ms": st.column_config.NumberColumn(format="%.2f"),
+            },
+            use_container_width=True
+        )
+
+    st.subheader("慢查询日志")
+    lines = read_slow_log()
+    if lines:
+        st.code("".join(reversed(lines)), language=None)
+    else:
+        st.write("暂无慢查询")
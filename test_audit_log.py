@@ -0,0 +1,43 @@
+import pytest
+
+from audit_log import MODE_ASYNC, MODE_GROUP, AuditLogSink
+from dataset import DatabaseManager
+
+
+@pytest.fixture(params=[MODE_ASYNC, MODE_GROUP])
+def sink(request, database):
+    sink = AuditLogSink(DatabaseManager.write_transaction, mode=request.param,
+                        flush_interval=60, on_commit=DatabaseManager.on_commit)
+    yield sink
+    sink.close()
+
+
+def _details(conn):
+    return [row[0] for row in conn.execute("SELECT details FROM operation_logs WHERE operation_type = 'TEST' ORDER BY log_id")]
+
+
+def test_audit_rows_follow_the_business_transaction(sink, database):
+    with pytest.raises(RuntimeError):
+        with DatabaseManager.write_transaction() as conn:
+            sink.record("tester", "TEST", "orders", 1, "rolled back", conn=conn)
+            raise RuntimeError("业务写入失败")
+    with DatabaseManager.write_transaction() as conn:
+        sink.record("tester", "TEST", "orders", 2, "committed", conn=conn)
+    sink.record("tester", "TEST", "orders", 3, "standalone")
+    sink.flush()
+    assert _details(database) == ["committed", "standalone"]
+
+
+def test_async_rows_are_buffered_only_after_commit(database):
+    sink = AuditLogSink(DatabaseManager.write_transaction, mode=MODE_ASYNC,
+                        flush_interval=60, on_commit=DatabaseManager.on_commit)
+    try:
+        with DatabaseManager.write_transaction() as conn:
+            sink.record("tester", "TEST", "orders", 1, "pending", conn=conn)
+            assert not sink._buffer
+        assert len(sink._buffer) == 1
+        assert _details(database) == []
+        sink.flush()
+        assert _details(database) == ["pending"]
+    finally:
+        sink.close()
@@ -0,0 +1,64 @@
+from datetime import date
+
+import dataset
+
+
+# 数据看板汇总表与按订单重新统计的结果应一致（已取消的订单不计入销售额）
+ORDER_SUMMARY = '''SELECT substr(order_date, 1, 10), SUM(status != 'cancelled'), SUM((status != 'cancelled') * total_amount)
+                   FROM orders GROUP BY substr(order_date, 1, 10)'''
+CUSTOMER_SUMMARY = '''SELECT customer_name, SUM(status != 'cancelled'), SUM((status != 'cancelled') * total_amount)
+                      FROM orders GROUP BY customer_name'''
+ITEM_SUMMARY = '''SELECT oi.item_id, SUM(oi.quantity), SUM(oi.subtotal)
+                  FROM order_items oi JOIN orders o ON o.order_id = oi.order_id
+                  WHERE o.status != 'cancelled' GROUP BY oi.item_id'''
+
+
+def _rows(conn, sql):
+    """把汇总结果转换为字典，忽略计数为0的行"""
+    return {row[0]: (row[1], round(row[2], 2)) for row in conn.execute(sql) if row[1]}
+
+
+def _assert_summaries_match(conn):
+    assert _rows(conn, "SELECT day, order_count, total_amount FROM sales_daily") == _rows(conn, ORDER_SUMMARY)
+    assert _rows(conn, "SELECT customer_name, order_count, total_amount FROM customer_sales_summary") == \
+        _rows(conn, CUSTOMER_SUMMARY)
+    assert _rows(conn, "SELECT item_id, quantity, revenue FROM item_sales_summary") == _rows(conn, ITEM_SUMMARY)
+
+
+def _create_order(order_no, customer_name, items):
+    today = date.today().isoformat()
+    assert dataset.create_order(order_no, customer_name, today, today, items, "tester")
+    conn = dataset.DatabaseManager.get_connection()
+    return conn.execute("SELECT order_id FROM orders WHERE order_no = ?", (order_no,)).fetchone()[0]
+
+
+def test_cancelled_orders_excluded_from_all_summaries(database):
+    conn = database
+    assert dataset.add_item("螺丝", "M6", "个", 2.0, "tester")
+    assert dataset.add_item("轴承", "6204", "个", 15.0, "tester")
+    screw, bearing = [row[0] for row in conn.execute("SELECT item_id FROM items ORDER BY item_id")]
+    assert dataset.adjust_inventory(screw, 100, "入库", "tester")
+    assert dataset.adjust_inventory(bearing, 100, "入库", "tester")
+
+    kept = _create_order("T-001", "张三机械", [{"item_id": screw, "quantity": 10, "unit_price": 2.0}])
+    cancelled = _create_order("T-002", "张三机械", [
+        {"item_id": screw, "quantity": 5, "unit_price": 2.0},
+        {"item_id": bearing, "quantity": 2, "unit_price": 15.0},
+    ])
+    _assert_summaries_match(conn)
+
+    # 取消订单：三张汇总表都减去该订单
+    assert dataset.update_order_status(cancelled, "cancelled", "tester")
+    _assert_summaries_match(conn)
+    items = {row[0]: (row[1], row[2]) for row in conn.execute("SELECT item_id, quantity, revenue FROM item_sales_summary")}
+    assert items[screw] == (10, 20.0)
+    assert items.get(bearing, (0, 0.0)) == (0, 0.0)
+    customer = conn.execute("SELECT order_count, total_amount FROM customer_sales_summary WHERE customer_name = '张三机械'").fetchone()
+    assert tuple(customer) == (1, 20.0)
+
+    # 恢复订单后重新计入，删除订单后移除
+    assert dataset.update_order_status(cancelled, "pending", "tester")
+    _assert_summaries_match(conn)
+    with dataset.DatabaseManager.write_transaction() as write_conn:
+        write_conn.execute("DELETE FROM orders WHERE order_id = ?", (kept,))
+    _assert_summaries_match(conn)
@@ -0,0 +1,88 @@
+from datetime import date
+
+import numpy as np
+
+import dataset
+from dataset import DatabaseManager
+
+
+def _rows(conn, sql, *params):
+    return [tuple(row) for row in conn.execute(sql, params)]
+
+
+def _bulk_order(order_no, item_id, quantity):
+    today = date.today().isoformat()
+    return {"order_no": order_no, "customer_name": "张三机械", "order_date": today, "delivery_date": today,
+            "items": [{"item_id": item_id, "quantity": quantity, "unit_price": 2.0}]}
+
+
+def test_bulk_order_ids_are_not_reused_after_delete(database, make_item):
+    conn = database
+    screw = make_item("螺丝", stock=100)
+    result = dataset.create_orders_bulk([_bulk_order(f"B-{n}", screw, 1) for n in range(3)], "tester")
+    assert result["created"] == ["B-0", "B-1", "B-2"]
+    last_id = conn.execute("SELECT MAX(order_id) FROM orders").fetchone()[0]
+    with DatabaseManager.write_transaction() as write_conn:
+        write_conn.execute("DELETE FROM orders WHERE order_id = ?", (last_id,))
+
+    # numpy 数值（如来自DataFrame）同样可以写入
+    result = dataset.create_orders_bulk([_bulk_order("B-3", np.int64(screw), np.int64(2))], "tester")
+    assert result["created"] == ["B-3"]
+    order_id = conn.execute("SELECT order_id FROM orders WHERE order_no = 'B-3'").fetchone()[0]
+    assert order_id > last_id
+    # 新订单的明细、流水和日志都挂在新ID上，旧ID的日志不会被误认为属于新订单
+    assert _rows(conn, "SELECT item_id, quantity FROM order_items WHERE order_id = ?", order_id) == [(screw, 2)]
+    assert _rows(conn, "SELECT delta FROM inventory_movements WHERE ref_type = 'order' AND ref_id = ?", order_id) == [(-2,)]
+    assert _rows(conn, "SELECT details FROM operation_logs WHERE table_name = 'orders' AND record_id = ?", order_id) == \
+        [("创建订单：B-3",)]
+    assert conn.execute("SELECT current_stock FROM inventory WHERE item_id = ?", (screw,)).fetchone()[0] == 95
+
+
+def test_bulk_orders_reject_insufficient_stock(database, make_item):
+    conn = database
+    screw = make_item("螺丝", stock=5)
+    result = dataset.create_orders_bulk(
+        [_bulk_order("B-0", screw, 3), _bulk_order("B-1", screw, 3), _bulk_order("B-0", screw, 1)], "tester"
+    )
+    assert result["created"] == ["B-0"]
+    assert sorted(r["order_no"] for r in result["rejected"]) == ["B-0", "B-1"]
+    assert conn.execute("SELECT current_stock FROM inventory WHERE item_id = ?", (screw,)).fetchone()[0] == 2
+
+
+def _pages(**filters):
+    """按游标翻完所有页，返回每页的订单ID"""
+    pages, cursor = [], None
+    while True:
+        df, cursor = dataset.query_orders_page(after=cursor, limit=4, **filters)
+        pages.append(list(df["order_id"]))
+        if cursor is None:
+            return pages
+
+
+def test_keyset_pages_have_no_duplicates_or_gaps(database):
+    conn = database
+    # 多个订单同一下单时间，翻页游标需要 order_id 区分
+    rows = [
+        (f"K-{n:02d}", "张三机械" if n % 3 else "李四五金", f"2026-01-{1 + n // 4:02d}T08:00:00",
+         "cancelled" if n % 5 == 0 else "pending", "tester", "2026-01-01T08:00:00")
+        for n in range(18)
+    ]
+    with DatabaseManager.write_transaction() as write_conn:
+        write_conn.executemany(
+            '''INSERT INTO orders (order_no, customer_name, order_date, status, created_by, created_at)
+               VALUES (?, ?, ?, ?, ?, ?)''',
+            rows
+        )
+
+    for filters, where, params in [
+        ({}, "", ()),
+        ({"status": "pending"}, "WHERE status = ?", ("pending",)),
+        ({"customer": "张三", "date_from": date(2026, 1, 2), "date_to": date(2026, 1, 4)},
+         "WHERE customer_name = ? AND order_date >= ? AND order_date < ?", ("张三机械", "2026-01-02", "2026-01-05")),
+    ]:
+        pages = _pages(**filters)
+        expected = [row[0] for row in conn.execute(
+            f"SELECT order_id FROM orders {where} ORDER BY order_date DESC, order_id DESC", params
+        )]
+        assert [order_id for page in pages for order_id in page] == expected
+        assert all(len(page) == 4 for page in pages[:-1])
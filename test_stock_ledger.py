@@ -0,0 +1,105 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import dataset
+from dataset import DatabaseManager, StockMovementError, apply_stock_movements, move_stock
+
+
+def _stock(conn, item_id):
+    return conn.execute("SELECT current_stock FROM inventory WHERE item_id = ?", (item_id,)).fetchone()[0]
+
+
+def _ledger(conn, item_id):
+    return [tuple(row) for row in conn.execute(
+        "SELECT delta, balance_after FROM inventory_movements WHERE item_id = ? ORDER BY movement_id", (item_id,)
+    )]
+
+
+def test_movements_update_stock_and_ledger(database, make_item):
+    conn = database
+    screw, bearing = make_item("螺丝", stock=10), make_item("轴承")
+    with DatabaseManager.write_transaction() as write_conn:
+        balances = apply_stock_movements(write_conn, [(screw, -4), (bearing, 7), (screw, 0)], "出入库", "tester")
+    assert balances == [6, 7, 6]
+    assert (_stock(conn, screw), _stock(conn, bearing)) == (6, 7)
+    # 变动量为0时不记流水
+    assert _ledger(conn, screw) == [(10, 10), (-4, 6)]
+    assert _ledger(conn, bearing) == [(7, 7)]
+
+
+def test_movement_below_zero_rolls_back_whole_transaction(database, make_item):
+    conn = database
+    screw, bearing = make_item("螺丝", stock=10), make_item("轴承", stock=3)
+    with pytest.raises(StockMovementError) as excinfo:
+        with DatabaseManager.write_transaction() as write_conn:
+            apply_stock_movements(write_conn, [(screw, -5), (bearing, -4)], "出库", "tester")
+    assert (excinfo.value.item_id, excinfo.value.current_stock, excinfo.value.missing) == (bearing, 3, False)
+    # 之前已应用的变动随事务回滚
+    assert (_stock(conn, screw), _stock(conn, bearing)) == (10, 3)
+    assert _ledger(conn, screw) == [(10, 10)]
+    assert _ledger(conn, bearing) == [(3, 3)]
+
+
+def test_movement_for_missing_item_is_rejected(database):
+    with pytest.raises(StockMovementError) as excinfo:
+        with DatabaseManager.write_transaction() as write_conn:
+            apply_stock_movements(write_conn, [(999, 1)], "入库", "tester")
+    assert excinfo.value.missing
+
+
+def test_move_stock_skips_rejected_movements_when_not_atomic(database, make_item):
+    conn = database
+    screw, bearing = make_item("螺丝", stock=10), make_item("轴承", stock=3)
+    result = move_stock([(screw, -5), (bearing, -4), (screw, -1)], "扫码出库", "tester", atomic=False)
+    assert (result["applied"], result["balances"]) == (2, [5, 4])
+    assert [(r["item_id"], r["delta"]) for r in result["rejected"]] == [(bearing, -4)]
+    assert (_stock(conn, screw), _stock(conn, bearing)) == (4, 3)
+
+    # 整批模式下任一变动失败则全部不生效
+    result = move_stock([(screw, -1), (bearing, -4)], "扫码出库", "tester")
+    assert result["applied"] == 0 and len(result["rejected"]) == 1
+    assert (_stock(conn, screw), _stock(conn, bearing)) == (4, 3)
+
+
+def test_adjust_inventory_refuses_negative_stock(database, make_item):
+    conn = database
+    screw = make_item("螺丝", stock=2)
+    assert not dataset.adjust_inventory(screw, -3, "出库", "tester")
+    assert _stock(conn, screw) == 2
+    assert _ledger(conn, screw) == [(2, 2)]
+
+
+def _move(item_id, delta, at):
+    with DatabaseManager.write_transaction() as write_conn:
+        apply_stock_movements(write_conn, [(item_id, delta)], "测试", "tester", created_at=at.isoformat())
+
+
+def test_stock_as_of_around_snapshot_boundaries(database, make_item):
+    screw = make_item("螺丝")
+    t1, t2, t3 = datetime(2026, 1, 1, 8), datetime(2026, 1, 2, 8), datetime(2026, 1, 3, 8)
+    _move(screw, 10, t1)
+    assert dataset.take_stock_snapshot(snapshot_at=t2) == 1
+    # 与快照同一时刻、在快照之后提交的流水不在快照内
+    _move(screw, 5, t2)
+    _move(screw, -3, t3)
+
+    assert dataset.get_stock_as_of(screw, t1 - timedelta(seconds=1)) == 0
+    assert dataset.get_stock_as_of(screw, t1) == 10
+    assert dataset.get_stock_as_of(screw, t2 - timedelta(seconds=1)) == 10
+    assert dataset.get_stock_as_of(screw, t2) == 15
+    assert dataset.get_stock_as_of(screw, t3 - timedelta(seconds=1)) == 15
+    assert dataset.get_stock_as_of(screw, t3) == 12
+    assert dataset.get_stock_as_of(screw, date(2026, 1, 2)) == 15
+    assert dataset.get_stock_as_of(screw, datetime.now()) == 12
+
+
+def test_stock_as_of_without_snapshot(database, make_item):
+    screw = make_item("螺丝")
+    _move(screw, 10, datetime(2026, 1, 1, 8))
+    _move(screw, -4, datetime(2026, 1, 2, 8))
+    # 没有快照时从当前库存倒推
+    assert dataset.get_stock_as_of(screw, datetime(2025, 12, 31)) == 0
+    assert dataset.get_stock_as_of(screw, date(2026, 1, 1)) == 10
+    assert dataset.get_stock_as_of(screw, date(2026, 1, 2)) == 6
+    assert dataset.get_stock_as_of(999, date(2026, 1, 2)) is None
@@ -1,23 +1,20 @@
+import json
 import pandas as pd
 import streamlit as st
 import plotly.express as px
 from st_aggrid import GridOptionsBuilder, AgGrid, GridUpdateMode, DataReturnMode
-from dataset import DatabaseManager
+from dataset import (DatabaseManager, bump_table_versions, apply_stock_movements, move_stock,
+    get_stock_as_of, get_stock_movements)
 from rights import check_permission
 from datetime import datetime
+from audit_log import log_operation, get_audit_sink
+from alerts import compute_inventory_alerts, render_inventory_alerts
 
 # 添加日志记录功能
 def log_action(user, operation_type, table_name, record_id, details):
-    """记录操作日志"""
+    """记录操作日志（交给日志写入器批量写入）"""
     try:
-        conn = DatabaseManager.get_connection()
-        cursor = conn.cursor()
-        created_at = datetime.now().isoformat()
-        cursor.execute(
-            "INSERT INTO operation_logs (user_id, operation_type, table_name, record_id, details, created_at) VALUES (?, ?, ?, ?, ?, ?)",
-            (user, operation_type, table_name, record_id, details, created_at)
-        )
-        conn.commit()
+        log_operation(user, operation_type, table_name, record_id, details)
     except Exception as e:
         print(f"日志记录失败：{e}")  # 使用print而非st.error，避免干扰用户界面
 
@@ -40,21 +37,91 @@ def validate_inventory_data(df):
     
     return errors
 
+# 表格中可编辑的库存列
+EDITABLE_INVENTORY_COLUMNS = ["current_stock", "min_stock", "max_stock"]
+
+def find_inventory_changes(original_df, updated_df, columns=EDITABLE_INVENTORY_COLUMNS):
+    """
+    一次向量化比较找出被修改的库存行
+    
+    Returns:
+        DataFrame: 以 inventory_id 为索引，包含各可编辑列的新值，以及 old_<列名> 原值
+    """
+    if original_df.empty or updated_df.empty or "inventory_id" not in updated_df.columns:
+        return pd.DataFrame(columns=columns)
+    
+    # 按 inventory_id 对齐（表格可能被排序或筛选）
+    old = original_df.set_index("inventory_id")[columns].apply(pd.to_numeric, errors="coerce")
+    new = updated_df.drop_duplicates("inventory_id").set_index("inventory_id")[columns].apply(pd.to_numeric, errors="coerce")
+    ids = new.index.intersection(old.index)
+    old, new = old.loc[ids], new.loc[ids]
+    
+    # 两边都为空值视为未修改
+    changed = (old.ne(new) & ~(old.isna() & new.isna())).any(axis=1)
+    changes = new.loc[changed].copy()
+    for col in columns:
+        changes[f"old_{col}"] = old.loc[changed, col]
+    return changes
+
+def save_inventory_changes(changes, user, columns=EDITABLE_INVENTORY_COLUMNS):
+    """
+    写回修改的库存行，并为每条修改写入结构化审计日志
+
+    最低/最高库存用一次 executemany 写回；当前库存按编辑前后的差额记为库存变动，
+    表格加载后其他会话产生的出入库不会被覆盖，变动后库存为负时整批回滚。
+    """
+    if changes.empty:
+        return 0
+    
+    updated_at = datetime.now().isoformat()
+    update_rows = [
+        (int(row.min_stock), int(row.max_stock), updated_at, int(inventory_id))
+        for inventory_id, row in zip(changes.index, changes[columns].itertuples(index=False))
+    ]
+    stock_deltas = {
+        int(inventory_id): (_to_int(new) or 0) - (_to_int(old) or 0)
+        for inventory_id, new, old in zip(changes.index, changes["current_stock"], changes["old_current_stock"])
+    }
+    
+    # 审计日志：每条修改单独记录，details 为包含字段新旧值的JSON
+    log_rows = []
+    for inventory_id, record in zip(changes.index, changes.to_dict("records")):
+        diff = {
+            col: {"old": _to_int(record[f"old_{col}"]), "new": _to_int(record[col])}
+            for col in columns
+            if _to_int(record[f"old_{col}"]) != _to_int(record[col])
+        }
+        details = json.dumps({"inventory_id": int(inventory_id), "changes": diff}, ensure_ascii=False)
+        log_rows.append((user, "UPDATE", "inventory", int(inventory_id), details, updated_at))
+    
+    with DatabaseManager.write_transaction() as conn:
+        conn.executemany(
+            "UPDATE inventory SET min_stock = ?, max_stock = ?, last_updated = ? WHERE inventory_id = ?",
+            update_rows
+        )
+        moved = {inventory_id: delta for inventory_id, delta in stock_deltas.items() if delta != 0}
+        if moved:
+            item_ids = dict(conn.execute(
+                "SELECT inventory_id, item_id FROM inventory WHERE inventory_id IN (SELECT value FROM json_each(?))",
+                (json.dumps(list(moved)),)
+            ).fetchall())
+            # 流水时间由 apply_stock_movements 在写事务内取得，不使用事务外的 updated_at
+            apply_stock_movements(
+                conn, [(item_ids[inventory_id], delta) for inventory_id, delta in moved.items() if inventory_id in item_ids],
+                "库存表格编辑", user, ref_type="edit"
+            )
+        bump_table_versions(conn, "inventory")
+        get_audit_sink().record_many(log_rows, conn=conn)
+    return len(update_rows)
+
+def _to_int(value):
+    """把数值转换为可JSON序列化的整数，空值返回None"""
+    return None if pd.isna(value) else int(value)
+
 # 添加库存预警功能
 def check_inventory_alerts(df):
-    """检查库存预警"""
-    alerts = []
-    if "current_stock" in df.columns and "min_stock" in df.columns:
-        for _, row in df.iterrows():
-            if row["current_stock"] < row["min_stock"]:
-                alerts.append({
-                    "item_name": row.get("item_name", "未知商品"),
-                    "current_stock": row["current_stock"],
-                    "min_stock": row["min_stock"],
-                    "max_stock": row.get("max_stock", 0),
-                    "alert_type": "低库存警告"
-                })
-    return alerts
+    """检查库存预警，返回 (各级别数量汇总, 预警明细表)"""
+    return compute_inventory_alerts(df)
 
 # 添加库存可视化功能
 def visualize_inventory(df):
@@ -113,14 +180,9 @@ def inventory_management_page():
         return
     
     # 显示库存预警
-    alerts = check_inventory_alerts(df_inventory)
-    if alerts:
-        with st.expander("库存预警", expanded=True):
-            for alert in alerts:
-                color = "🔴" if alert["alert_type"] == "紧急补货" else "🟡"
-                st.warning(f"{color} {alert['alert_type']}: {alert['item_name']} 库存({alert['current_stock']})低于最低库存({alert['min_stock']})！")
-    else:
-        st.success("✅ 所有商品库存状态正常")
+    summary, alert_detail = check_inventory_alerts(df_inventory)
+    with st.expander("库存预警", expanded=not alert_detail.empty):
+        render_inventory_alerts(summary, alert_detail, key="update_alerts")
     
     # 配置表格选项
     gb = GridOptionsBuilder.from_dataframe(df_inventory)
@@ -162,10 +224,11 @@ def inventory_management_page():
     # 获取更新后的数据
     updated_df = pd.DataFrame(grid_response['data'])
     
-    # 检查数据是否发生变化
-    if not updated_df.equals(df_inventory):
-        # 验证数据
-        validation_errors = validate_inventory_data(updated_df)
+    # 只找出实际修改的行
+    changes = find_inventory_changes(df_inventory, updated_df)
+    if not changes.empty:
+        # 验证修改后的数据
+        validation_errors = validate_inventory_data(changes[EDITABLE_INVENTORY_COLUMNS])
         
         if validation_errors:
             st.error("数据验证失败：")
@@ -173,52 +236,42 @@ def inventory_management_page():
                 st.error(f"- {error}")
         else:
             try:
-                # 更新数据库
-                conn = DatabaseManager.get_connection()
-                cursor = conn.cursor()
-                
-                # 开始事务
-                cursor.execute("BEGIN TRANSACTION")
-                
-                # 遍历更新每一行
-                for _, row in updated_df.iterrows():
-                    # 只更新实际变化的行
-                    original_row = df_inventory[df_inventory["inventory_id"] == row["inventory_id"]]
-                    if not original_row.empty:
-                        cursor.execute(
-                            "UPDATE inventory SET current_stock = ?, min_stock = ?, max_stock = ?, last_updated = ? WHERE inventory_id = ?",
-                            (
-                                row["current_stock"], 
-                                row["min_stock"], 
-                                row["max_stock"],
-                                datetime.now().isoformat(),
-                                row["inventory_id"]
-                            )
-                        )
-                
-                # 提交事务
-                conn.commit()
-                
-                # 记录操作日志
-                log_action(current_user, "UPDATE", "inventory", None, f"更新了{len(updated_df)}条库存记录")
-                
-                st.success("库存数据已更新")
+                # 批量写回修改的行
+                saved_count = save_inventory_changes(changes, current_user)
+                st.success(f"库存数据已更新（{saved_count}条记录）")
                 
                 # 刷新数据
                 df_inventory = updated_df
                 
             except Exception as e:
-                # 回滚事务
-                conn.rollback()
                 st.error(f"库存更新失败：{e}")
                 log_action(current_user, "UPDATE", "inventory", None, f"更新失败：{str(e)}")
-            finally:
-                cursor.close()
     
     # 显示库存可视化
     with st.expander("库存可视化", expanded=False):
         visualize_inventory(df_inventory)
     
+    # 历史库存：从最近的快照加上之后的流水计算
+    # 表单提交前不做任何查询（折叠的 expander 内容在每次重跑时同样会执行）
+    with st.expander("历史库存查询", expanded=False):
+        with st.form("stock_as_of_form"):
+            col1, col2 = st.columns(2)
+            item_id = col1.number_input("物品ID", min_value=1, step=1)
+            as_of = col2.date_input("日期", value=datetime.now().date())
+            submitted = st.form_submit_button("查询")
+        if submitted:
+            item_id = int(item_id)
+            try:
+                stock = get_stock_as_of(item_id, as_of)
+                st.metric(f"{as_of} 结束时库存", "—" if stock is None else stock)
+            except Exception as e:
+                st.error(f"查询历史库存失败：{e}")
+            movements = get_stock_movements(item_id, end=as_of, limit=200)
+            if movements.empty:
+                st.write("暂无库存变动记录")
+            else:
+                st.dataframe(movements, hide_index=True, use_container_width=True)
+    
     # 显示批量操作选项
     with st.expander("批量操作", expanded=False):
         selected_rows = grid_response['selected_rows']
@@ -230,33 +283,26 @@ def inventory_management_page():
             batch_adjustment = st.number_input("批量调整库存数量", value=0)
             if st.button("应用批量调整"):
                 try:
-                    conn = DatabaseManager.get_connection()
-                    cursor = conn.cursor()
-                    cursor.execute("BEGIN TRANSACTION")
-                    
-                    updated_count = 0
-                    for _, row in df_selected.iterrows():
-                        new_stock = row["current_stock"] + batch_adjustment
-                        if new_stock >= 0:  # 确保库存不为负
-                            cursor.execute(
-                                "UPDATE inventory SET current_stock = ?, last_updated = ? WHERE inventory_id = ?",
-                                (
-                                    new_stock,
-                                    datetime.now().isoformat(),
-                                    row["inventory_id"]
-                                )
-                            )
-                            updated_count += 1
-                    
-                    conn.commit()
-                    log_action(current_user, "UPDATE", "inventory", None, f"批量调整了{updated_count}条记录，每条{batch_adjustment}")
-                    st.success("批量调整已完成")
-                    # 刷新页面
-                    st.rerun()
+                    # 一个事务内批量应用库存变动，调整后为负的物品被跳过
+                    result = move_stock(
+                        [(row["item_id"], batch_adjustment) for _, row in df_selected.iterrows()],
+                        "批量调整", current_user, ref_type="adjust", atomic=False
+                    )
+                    updated_count, rejected = result["applied"], result["rejected"]
+                    if rejected and not updated_count:
+                        # 数据库错误（整批回滚）或全部变动被拒绝
+                        st.error(f"批量调整失败：{rejected[0]['reason']}")
+                        log_action(current_user, "UPDATE", "inventory", None, f"批量调整失败：{rejected[0]['reason']}")
+                    else:
+                        log_action(current_user, "UPDATE", "inventory", None, f"批量调整了{updated_count}条记录，每条{batch_adjustment}")
+                        if rejected:
+                            # 保留提示，不刷新页面
+                            st.success(f"已调整 {updated_count} 条记录")
+                            st.warning(f"{len(rejected)} 个物品未调整：{rejected[0]['reason']} 等")
+                        else:
+                            st.success("批量调整已完成")
+                            # 刷新页面
+                            st.rerun()
                 except Exception as e:
-                    conn.rollback()
                     st.error(f"批量调整失败：{e}")
                     log_action(current_user, "UPDATE", "inventory", None, f"批量调整失败：{str(e)}")
-                finally:
-
-                    cursor.close()
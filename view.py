@@ -1,77 +1,167 @@
 import plotly.express as px
-from st_pages import Page, add_page_title
 import streamlit as st
 from rights import check_permission
-from dataset import DatabaseManager
+from dataset import DatabaseManager, get_table_versions
+import json
+import numpy as np
 import pandas as pd
-from datetime import datetime
-from Inventory import predict_inventory
+from datetime import datetime, timedelta
+from scheduler import schedule_pending_orders, reschedule_machine_down, reschedule_order
+
+# 甘特图细节层级参数：窗口内计划条数超过阈值时改为按设备聚合的占用率色带
+GANTT_DETAIL_LIMIT = 1500
+GANTT_BANDS = 120
+GANTT_MAX_COLORS = 20
 
 # 加载生产计划数据
-def loadProductionPlan():
+def loadProductionPlan(start=None, end=None, machine_ids=None):
+    """
+    加载与时间窗口 [start, end) 重叠的生产计划
+
+    同一设备上的计划互不重叠，每台设备只需从窗口起点前最后一个计划开始沿
+    (machine_id, start_time) 索引扫描到窗口终点，代价与窗口内条数成正比。
+
+    Args:
+        start: 窗口起点（datetime），为 None 时加载全部计划
+        end: 窗口终点（datetime）
+        machine_ids: 设备ID列表，为 None 时包含全部设备
+
+    Returns:
+        包含 order_id, machine_id, start_time, end_time 的 DataFrame
+    """
     conn = DatabaseManager.get_connection()
-    df = pd.read_sql(
-    "SELECT order_id, machine_id, start_time, end_time FROM production_plan",
-    conn
-    )
-    return df
-# 甘特图生成
-def show_gantt():
-    df = loadProductionPlan()
-    # 转换为Plotly甘特图所需格式
-    df_gantt = df.copy()
-    df_gantt["Task"] = df_gantt["order_id"].astype(str)
-    df_gantt["Resource"] = df_gantt["machine_id"].astype(str)
-    # 创建甘特图
-    fig = px.timeline(
-    df_gantt,
-    x_start="start_time",
-    x_end="end_time",
-    y="Resource",
-    color="Task",
-    hover_name="Task"
+    if start is None or end is None:
+        return pd.read_sql(
+            "SELECT order_id, machine_id, start_time, end_time FROM production_plan",
+            conn
+        )
+    params = {"ws": start.isoformat(), "we": end.isoformat()}
+    machine_filter = ""
+    if machine_ids is not None:
+        machine_filter = "AND m.id IN (SELECT value FROM json_each(:ids))"
+        params["ids"] = json.dumps([int(m) for m in machine_ids])
+    return pd.read_sql(
+        f'''SELECT p.order_id, p.machine_id, p.start_time, p.end_time
+            FROM machines m
+            JOIN production_plan p ON p.machine_id = m.id
+             AND p.start_time >= COALESCE(
+                 (SELECT MAX(q.start_time) FROM production_plan q
+                   WHERE q.machine_id = m.id AND q.start_time <= :ws), '')
+             AND p.start_time < :we
+            WHERE p.end_time > :ws {machine_filter}
+            ORDER BY p.machine_id, p.start_time''',
+        conn, params=params
     )
+
+def occupancy_bands(df, start, end, bands=GANTT_BANDS):
+    """
+    把窗口等分为若干时间段，计算每台设备在各段内的占用率（%）
+
+    每台设备的占用时间对时间的累计函数用前缀和加 searchsorted 求值，
+    一次向量化计算得到所有分段边界上的累计占用，相邻相减即为各段占用时长。
+
+    Returns:
+        (设备ID列表, 分段起点, 占用率矩阵[设备 x 分段])
+    """
+    w0 = np.datetime64(start, "s").astype(np.int64)
+    w1 = np.datetime64(end, "s").astype(np.int64)
+    edges = np.linspace(w0, w1, bands + 1)
+    starts = pd.to_datetime(df["start_time"], format="mixed").to_numpy("datetime64[s]").astype(np.int64)
+    ends = pd.to_datetime(df["end_time"], format="mixed").to_numpy("datetime64[s]").astype(np.int64)
+    starts = np.clip(starts, w0, w1).astype(float)
+    ends = np.clip(ends, w0, w1).astype(float)
+    machine_ids = df["machine_id"].to_numpy()
+    machines = np.unique(machine_ids)
+    matrix = np.zeros((len(machines), bands))
+    for row, machine_id in enumerate(machines):
+        mask = machine_ids == machine_id
+        s = starts[mask]
+        order = np.argsort(s, kind="stable")
+        s = s[order]
+        length = (ends[mask][order] - s).clip(min=0)
+        cum = np.concatenate(([0.0], np.cumsum(length)))
+        idx = np.searchsorted(s, edges, side="right") - 1
+        safe = idx.clip(min=0)
+        busy = np.where(idx >= 0, cum[safe] + np.clip(edges - s[safe], 0, length[safe]), 0.0)
+        matrix[row] = np.diff(busy) / np.diff(edges) * 100
+    band_starts = pd.to_datetime(edges[:-1].astype(np.int64), unit="s")
+    return machines, band_starts, matrix.clip(0, 100)
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def build_gantt(start, end, machine_ids, plan_version):
+    """按 (窗口, 计划版本) 缓存甘特图；计划未变化时拖动或刷新页面直接复用已生成的图表"""
+    df = loadProductionPlan(start, end, list(machine_ids) if machine_ids is not None else None)
+    if df.empty:
+        return None, df, "empty"
+    if len(df) > GANTT_DETAIL_LIMIT:
+        # 计划过密时逐条绘制既看不清也拖垮浏览器，改为设备 x 时间段的占用率热力图
+        machines, band_starts, matrix = occupancy_bands(df, start, end)
+        fig = px.imshow(
+            matrix,
+            x=band_starts,
+            y=[str(m) for m in machines],
+            zmin=0,
+            zmax=100,
+            aspect="auto",
+            color_continuous_scale="Blues",
+            labels={"x": "时间", "y": "设备", "color": "占用率(%)"}
+        )
+        mode = "bands"
+    else:
+        df_gantt = df.copy()
+        df_gantt["Task"] = df_gantt["order_id"].astype(str)
+        df_gantt["Resource"] = df_gantt["machine_id"].astype(str)
+        # 颜色数量封顶：订单较多时按订单ID取模分组着色并隐藏图例，订单号在悬停提示中查看
+        if df_gantt["order_id"].nunique() > GANTT_MAX_COLORS:
+            df_gantt["Color"] = (df_gantt["order_id"] % GANTT_MAX_COLORS).astype(str)
+            show_legend = False
+        else:
+            df_gantt["Color"] = df_gantt["Task"]
+            show_legend = True
+        fig = px.timeline(
+            df_gantt,
+            x_start="start_time",
+            x_end="end_time",
+            y="Resource",
+            color="Color",
+            hover_name="Task",
+            color_discrete_sequence=px.colors.qualitative.Alphabet[:GANTT_MAX_COLORS]
+        )
+        fig.update_layout(showlegend=show_legend)
+        fig.update_xaxes(range=[start, end])
+        mode = "detail"
     # 翻转y轴，使设备显示顺序合理
     fig.update_yaxes(autorange="reversed")
     # 设置图表标题和布局
     fig.update_layout(
-    title="生产计划甘特图",
-    xaxis_title="时间",
-    yaxis_title="设备",
-    height=600
+        title="生产计划甘特图",
+        xaxis_title="时间",
+        yaxis_title="设备",
+        height=600
     )
+    return fig, df, mode
+
+# 甘特图生成
+def show_gantt(start, end, machine_ids=None):
+    """显示窗口内的甘特图，返回窗口内的计划数据"""
+    machine_key = tuple(sorted(int(m) for m in machine_ids)) if machine_ids is not None else None
+    fig, df, mode = build_gantt(start, end, machine_key, get_table_versions("production_plan", "machines"))
+    if fig is None:
+        st.info("所选时间窗口内没有生产计划")
+        return df
+    if mode == "bands":
+        st.caption(f"窗口内共 {len(df)} 条计划，超过 {GANTT_DETAIL_LIMIT} 条，已按设备聚合为占用率色带；缩小时间窗口或设备范围可查看明细")
     # 显示图表
     st.plotly_chart(fig)
+    return df
 # 生产计划优化算法
-def optimizeProductionPlan(num_orders_to_process=5):
-    conn = DatabaseManager.get_connection()
-    cursor = conn.cursor()
-    # 获取待处理订单
-    cursor.execute("SELECT * FROM orders WHERE status = '待处理'")
-    orders = cursor.fetchall()
-    # 获取可用设备
-    cursor.execute("SELECT * FROM machines WHERE status = '可用'")
-    machines = cursor.fetchall()
-    # 计算订单优先级并排序
-    for order in orders:
-        # 计算优先级（示例代码，具体逻辑根据需求调整）
-        days_remaining = (order["due_date"] - datetime.now()).days
-        processing_days = order["processing_time"]
-        critical_ratio = days_remaining / processing_days if processing_days != 0 else 0
-        priority = 0.4 * (1 / (critical_ratio + 1)) + \
-                  0.3 * (1 / (processing_days + 1)) + \
-                  0.3 * (1 / (days_remaining + 1))
-        # 更新订单优先级
-        cursor.execute(
-            "UPDATE orders SET priority = ? WHERE id = ?",
-            (priority, order["id"])
-        )
-    # 按优先级排序订单
-    cursor.execute("""UPDATE orders SET status = '生产中' 
-    WHERE id IN (SELECT id FROM (SELECT * FROM orders
-    WHERE status = '待处理' ORDER BY priority LIMIT
-    ?))""", (num_orders_to_process,))
-    conn.commit()
+def optimizeProductionPlan(num_orders_to_process=None):
+    """按优先级为待处理订单排产并写入生产计划，返回完工时间跨度和拖期等指标"""
+    try:
+        return schedule_pending_orders(DatabaseManager.write_transaction, limit=num_orders_to_process)
+    except Exception as e:
+        st.error(f"排产失败：{e}")
+        return None
 
 def production_plan_page():
     # 权限检查
@@ -79,17 +169,63 @@ def production_plan_page():
     # 侧边栏控件
     with st.sidebar:
         st.title("生产计划控制台")
-        num_orders = st.slider("每次排产订单数", 1, 10, 5)
+        schedule_all = st.checkbox("排产全部待处理订单", value=True)
+        num_orders = st.slider("每次排产订单数", 1, 10, 5, disabled=schedule_all)
         if st.button("重新排产"):
-            optimizeProductionPlan(num_orders)
+            stats = optimizeProductionPlan(None if schedule_all else num_orders)
+            if stats is not None:
+                st.session_state.last_schedule_stats = stats
             st.rerun()
+        # 设备停机或订单变更时只做增量重排
+        st.subheader("增量重排")
+        machines = pd.read_sql("SELECT id, machine_name, status FROM machines ORDER BY id", DatabaseManager.get_connection())
+        if not machines.empty:
+            machine_labels = {f"{row.machine_name}（{row.status}）": row.id for row in machines.itertuples()}
+            machine_label = st.selectbox("设备", list(machine_labels.keys()))
+            new_status = st.selectbox("设置状态", ["维修中", "停用"])
+            if st.button("设备停机并重排"):
+                try:
+                    stats = reschedule_machine_down(DatabaseManager.write_transaction, int(machine_labels[machine_label]), new_status)
+                    st.success(f"已迁移 {stats['moved']} 个计划到其他设备")
+                except Exception as e:
+                    st.error(f"重排失败：{e}")
+        changed_order_id = st.number_input("变更的订单ID", min_value=1, step=1)
+        if st.button("订单变更重排"):
+            try:
+                stats = reschedule_order(DatabaseManager.write_transaction, int(changed_order_id))
+                st.success(f"已顺延 {stats['shifted']} 个冲突计划")
+            except Exception as e:
+                st.error(f"重排失败：{e}")
+        # 甘特图只查询并绘制所选时间窗口和设备范围内的计划
+        st.subheader("甘特图窗口")
+        today = datetime.now().date()
+        window_from = st.date_input("开始日期", today)
+        window_to = st.date_input("结束日期", today + timedelta(days=7))
+        if window_to < window_from:
+            st.error("结束日期不能早于开始日期")
+            window_to = window_from
+        machine_options = {f"{row.machine_name}（{row.id}）": row.id for row in machines.itertuples()}
+        selected_machines = st.multiselect("设备范围（留空为全部）", list(machine_options.keys()))
+    # 显示最近一次排产结果
+    stats = st.session_state.get("last_schedule_stats")
+    if stats:
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("排产订单数", stats["orders"])
+        col2.metric("使用设备数", stats["machines"])
+        col3.metric("完工时间跨度(小时)", f"{stats['makespan_hours']:.1f}")
+        col4.metric("总拖期(小时)", f"{stats['total_tardiness_hours']:.1f}", f"{stats['late_orders']} 个订单拖期", delta_color="inverse")
     # 显示甘特图
-    show_gantt()
-    # 生产计划表展示
-    df_plan = loadProductionPlan()
+    window_start = datetime.combine(window_from, datetime.min.time())
+    window_end = datetime.combine(window_to, datetime.min.time()) + timedelta(days=1)
+    df_plan = show_gantt(window_start, window_end, [machine_options[m] for m in selected_machines] or None)
+    # 生产计划表展示（仅窗口内的计划）
     # 将字符串转换为datetime对象
-    df_plan['start_time'] = pd.to_datetime(df_plan['start_time'])
-    df_plan['end_time'] = pd.to_datetime(df_plan['end_time'])
-    st.dataframe(df_plan.style.format({"start_time": "{:%Y-%m-%d %H:%M}", "end_time": "{:%Y-%m-%d %H:%M}"}))
+    df_plan = df_plan.copy()
+    df_plan['start_time'] = pd.to_datetime(df_plan['start_time'], format="mixed")
+    df_plan['end_time'] = pd.to_datetime(df_plan['end_time'], format="mixed")
+    st.dataframe(df_plan, column_config={
+        "start_time": st.column_config.DatetimeColumn(format="YYYY-MM-DD HH:mm"),
+        "end_time": st.column_config.DatetimeColumn(format="YYYY-MM-DD HH:mm")
+    })
 
 